@@ -0,0 +1,184 @@
+"""
+Bulk provisioning of users (student cohorts) from a CSV file.
+
+Usage:
+    python manage.py import_users <cohort.csv> [--batch-size 500] [--workers 4]
+        [--dry-run] [--report import_users_errors.csv]
+
+CSV columns:
+    username, email (required)
+    password: clear text password, hashed with the configured hasher (empty: unusable password)
+    first_name, last_name, school, bio, linkedin, github (optional)
+    follows: comma-separated usernames this user follows (in the file or already registered)
+    favorite_topics, favorite_tags: comma-separated names of existing topics/tags
+"""
+
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from authentification.models import unique_slug
+from base.models import Tag, Topic
+from base import fuzzy, searchcache, timeline
+from base.services import split_names
+
+
+PROFILE_FIELDS = ['first_name', 'last_name', 'school', 'bio', 'linkedin', 'github']
+
+
+def init_worker():
+    """Make the settings (PASSWORD_HASHERS) usable in worker processes started with the spawn method."""
+    django.setup()
+
+
+def hash_password(password):
+    """Hash one password (runs in the process pool, PBKDF2 is CPU bound)."""
+    return make_password(password or None)
+
+
+class Command(BaseCommand):
+    help = "Bulk create users from a CSV cohort file, with their follows and favorites"
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help="Cohort CSV file")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Processes used to hash the passwords")
+        parser.add_argument('--dry-run', action='store_true', help="Validate everything, write nothing")
+        parser.add_argument('--report', default='import_users_errors.csv', help="CSV report of rejected rows")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        self.dry_run = options['dry_run']
+
+        # Everything needed to validate rows and compute slugs in memory, fetched once
+        self.taken_slugs = set(User.objects.exclude(slug=None).values_list('slug', flat=True))
+        self.taken_usernames = set(User.objects.values_list('username', flat=True))
+        self.taken_emails = set(User.objects.values_list('email', flat=True))
+
+        relations = [] # (username, follows, favorite_topics, favorite_tags) applied once all users exist
+        created = rejected = 0
+
+        with open(options['csv_file'], newline='', encoding='utf-8') as f, \
+                open(options['report'], 'w', newline='', encoding='utf-8') as report_file, \
+                ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as pool:
+            self.report = csv.writer(report_file)
+            self.report.writerow(['row', 'username', 'error'])
+
+            rows = enumerate(csv.DictReader(f), start=1)
+            while True:
+                batch = list(itertools.islice(rows, options['batch_size']))
+                if not batch:
+                    break
+
+                valid = [(line, row) for line, row in batch if self.validate(line, row)]
+                rejected += len(batch) - len(valid)
+                if not valid:
+                    continue
+
+                passwords = pool.map(hash_password, [row.get('password') for _, row in valid],
+                                     chunksize=max(1, len(valid) // (options['workers'] * 4)))
+                users = []
+                for (_, row), password in zip(valid, passwords):
+                    username = row['username'].strip()
+                    slug = unique_slug(username, self.taken_slugs)
+                    self.taken_slugs.add(slug)
+                    users.append(User(
+                        username=username,
+                        email=row['email'].strip(),
+                        password=password,
+                        slug=slug,
+                        **{field: row[field].strip() for field in PROFILE_FIELDS if (row.get(field) or '').strip()},
+                    ))
+                    relations.append((
+                        username,
+                        split_names(row.get('follows')),
+                        split_names(row.get('favorite_topics')),
+                        split_names(row.get('favorite_tags')),
+                    ))
+
+                if not self.dry_run:
+                    User.objects.bulk_create(users)
+                created += len(users)
+                self.stdout.write(f"row {batch[-1][0]}: {created} users, {rejected} rejected")
+
+            if not self.dry_run:
+                self.create_relations(relations)
+
+        verb = "would be created" if self.dry_run else "created"
+        self.stdout.write(self.style.SUCCESS(f"{created} users {verb}, {rejected} rejected (see {options['report']})"))
+
+    def validate(self, line, row):
+        """Check one row against the data already in the database and the previous rows."""
+        username = (row.get('username') or '').strip()
+        email = (row.get('email') or '').strip()
+
+        if not username or not email:
+            error = "username and email are required"
+        elif username in self.taken_usernames:
+            error = "username already taken"
+        elif email in self.taken_emails:
+            error = "email already used"
+        else:
+            self.taken_usernames.add(username)
+            self.taken_emails.add(email)
+            return True
+
+        self.report.writerow([line, username, error])
+        return False
+
+    @transaction.atomic
+    def create_relations(self, relations):
+        """Bulk insert follows and favorites, resolving all the names with one IN lookup each."""
+        User = get_user_model()
+
+        usernames = {username for username, *_ in relations}
+        usernames.update(itertools.chain.from_iterable(follows for _, follows, *_ in relations))
+        user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        topic_ids = dict(Topic.objects.filter(
+            name__in=set(itertools.chain.from_iterable(topics for *_, topics, _ in relations))
+        ).values_list('name', 'id'))
+        tag_ids = dict(Tag.objects.filter(
+            name__in=set(itertools.chain.from_iterable(tags for *_, tags in relations))
+        ).values_list('name', 'id'))
+
+        Following = User.following.through
+        FavoriteTopics = User.favorite_topics.through
+        FavoriteTags = User.favorite_tags.through
+
+        following, favorite_topics, favorite_tags = [], [], []
+        for username, follows, topics, tags in relations:
+            user_id = user_ids[username]
+            following += [Following(from_user_id=user_id, to_user_id=user_ids[name])
+                          for name in follows if name in user_ids and name != username]
+            favorite_topics += [FavoriteTopics(user_id=user_id, topic_id=topic_ids[name])
+                                for name in topics if name in topic_ids]
+            favorite_tags += [FavoriteTags(user_id=user_id, tag_id=tag_ids[name])
+                              for name in tags if name in tag_ids]
+
+            unknown = [name for name in follows if name not in user_ids] + \
+                      [name for name in topics if name not in topic_ids] + \
+                      [name for name in tags if name not in tag_ids]
+            if unknown:
+                self.report.writerow(['', username, f"warning, unknown follows/favorites skipped: {', '.join(unknown)}"])
+
+        Following.objects.bulk_create(following, ignore_conflicts=True)
+        FavoriteTopics.objects.bulk_create(favorite_topics, ignore_conflicts=True)
+        FavoriteTags.objects.bulk_create(favorite_tags, ignore_conflicts=True)
+
+        # bulk_create() bypasses the follow/favorite views: fill the "For you" timelines here
+        timeline.backfill(
+            follows=[(relation.from_user_id, relation.to_user_id) for relation in following],
+            favorites=[(relation.user_id, relation.topic_id) for relation in favorite_topics],
+        )
+
+        # Users were bulk created without signals: index them for search here
+        fuzzy.index('user', [(user_ids[username], username) for username, *_ in relations])
+        searchcache.bump('authentification.user')
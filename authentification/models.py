@@ -6,6 +6,23 @@ from django.utils.text import slugify
 from base.models import Tag, Topic
 
 
+def unique_slug(username, taken):
+    """
+    Return the first free slug for username ("john", "john-1", "john-2", ...).
+
+    Args:
+        username (str): the username to slugify
+        taken (set): slugs already in use, checked in memory
+    """
+    base_slug = slugify(username)
+    slug = base_slug
+    n = 1
+    while slug in taken:
+        slug = f"{base_slug}-{n}"
+        n += 1
+    return slug
+
+
 
 class User(AbstractUser):
     photo = models.ImageField(upload_to='profils/', default='profils/avatar.svg')
@@ -54,14 +71,12 @@ class User(AbstractUser):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            base_slug = slugify(self.username)
-            slug = base_slug
-            # Ensure slug is unique
-            n = 1
-            while User.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{n}"
-                n += 1
-            self.slug = slug
+            # Ensure slug is unique, fetching the candidates once instead of one exists() per collision
+            taken = set(
+                User.objects.filter(slug__startswith=slugify(self.username))
+                .values_list('slug', flat=True)
+            )
+            self.slug = unique_slug(self.username, taken)
         super().save(*args, **kwargs)
 
     # Following / Followers helper functions
@@ -11,3 +11,5 @@ admin.site.register(Notification)
 admin.site.register(Discussion)
 admin.site.register(SearchHistory)
 admin.site.register(SearchSuggestion)
+admin.site.register(SearchLog)
+admin.site.register(SearchRollup)
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class BaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'base'
+
+    def ready(self):
+        from .db import configure_connection
+        connection_created.connect(configure_connection, dispatch_uid='base.configure_connection')
+
+        from . import signals
+        signals.connect()
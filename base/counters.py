@@ -0,0 +1,157 @@
+# counters.py
+
+# Publication view/download counters and trending score.
+#
+# Incrementing a row on every page view would serialize SQLite writers, so increments are
+# buffered in memory (per worker) and flushed in one transaction every COUNTER_FLUSH_INTERVAL
+# seconds or COUNTER_FLUSH_SIZE publications, whichever comes first.
+#
+# Trending score: each event adds weight * 2 ** ((t - epoch) / half_life). Dividing by
+# 2 ** ((now - epoch) / half_life) gives the usual exponentially decayed score, and as that
+# factor is the same for every publication, ordering by the stored value orders by the decayed
+# score. The score is therefore maintained with plain additions, never recomputed.
+# The stored values grow with time (they would overflow about 19 years after a fixed epoch):
+# once the epoch (TrendingEpoch) is REBASE_AFTER half-lives old, a flush moves it to now and
+# scales all the scores down in the same transaction, which keeps the order.
+
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .db import retry_on_lock
+from .routers import bookkeeping
+
+logger = logging.getLogger(__name__)
+
+# Epoch of the scores stored before it was kept in TrendingEpoch
+TRENDING_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+REBASE_AFTER = 8  # half-lives
+WEIGHTS = {'view': 1.0, 'download': 3.0}
+
+
+def half_life():
+    return getattr(settings, 'TRENDING_HALF_LIFE', 7 * 86400)
+
+
+def trending_increment(kind, now=None, epoch=None):
+    """Score added by one event happening now, relative to epoch (a timestamp, default: now)."""
+    now = now or time.time()
+    return WEIGHTS[kind] * 2 ** ((now - (epoch or now)) / half_life())
+
+
+def trending_epoch():
+    """
+    Current epoch of the stored scores (a timestamp), rebased first when it is too old.
+    Call it in the transaction that adds to the scores.
+    """
+    from .models import Publication, TrendingEpoch
+
+    row, _ = TrendingEpoch.objects.get_or_create(pk=1, defaults={'started': TRENDING_EPOCH})
+    epoch, now = row.started.timestamp(), time.time()
+    if now - epoch > REBASE_AFTER * half_life():
+        Publication.objects.filter(trending_score__gt=0).update(
+            trending_score=F('trending_score') * 2 ** ((epoch - now) / half_life())
+        )
+        row.started = datetime.fromtimestamp(now, timezone.utc)
+        row.save(update_fields=['started'])
+        epoch = now
+    return epoch
+
+
+class CounterBuffer:
+    """
+    In-memory buffer of increments: {publication_id: [views, downloads, trending increment]}
+    Trending increments are relative to the time of the last flush (reference), they are
+    scaled to the stored epoch when written.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.reference = time.time()
+        self.last_flush = time.monotonic()
+        self.flushed_events = 0
+
+    def record(self, publication_id, kind):
+        """
+        Count one 'view' or 'download' of a publication, flushing the buffer if it is due.
+        """
+        with self.lock:
+            increment = trending_increment(kind, epoch=self.reference)
+            counts = self.pending.setdefault(int(publication_id), [0, 0, 0.0])
+            counts[0 if kind == 'view' else 1] += 1
+            counts[2] += increment
+            due = (
+                len(self.pending) >= getattr(settings, 'COUNTER_FLUSH_SIZE', 500)
+                or time.monotonic() - self.last_flush >= getattr(settings, 'COUNTER_FLUSH_INTERVAL', 10)
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write the pending increments, one UPDATE per publication, in a single transaction."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            reference, self.reference = self.reference, time.time()
+            self.last_flush = time.monotonic()
+        if not pending:
+            return
+
+        try:
+            self.write(pending, reference)
+        except Exception:
+            # Put the increments back, they will go with the next flush
+            logger.exception("Could not flush publication counters")
+            with self.lock:
+                rescale = 2 ** ((reference - self.reference) / half_life())
+                for publication_id, (views, downloads, score) in pending.items():
+                    counts = self.pending.setdefault(publication_id, [0, 0, 0.0])
+                    counts[0] += views
+                    counts[1] += downloads
+                    counts[2] += score * rescale
+            return
+
+        with self.lock:
+            self.flushed_events += sum(views + downloads for views, downloads, _ in pending.values())
+
+    @bookkeeping()
+    @retry_on_lock
+    @transaction.atomic
+    def write(self, pending, reference):
+        from .models import Publication
+
+        scale = 2 ** ((reference - trending_epoch()) / half_life())
+
+        for publication_id, (views, downloads, score) in pending.items():
+            Publication.objects.filter(pk=publication_id).update(
+                view_count=F('view_count') + views,
+                download_count=F('download_count') + downloads,
+                trending_score=F('trending_score') + score * scale,
+            )
+
+    def stats(self):
+        """Counters for monitoring (this worker only)."""
+        with self.lock:
+            return {
+                'pending_publications': len(self.pending),
+                'pending_events': sum(views + downloads for views, downloads, _ in self.pending.values()),
+                'flushed_events': self.flushed_events,
+            }
+
+
+buffer = CounterBuffer()
+atexit.register(buffer.flush)
+
+
+def record_view(publication):
+    buffer.record(publication.pk, 'view')
+
+
+def record_download(publication):
+    buffer.record(publication.pk, 'download')
@@ -0,0 +1,66 @@
+# db.py
+
+# SQLite connection tuning and lock contention handling.
+#
+# - configure_connection() runs on every new database connection (connected to the
+#   connection_created signal in BaseConfig.ready) and applies settings.SQLITE_PRAGMAS:
+#   WAL journal so readers don't block behind writers, synchronous=NORMAL, busy_timeout
+#   so writers wait for the lock instead of failing right away, mmap and page cache sizes.
+# - retry_on_lock() retries a write with exponential backoff and jitter when SQLite still
+#   reports "database is locked" after busy_timeout.
+
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+logger = logging.getLogger(__name__)
+
+
+def configure_connection(sender, connection, **kwargs):
+    """connection_created receiver: apply SQLITE_PRAGMAS to new SQLite connections."""
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+
+
+def is_lock_error(error):
+    message = str(error).lower()
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def retry_on_lock(func=None, attempts=None, base_delay=None):
+    """
+    Decorator retrying a write when SQLite reports lock contention.
+
+    The decorated function should do its writes in one transaction (or a single statement),
+    so that a retry replays the whole unit of work. Inside an outer atomic block nothing is
+    retried: the error goes up to whoever owns the transaction.
+
+    Args:
+        attempts (int, optional): total tries (default settings.SQLITE_LOCK_RETRIES)
+        base_delay (float, optional): first backoff in seconds, doubled at each try, with full jitter
+    """
+    if func is None:
+        return functools.partial(retry_on_lock, attempts=attempts, base_delay=base_delay)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        tries = attempts or getattr(settings, 'SQLITE_LOCK_RETRIES', 4)
+        delay = base_delay or getattr(settings, 'SQLITE_LOCK_RETRY_DELAY', 0.05)
+        for attempt in range(1, tries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if not is_lock_error(e) or attempt == tries or connection.in_atomic_block:
+                    raise
+                wait = random.uniform(0, delay * 2 ** (attempt - 1))
+                logger.warning(f"{func.__qualname__}: database locked, retry {attempt}/{tries - 1} in {wait:.3f}s")
+                time.sleep(wait)
+    return wrapper
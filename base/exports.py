@@ -0,0 +1,372 @@
+# exports.py
+
+# Streaming exports.
+#
+# Collection ZIP archive: PDFs are already compressed, so entries are STORED and the archive
+# layout (offsets, total size) only depends on the names and sizes of the files. It is known
+# before reading anything, which allows a Content-Length and Range requests to resume an
+# interrupted download. CRCs are only known after reading a file: entries use data descriptors
+# (general purpose flag bit 3), written after the data, so the bytes can be produced while
+# streaming the file in chunks. The output is deterministic: same collection, same bytes.
+
+import csv
+import hashlib
+import json
+import os
+import re
+import struct
+import zlib
+
+from django.core.cache import cache
+from django.utils.text import slugify
+
+CHUNK_SIZE = 64 * 1024
+CRC_CACHE_TIMEOUT = 24 * 3600
+
+# ZIP format constants (APPNOTE.TXT)
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+DATA_DESCRIPTOR = struct.Struct('<IIII')
+END_OF_CENTRAL_DIRECTORY = struct.Struct('<IHHHHIIH')
+FLAGS = 0x0808  # bit 3: data descriptor, bit 11: UTF-8 names
+VERSION = 20
+ZIP_MAX_SIZE = 0xFFFFFFFF  # no ZIP64
+ZIP_MAX_ENTRIES = 0xFFFF
+
+
+class ZipMember:
+    """
+    One STORED entry of a StreamingZip, backed by a file on disk or by bytes.
+    """
+
+    def __init__(self, name, modified, path=None, data=None):
+        self.name = name
+        self.encoded_name = name.encode('utf-8')
+        self.path = path
+        self.data = data
+        if data is not None:
+            self.size = len(data)
+            self.fingerprint = None
+        else:
+            stat = os.stat(path)
+            self.size = stat.st_size
+            # Identifies the content of the file for the CRC cache
+            self.fingerprint = f"zipcrc:{path}:{stat.st_size}:{stat.st_mtime_ns}"
+        self._crc = zlib.crc32(data) if data is not None else None
+
+        # MS-DOS date and time
+        self.dos_time = (modified.hour << 11) | (modified.minute << 5) | (modified.second // 2)
+        self.dos_date = (max(modified.year - 1980, 0) << 9) | (modified.month << 5) | modified.day
+
+    def crc(self):
+        """CRC-32 of the content, from the cache or by reading the file."""
+        if self._crc is None:
+            self._crc = cache.get(self.fingerprint)
+        if self._crc is None:
+            crc = 0
+            for chunk in self.chunks(0, self.size):
+                crc = zlib.crc32(chunk, crc)
+            self.set_crc(crc)
+        return self._crc
+
+    def set_crc(self, crc):
+        self._crc = crc
+        if self.fingerprint:
+            cache.set(self.fingerprint, crc, CRC_CACHE_TIMEOUT)
+
+    def chunks(self, start, end):
+        """Content from byte start to byte end (excluded), in chunks of CHUNK_SIZE."""
+        if self.data is not None:
+            for offset in range(start, end, CHUNK_SIZE):
+                yield self.data[offset:min(offset + CHUNK_SIZE, end)]
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise IOError(f"{self.path} is shorter than expected")
+                remaining -= len(chunk)
+                yield chunk
+
+    def local_header(self):
+        # CRC and sizes are in the data descriptor (flag bit 3)
+        return LOCAL_HEADER.pack(0x04034b50, VERSION, FLAGS, 0, self.dos_time, self.dos_date,
+                                 0, 0, 0, len(self.encoded_name), 0) + self.encoded_name
+
+    def local_header_size(self):
+        return LOCAL_HEADER.size + len(self.encoded_name)
+
+    def data_descriptor(self):
+        return DATA_DESCRIPTOR.pack(0x08074b50, self.crc(), self.size, self.size)
+
+    def central_header(self, offset):
+        return CENTRAL_HEADER.pack(0x02014b50, VERSION, VERSION, FLAGS, 0, self.dos_time, self.dos_date,
+                                   self.crc(), self.size, self.size, len(self.encoded_name),
+                                   0, 0, 0, 0, 0, offset) + self.encoded_name
+
+    def central_header_size(self):
+        return CENTRAL_HEADER.size + len(self.encoded_name)
+
+
+class StreamingZip:
+    """
+    ZIP archive of STORED members, produced as a generator with constant memory.
+
+    The archive is a sequence of segments (local header, data, descriptor for each member, then
+    the central directory), each of a size known in advance, so any byte range can be produced
+    by skipping the segments before it.
+    """
+
+    def __init__(self, members):
+        self.members = list(members)
+        if len(self.members) > ZIP_MAX_ENTRIES:
+            raise ValueError("Too many files for a ZIP archive")
+
+        self.segments = []  # (size, function(start, end) -> generator of bytes)
+        self.offsets = []
+        offset = 0
+        for member in self.members:
+            self.offsets.append(offset)
+            self.add_segment(member.local_header_size(), lambda s, e, m=member: self.static(m.local_header(), s, e))
+            self.add_segment(member.size, lambda s, e, m=member: self.member_data(m, s, e))
+            self.add_segment(DATA_DESCRIPTOR.size, lambda s, e, m=member: self.static(m.data_descriptor(), s, e))
+            offset += member.local_header_size() + member.size + DATA_DESCRIPTOR.size
+
+        self.central_directory_offset = offset
+        self.central_directory_size = sum(member.central_header_size() for member in self.members)
+        self.add_segment(self.central_directory_size + END_OF_CENTRAL_DIRECTORY.size,
+                         lambda s, e: self.static(self.central_directory(), s, e))
+        self.size = sum(size for size, _ in self.segments)
+        if self.size > ZIP_MAX_SIZE:
+            raise ValueError("Archive too large for a ZIP archive without ZIP64")
+
+    def etag(self):
+        """Changes whenever a member is added, removed, renamed or modified."""
+        digest = hashlib.sha1()
+        for member in self.members:
+            digest.update(member.encoded_name)
+            digest.update(str(member.fingerprint or member.crc()).encode())
+        return f'"{digest.hexdigest()}"'
+
+    def add_segment(self, size, producer):
+        self.segments.append((size, producer))
+
+    @staticmethod
+    def static(data, start, end):
+        yield data[start:end]
+
+    @staticmethod
+    def member_data(member, start, end):
+        # The CRC is computed on the way when the whole content goes through
+        crc = 0 if start == 0 and end == member.size else None
+        for chunk in member.chunks(start, end):
+            if crc is not None:
+                crc = zlib.crc32(chunk, crc)
+            yield chunk
+        if crc is not None:
+            member.set_crc(crc)
+
+    def central_directory(self):
+        records = [member.central_header(offset) for member, offset in zip(self.members, self.offsets)]
+        end = END_OF_CENTRAL_DIRECTORY.pack(0x06054b50, 0, 0, len(self.members), len(self.members),
+                                            self.central_directory_size, self.central_directory_offset, 0)
+        return b''.join(records) + end
+
+    def stream(self, start=0, end=None):
+        """
+        Bytes of the archive from start to end (included, as in HTTP ranges).
+        """
+        end = self.size - 1 if end is None else end
+        position = 0
+        for size, producer in self.segments:
+            segment_start, segment_end = position, position + size
+            position = segment_end
+            if segment_end <= start or size == 0:
+                continue
+            if segment_start > end:
+                break
+            yield from producer(max(start - segment_start, 0), min(end + 1, segment_end) - segment_start)
+
+
+def parse_range(header, size):
+    """
+    Parse a single range Range header ("bytes=start-end", "bytes=start-" or "bytes=-suffix").
+
+    Returns:
+        tuple|None|False: (start, end) included, None to serve the whole content
+        (no header, several ranges or invalid syntax), False if the range cannot be satisfied
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if first == '':
+            suffix = int(last)
+            if suffix <= 0:
+                return False
+            return max(size - suffix, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return False
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def collection_archive(collection):
+    """
+    StreamingZip of a collection: its PDFs, in the order they were added, and a manifest.json
+    describing them. PDFs missing from the storage are listed in the manifest and skipped.
+    """
+    from .models import CollectionPublication
+
+    entries = (
+        CollectionPublication.objects.filter(collection=collection)
+        .select_related('publication__topic')
+        .prefetch_related('publication__authors', 'publication__tags')
+        .order_by('added', 'id')
+    )
+
+    members, manifest = [], []
+    for index, entry in enumerate(entries, start=1):
+        pub = entry.publication
+        name = f"{index:03d}-{slugify(pub.theme)[:80] or pub.id}.pdf"
+        info = {
+            'id': pub.id,
+            'file': name,
+            'theme': pub.theme,
+            'topic': pub.topic.name if pub.topic else None,
+            'authors': [author.username for author in pub.authors.all()],
+            'tags': [tag.name for tag in pub.tags.all()],
+            'affiliations': pub.affiliations,
+            'description': pub.description,
+            'created': pub.created.isoformat(),
+            'added': entry.added.isoformat(),
+        }
+        try:
+            members.append(ZipMember(name, pub.created, path=pub.file.path))
+        except (OSError, ValueError):
+            info['file'] = None
+            info['missing'] = True
+        manifest.append(info)
+
+    data = json.dumps({
+        'collection': collection.name,
+        'owner': collection.user.username,
+        'publications': manifest,
+    }, indent=2, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    members.append(ZipMember('manifest.json', collection.last_added or collection.created, data=data))
+    return StreamingZip(members)
+
+
+# Bibliography exports: BibTeX, CSV and JSON Lines, produced row by row from querysets read
+# with .iterator(chunk_size=...). Authors, tags and topic are fetched once per chunk
+# (prefetch_related works per chunk with iterator()), so memory depends on the chunk size,
+# not on the number of publications.
+
+BIBLIOGRAPHY_FORMATS = {
+    # format: (content type, file extension)
+    'bibtex': ('application/x-bibtex; charset=utf-8', 'bib'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+}
+CSV_COLUMNS = ['id', 'title', 'authors', 'topic', 'tags', 'affiliations', 'description', 'year', 'created', 'url']
+BIBTEX_SPECIAL = re.compile(r'([\\{}&%$#_^~])')
+
+
+def bibliography_queryset(publications):
+    """Publications with what the exports need, fetched per chunk."""
+    from django.contrib.auth import get_user_model
+    from django.db.models import Prefetch
+
+    authors = get_user_model().objects.only('id', 'username', 'first_name', 'last_name')
+    return publications.select_related('topic').prefetch_related(Prefetch('authors', queryset=authors), 'tags')
+
+
+def publication_record(pub, base_url):
+    """Plain dict describing a publication, shared by the three formats."""
+    from django.urls import reverse
+
+    return {
+        'id': pub.id,
+        'title': pub.theme,
+        'authors': [author.get_full_name() or author.username for author in pub.authors.all()],
+        'topic': pub.topic.name if pub.topic else None,
+        'tags': [tag.name for tag in pub.tags.all()],
+        'affiliations': pub.get_affiliations_list() if pub.affiliations else [],
+        'description': pub.description,
+        'year': pub.created.year,
+        'created': pub.created.isoformat(),
+        'url': base_url + reverse('base:publication', args=[pub.id]),
+    }
+
+
+def bibtex_escape(value):
+    return BIBTEX_SPECIAL.sub(r'\\\1', str(value))
+
+
+def bibtex_entry(record):
+    fields = [
+        ('title', record['title']),
+        ('author', ' and '.join(record['authors'])),
+        ('year', record['year']),
+        ('institution', ', '.join(record['affiliations'])),
+        ('keywords', ', '.join(record['tags'])),
+        ('note', record['topic']),
+        ('abstract', record['description']),
+        ('howpublished', f"\\url{{{record['url']}}}"),
+    ]
+    lines = [f"@misc{{noxa{record['id']},"]
+    for name, value in fields:
+        if value in (None, '', []):
+            continue
+        value = value if name == 'howpublished' else bibtex_escape(value)
+        lines.append(f"  {name} = {{{value}}},")
+    lines.append("}\n\n")
+    return '\n'.join(lines)
+
+
+class Echo:
+    """File-like object handing back what is written to it, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def bibliography_rows(publications, fmt, base_url, chunk_size=None, limit=None):
+    """
+    Generator of the export, one string per publication (plus the CSV header).
+
+    Args:
+        publications (QuerySet): Publication queryset, in export order
+        fmt (str): one of BIBLIOGRAPHY_FORMATS
+        base_url (str): scheme and host used to build the publication URLs
+        chunk_size (int, optional): rows fetched per query, EXPORT_CHUNK_SIZE by default
+        limit (int, optional): maximum number of publications, EXPORT_MAX_ROWS by default
+    """
+    from django.conf import settings
+
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 500)
+    limit = limit or getattr(settings, 'EXPORT_MAX_ROWS', 50000)
+    rows = bibliography_queryset(publications)[:limit].iterator(chunk_size=chunk_size)
+
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(CSV_COLUMNS)
+        for pub in rows:
+            record = publication_record(pub, base_url)
+            record['authors'] = '; '.join(record['authors'])
+            record['tags'] = '; '.join(record['tags'])
+            record['affiliations'] = '; '.join(record['affiliations'])
+            yield writer.writerow([record[column] for column in CSV_COLUMNS])
+    elif fmt == 'jsonl':
+        for pub in rows:
+            yield json.dumps(publication_record(pub, base_url), ensure_ascii=False) + '\n'
+    else:
+        for pub in rows:
+            yield bibtex_entry(publication_record(pub, base_url))
@@ -0,0 +1,126 @@
+# facets.py
+
+# Faceted filtering of the publications search: topic, tag, author, school and year.
+#
+# The text match runs once per query: the ids it returns (up to SEARCH_FACET_MAX_RESULTS) are
+# turned into a FacetIndex, one set of publication ids per facet value (a "bitmap"), read with
+# three queries. The index is kept in the search cache (see searchcache.py), so drilling down
+# only intersects sets: no text match and no COUNT query. Values of one facet are combined with
+# OR, facets with AND, and the counts of a facet ignore its own selection (disjunctive faceting),
+# so selecting a topic still shows how many results the other topics have.
+
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import Publication
+
+FACETS = [
+    # (name, label)
+    ('topic', 'Topic'),
+    ('tag', 'Tag'),
+    ('author', 'Author'),
+    ('school', 'School'),
+    ('year', 'Year'),
+]
+
+
+def chunks(values, size=500):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class FacetIndex:
+    """
+    Publication ids of a search, in result order, and {facet: {value: set of ids}}.
+    """
+
+    def __init__(self, ids):
+        self.ids = list(ids)
+        self.postings = {name: defaultdict(set) for name, _ in FACETS}
+        self.labels = {name: {} for name, _ in FACETS}
+
+        for batch in chunks(self.ids):
+            for pk, topic_id, topic_name, created in Publication.objects.filter(id__in=batch).values_list(
+                    'id', 'topic_id', 'topic__name', 'created'):
+                if topic_id:
+                    self.add('topic', topic_id, topic_name, pk)
+                self.add('year', created.year, str(created.year), pk)
+
+            for pk, tag_id, tag_name in Publication.tags.through.objects.filter(
+                    publication_id__in=batch).values_list('publication_id', 'tag_id', 'tag__name'):
+                self.add('tag', tag_id, tag_name, pk)
+
+            for pk, user_id, username, school in Publication.authors.through.objects.filter(
+                    publication_id__in=batch).values_list('publication_id', 'user_id', 'user__username', 'user__school'):
+                self.add('author', user_id, username, pk)
+                if school:
+                    self.add('school', school, school, pk)
+
+    def add(self, facet, value, label, pk):
+        # Values come back from the query string as strings
+        value = str(value)
+        self.postings[facet][value].add(pk)
+        self.labels[facet][value] = label
+
+    def size(self):
+        """Approximate memory, for the search cache statistics."""
+        ids = sys.getsizeof(self.ids) + 28 * len(self.ids)
+        sets = sum(sys.getsizeof(pks) for values in self.postings.values() for pks in values.values())
+        return ids + sets
+
+    def matching(self, selected, exclude=None):
+        """
+        Set of ids matching the selected values (OR inside a facet, AND between facets).
+
+        Args:
+            selected (dict): {facet: set of values}
+            exclude (str, optional): facet whose selection is ignored
+        """
+        result = None
+        for facet, values in selected.items():
+            if facet == exclude or not values:
+                continue
+            pks = set().union(*(self.postings[facet].get(value, ()) for value in values))
+            result = pks if result is None else result & pks
+        return set(self.ids) if result is None else result
+
+    def filter(self, selected):
+        """Ids matching the selection, in result order."""
+        pks = self.matching(selected)
+        return [pk for pk in self.ids if pk in pks]
+
+    def counts(self, selected, limit=10):
+        """
+        Values of every facet with their number of results, most frequent first.
+
+        Returns:
+            list: [{'name', 'label', 'values': [{'value', 'label', 'count', 'selected'}]}]
+        """
+        facets = []
+        for name, label in FACETS:
+            pks = self.matching(selected, exclude=name)
+            values = []
+            for value, value_pks in self.postings[name].items():
+                count = len(value_pks & pks)
+                is_selected = value in selected.get(name, ())
+                if count or is_selected:
+                    values.append({'value': value, 'label': self.labels[name][value], 'count': count,
+                                   'selected': is_selected})
+            if name == 'year':
+                values.sort(key=lambda item: item['value'], reverse=True)
+            else:
+                values.sort(key=lambda item: (-item['selected'], -item['count'], str(item['label']).lower()))
+            if values:
+                facets.append({'name': name, 'label': label, 'values': values[:limit]})
+        return facets
+
+
+def max_results():
+    return getattr(settings, 'SEARCH_FACET_MAX_RESULTS', 10000)
+
+
+def selection(params):
+    """Selected facet values from the query string: {facet: set of values}."""
+    return {name: set(params.getlist(name)) for name, _ in FACETS if params.getlist(name)}
@@ -0,0 +1,116 @@
+# federated.py
+
+# Runs independent search queries concurrently, under a global deadline.
+#
+# The "all" search tab queries six categories, each a multi-join icontains scan: run one after
+# the other, the latency is their sum. Here they run in a shared thread pool and the request
+# waits at most SEARCH_DEADLINE seconds, so the latency is about the slowest category. A category
+# that misses the deadline is reported as timed out (partial results) and, on SQLite, its query
+# is interrupted so it does not keep a worker thread busy.
+
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+logger = logging.getLogger(__name__)
+
+
+class FederatedExecutor:
+    """
+    Thread pool shared by the requests of a worker, with per category timeout counters.
+    """
+
+    def __init__(self, workers=None):
+        self.pool = ThreadPoolExecutor(
+            max_workers=workers or getattr(settings, 'SEARCH_FEDERATION_WORKERS', 12),
+            thread_name_prefix='federated-search',
+        )
+        self.lock = threading.Lock()
+        self.searches = 0
+        self.partial = 0
+        self.timeouts = Counter()
+
+    @staticmethod
+    def call(task, state):
+        """Run a task in a pool thread with its own database connections, like a request would."""
+        close_old_connections()
+        # Connections are per thread: remember this thread's ones to interrupt them on timeout
+        state['connections'] = [connections[alias] for alias in connections]
+        try:
+            return task()
+        finally:
+            state['connections'] = None
+            close_old_connections()
+
+    @staticmethod
+    def interrupt(state):
+        """Abort the SQLite queries of a task that missed the deadline."""
+        for connection in state.get('connections') or []:
+            if connection.vendor == 'sqlite' and connection.connection is not None:
+                connection.connection.interrupt()
+
+    def run(self, tasks, deadline=None):
+        """
+        Run callables concurrently.
+
+        Args:
+            tasks (dict): {name: callable without arguments}
+            deadline (float, optional): seconds to wait for all of them, SEARCH_DEADLINE by default
+
+        Returns:
+            tuple: ({name: result} of the tasks done in time, [names of the tasks that timed out or failed])
+        """
+        deadline = deadline or getattr(settings, 'SEARCH_DEADLINE', 2.0)
+        started = time.monotonic()
+
+        futures, running = {}, {}
+        for name, task in tasks.items():
+            running[name] = {}
+            # The context carries the request state (e.g. the replica pinning of routers.py)
+            context = contextvars.copy_context()
+            futures[self.pool.submit(context.run, self.call, task, running[name])] = name
+
+        done, _ = wait(futures, timeout=deadline)
+
+        results, missing = {}, []
+        for future, name in futures.items():
+            if future in done and future.exception() is None:
+                results[name] = future.result()
+                continue
+            missing.append(name)
+            if future in done:
+                logger.error("Search category %s failed", name, exc_info=future.exception())
+            elif not future.cancel():
+                self.interrupt(running[name])
+
+        with self.lock:
+            self.searches += 1
+            if missing:
+                self.partial += 1
+                self.timeouts.update(missing)
+        if missing:
+            logger.warning("Partial search results after %.2fs, missing: %s",
+                           time.monotonic() - started, ', '.join(missing))
+        return results, missing
+
+    def stats(self):
+        """Counters for monitoring (this worker only)."""
+        with self.lock:
+            return {'searches': self.searches, 'partial': self.partial, 'timeouts': dict(self.timeouts)}
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = FederatedExecutor()
+    return _executor
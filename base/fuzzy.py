@@ -0,0 +1,239 @@
+# fuzzy.py
+
+# Typo tolerant search over publication themes, tags, topics and usernames.
+#
+# Texts are split into words folded to lowercase ASCII ("Économétrie" -> "econometrie"). Every
+# distinct word goes to a vocabulary (SearchWord) indexed by its trigrams (SearchTrigram, padded
+# like PostgreSQL's pg_trgm: "cat" -> "  c", " ca", "cat", "at "), and its occurrences are kept
+# in SearchPosting. The similarity of two words is the Jaccard index of their trigram sets.
+#
+# A query word is matched against the vocabulary in one grouped query over its trigrams. For a
+# similarity threshold T, a word sharing s of the q trigrams of the query has a similarity of at
+# most s / q, and words of n trigrams need n between q * T and q / T: candidates failing these
+# bounds are pruned in SQL, so the cost depends on the number of close words, not on the size
+# of the vocabulary.
+
+import math
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count
+
+from .models import Publication, SearchWord, SearchTrigram, SearchPosting
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+MIN_WORD_LENGTH = 3
+# Offsets kept per word and object, enough to place a snippet (see snippets.py)
+MAX_POSITIONS = 20
+
+# (posting kind, field) of the indexed publication texts
+PUBLICATION_FIELDS = [
+    ('publication', 'theme'),
+    ('description', 'description'),
+    ('summary', 'summary'),
+]
+
+
+def fold(text):
+    """Lowercase ASCII version of a text, accents removed."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def occurrences(text):
+    """
+    Folded words of a text, with their original spelling and the offsets of the runs of word
+    characters holding them: {folded word: (display form, [offset, ...])}.
+    """
+    result = {}
+    for match in re.finditer(r'\w+', text or ''):
+        original = match.group()
+        for word in WORD_RE.findall(fold(original)):
+            if MIN_WORD_LENGTH <= len(word) <= 100:
+                _, offsets = result.setdefault(word, (original if fold(original) == word else word, []))
+                if len(offsets) < MAX_POSITIONS and offsets[-1:] != [match.start()]:
+                    offsets.append(match.start())
+    return result
+
+
+def words(text):
+    """
+    Folded words of a text, with the original spelling: {folded word: display form}.
+    """
+    return {word: display for word, (display, _) in occurrences(text).items()}
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def threshold():
+    return getattr(settings, 'SEARCH_FUZZY_THRESHOLD', 0.4)
+
+
+# Indexing
+
+def vocabulary(new_words):
+    """
+    Ids of words, adding the missing ones (and their trigrams) to the vocabulary.
+
+    Args:
+        new_words (dict): {folded word: display form}
+
+    Returns:
+        dict: {folded word: SearchWord id}
+    """
+    if not new_words:
+        return {}
+    ids = dict(SearchWord.objects.filter(word__in=new_words).values_list('word', 'id'))
+    missing = [word for word in new_words if word not in ids]
+    if missing:
+        SearchWord.objects.bulk_create(
+            [SearchWord(word=word, display=new_words[word][:100], gram_count=len(trigrams(word))) for word in missing],
+            ignore_conflicts=True,
+        )
+        added = dict(SearchWord.objects.filter(word__in=missing).values_list('word', 'id'))
+        SearchTrigram.objects.bulk_create(
+            [SearchTrigram(gram=gram, word_id=word_id) for word, word_id in added.items() for gram in trigrams(word)],
+            ignore_conflicts=True,
+        )
+        ids.update(added)
+    return ids
+
+
+def index(kind, items):
+    """
+    (Re)index searched objects, replacing their previous postings.
+
+    Args:
+        kind (str): 'publication', 'description', 'summary', 'tag', 'topic' or 'user'
+        items (iterable): (object id, text) pairs
+    """
+    items = [(object_id, occurrences(text)) for object_id, text in items]
+    if not items:
+        return
+    ids = vocabulary({word: display for _, object_words in items for word, (display, _) in object_words.items()})
+
+    SearchPosting.objects.filter(kind=kind, object_id__in=[object_id for object_id, _ in items]).delete()
+    SearchPosting.objects.bulk_create(
+        [SearchPosting(word_id=ids[word], kind=kind, object_id=object_id, positions=' '.join(map(str, offsets)))
+         for object_id, object_words in items for word, (_, offsets) in object_words.items()],
+        ignore_conflicts=True,
+    )
+
+
+def unindex(kind, object_ids):
+    SearchPosting.objects.filter(kind=kind, object_id__in=object_ids).delete()
+
+
+# Searching
+
+def similar_words(word, limit=None):
+    """
+    Vocabulary words similar to a folded word.
+
+    Returns:
+        list: (SearchWord id, word, display form, similarity) tuples, most similar first
+    """
+    limit = limit or getattr(settings, 'SEARCH_FUZZY_MAX_WORDS', 20)
+    minimum = threshold()
+    grams = trigrams(word)
+    candidates = (
+        SearchTrigram.objects
+        .filter(gram__in=grams,
+                word__gram_count__gte=math.ceil(len(grams) * minimum),
+                word__gram_count__lte=math.floor(len(grams) / minimum))
+        .values('word_id', 'word__word', 'word__display', 'word__gram_count')
+        .annotate(shared=Count('id'))
+        .filter(shared__gte=math.ceil(len(grams) * minimum))
+    )
+    matches = []
+    for candidate in candidates:
+        score = candidate['shared'] / (len(grams) + candidate['word__gram_count'] - candidate['shared'])
+        if score >= minimum:
+            matches.append((candidate['word_id'], candidate['word__word'], candidate['word__display'], score))
+    matches.sort(key=lambda match: (-match[3], match[1]))
+    return matches[:limit]
+
+
+def search_publications(query, limit=30):
+    """
+    Publications matching a query with typos, best first.
+
+    A publication matches a query word through its theme, description or summary, its tags,
+    its topic or its authors' usernames; its score is the sum, over the query words, of the best similarity found.
+
+    Returns:
+        list: publication ids
+    """
+    matches = {}  # SearchWord id -> [(query word index, similarity)]
+    query_words = list(words(query))
+    for position, word in enumerate(query_words):
+        for word_id, _, _, score in similar_words(word):
+            matches.setdefault(word_id, []).append((position, score))
+    if not matches:
+        return []
+
+    postings = defaultdict(set)  # (kind, object id) -> matched word ids
+    for word_id, kind, object_id in SearchPosting.objects.filter(word_id__in=matches).values_list(
+            'word_id', 'kind', 'object_id'):
+        postings[(kind, object_id)].add(word_id)
+
+    # Objects of the other kinds lead to their publications
+    objects = defaultdict(list)
+    for kind, object_id in postings:
+        objects[kind].append(object_id)
+    sources = defaultdict(list)  # publication id -> (kind, object id)
+    for kind, _ in PUBLICATION_FIELDS:
+        for object_id in objects[kind]:
+            sources[object_id].append((kind, object_id))
+    if objects['tag']:
+        for publication_id, tag_id in Publication.tags.through.objects.filter(
+                tag_id__in=objects['tag']).values_list('publication_id', 'tag_id'):
+            sources[publication_id].append(('tag', tag_id))
+    if objects['topic']:
+        for publication_id, topic_id in Publication.objects.filter(
+                topic_id__in=objects['topic']).values_list('id', 'topic_id'):
+            sources[publication_id].append(('topic', topic_id))
+    if objects['user']:
+        for publication_id, user_id in Publication.authors.through.objects.filter(
+                user_id__in=objects['user']).values_list('publication_id', 'user_id'):
+            sources[publication_id].append(('user', user_id))
+
+    scores = []
+    for publication_id, publication_sources in sources.items():
+        best = [0.0] * len(query_words)
+        for source in publication_sources:
+            for word_id in postings[source]:
+                for position, score in matches[word_id]:
+                    best[position] = max(best[position], score)
+        scores.append((sum(best), publication_id))
+    scores.sort(key=lambda item: (-item[0], -item[1]))
+    return [publication_id for _, publication_id in scores[:limit]]
+
+
+def did_you_mean(query):
+    """
+    The query with its unknown words replaced by the closest known ones, or None
+    if every word is known or has no close match.
+    """
+    original = words(query)
+    if not original:
+        return None
+    known = set(SearchWord.objects.filter(word__in=original).values_list('word', flat=True))
+
+    corrected, changed = [], False
+    for word, display in original.items():
+        if word in known:
+            corrected.append(display)
+            continue
+        matches = similar_words(word, limit=1)
+        if matches:
+            corrected.append(matches[0][2])
+            changed = True
+        else:
+            corrected.append(display)
+    return ' '.join(corrected) if changed else None
@@ -0,0 +1,133 @@
+# inbox.py
+
+# Notification inbox: keyset pages and bulk read marking.
+#
+# Pages are read newest first on the (recipient, -created) index, continuing after a cursor
+# (created, id) of the last notification of the previous page rather than with an OFFSET, so
+# page 100 costs what page 1 costs. Marking as read is one UPDATE, whatever the number of
+# notifications.
+#
+# Polling clients send back the ETag of head(): the newest notification (by date, coalesced ones
+# move up when updated) and the unread count, read in one query, so an unchanged inbox is
+# answered 304 without loading any notification.
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Count, Q, Subquery
+from django.utils import timezone
+
+from .models import Notification
+
+READ_STATES = {'read': True, 'unread': False}
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_cursor(notification):
+    """Cursor after a notification: microseconds since the epoch and id ("1735689600000000-42")."""
+    return f"{(notification.created - EPOCH) // MICROSECOND}-{notification.id}"
+
+
+def decode_cursor(cursor):
+    """(created, id) of a cursor, or None when it is missing or malformed."""
+    try:
+        micros, pk = str(cursor).split('-')
+        return EPOCH + int(micros) * MICROSECOND, int(pk)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def notifications(user, type=None, state=None):
+    """
+    Visible notifications of a user, newest first.
+
+    Args:
+        user (User): recipient
+        type (str, optional): one of Notification.NOTIFICATION_TYPES
+        state (str, optional): 'read' or 'unread'
+    """
+    queryset = Notification.objects.filter(recipient=user, is_deleted=False)
+    if type:
+        queryset = queryset.filter(type=type)
+    if state in READ_STATES:
+        queryset = queryset.filter(is_read=READ_STATES[state])
+    return queryset.order_by('-created', '-id')
+
+
+def page(user, after=None, limit=20, type=None, state=None):
+    """
+    One page of a user's notifications, newest first, with their actor.
+
+    Args:
+        user (User): recipient
+        after (str, optional): keyset cursor returned with the previous page
+        limit (int): page size
+        type, state: filters, see notifications()
+
+    Returns:
+        tuple: (list of Notification, cursor for the next page or None)
+    """
+    queryset = notifications(user, type, state).select_related('actor')
+    position = decode_cursor(after) if after else None
+    if position:
+        created, pk = position
+        queryset = queryset.filter(Q(created__lt=created) | Q(created=created, id__lt=pk))
+
+    # One more row tells whether there is a next page
+    rows = list(queryset[:limit + 1])
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1]) if len(rows) > limit else None
+    return items, next_cursor
+
+
+def mark_read(user, ids=None):
+    """
+    Mark notifications of a user as read, all of them when ids is None, in one UPDATE.
+
+    Returns:
+        int: number of notifications marked
+    """
+    queryset = Notification.objects.filter(recipient=user, is_read=False, is_deleted=False)
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+    return queryset.update(is_read=True, read_at=timezone.now())
+
+
+def head(user):
+    """
+    ETag of a user's inbox: its newest notification (id, date and read state) and the unread
+    count, in one query on the (recipient, -created) and (recipient, is_read) indexes. It changes
+    with new and coalesced notifications and whenever a notification is read or deleted.
+    """
+    unread = notifications(user, state='unread').order_by().values('recipient').annotate(
+        count=Count('id')).values('count')
+    latest = notifications(user).annotate(unread=Subquery(unread)).values_list(
+        'id', 'created', 'is_read', 'unread').first()
+    if not latest:
+        return '"0"'
+    pk, created, is_read, unread_count = latest
+    return f'"{pk}-{(created - EPOCH) // MICROSECOND}-{int(is_read)}-{unread_count or 0}"'
+
+
+def unread_count(user):
+    return notifications(user, state='unread').count()
+
+
+def unread_ids(user, limit=10):
+    """Ids of the newest unread notifications of a user."""
+    return list(notifications(user, state='unread').values_list('id', flat=True)[:limit])
+
+
+def serialize(notification):
+    actor = notification.actor
+    return {
+        'id': notification.id,
+        'type': notification.type,
+        'title': notification.title,
+        'message': notification.text,
+        'actor_count': notification.actor_count,
+        'is_read': notification.is_read,
+        'created': notification.created.isoformat(),
+        'action_url': notification.action_url,
+        'actor': {'id': actor.id, 'username': actor.username, 'photo': actor.photo.url} if actor else None,
+    }
@@ -0,0 +1,141 @@
+"""
+Benchmark of concurrent reads/writes on SQLite, default settings vs the production profile.
+
+Usage:
+    python manage.py bench_sqlite [--writers 8] [--readers 8] [--duration 5]
+
+Each profile runs on a fresh temporary database shaped like the discussion workload:
+writers open a transaction, read the discussion then insert a message (like posting a
+message and a search history entry do), readers list the latest messages.
+"default" is Django's stock SQLite setup (rollback journal, deferred transactions);
+"tuned" applies settings.SQLITE_PRAGMAS with immediate transactions.
+"""
+
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from base.db import is_lock_error
+
+
+SCHEMA = [
+    "CREATE TABLE discussion (id INTEGER PRIMARY KEY, title TEXT, updated REAL)",
+    "CREATE TABLE message (id INTEGER PRIMARY KEY, discussion_id INTEGER, body TEXT, created REAL)",
+    "CREATE INDEX message_discussion ON message (discussion_id, created)",
+]
+
+
+class Command(BaseCommand):
+    help = "Compare SQLite concurrency with the default settings and with SQLITE_PRAGMAS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=5.0, help="Seconds per profile")
+
+    def handle(self, *args, **options):
+        profiles = {
+            'default': ({}, 'DEFERRED'),
+            'tuned': (getattr(settings, 'SQLITE_PRAGMAS', {}), 'IMMEDIATE'),
+        }
+        self.stdout.write(f"{'profile':<8} {'writes/s':>9} {'reads/s':>9} {'locked':>7} "
+                          f"{'write p50':>10} {'write p99':>10} {'read p99':>9}")
+        for name, (pragmas, mode) in profiles.items():
+            with tempfile.TemporaryDirectory() as directory:
+                result = self.run_profile(os.path.join(directory, 'bench.sqlite3'), pragmas, mode, options)
+            self.stdout.write(
+                f"{name:<8} {result['writes'] / options['duration']:>9.0f} "
+                f"{result['reads'] / options['duration']:>9.0f} {result['locked']:>7} "
+                f"{result['write_p50']:>8.1f}ms {result['write_p99']:>8.1f}ms {result['read_p99']:>7.1f}ms"
+            )
+
+    def connect(self, path, pragmas):
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        for pragma, value in pragmas.items():
+            connection.execute(f"PRAGMA {pragma} = {value}")
+        return connection
+
+    def run_profile(self, path, pragmas, mode, options):
+        setup = self.connect(path, pragmas)
+        for statement in SCHEMA:
+            setup.execute(statement)
+        setup.execute("BEGIN")
+        setup.executemany("INSERT INTO discussion (title, updated) VALUES (?, ?)",
+                          [(f"discussion {i}", time.time()) for i in range(50)])
+        setup.executemany("INSERT INTO message (discussion_id, body, created) VALUES (?, ?, ?)",
+                          [(i % 50 + 1, "x" * 200, time.time()) for i in range(5000)])
+        setup.execute("COMMIT")
+        setup.close()
+
+        stop = time.monotonic() + options['duration']
+        lock = threading.Lock()
+        result = {'writes': 0, 'reads': 0, 'locked': 0}
+        write_times, read_times = [], []
+
+        def writer(n):
+            connection = self.connect(path, pragmas)
+            discussion_id = n % 50 + 1
+            while time.monotonic() < stop:
+                started = time.monotonic()
+                try:
+                    connection.execute(f"BEGIN {mode}")
+                    connection.execute("SELECT id, title FROM discussion WHERE id = ?", (discussion_id,)).fetchone()
+                    connection.execute("INSERT INTO message (discussion_id, body, created) VALUES (?, ?, ?)",
+                                       (discussion_id, "y" * 200, time.time()))
+                    connection.execute("UPDATE discussion SET updated = ? WHERE id = ?", (time.time(), discussion_id))
+                    connection.execute("COMMIT")
+                except sqlite3.OperationalError as e:
+                    if connection.in_transaction:
+                        connection.execute("ROLLBACK")
+                    if not is_lock_error(e):
+                        raise
+                    with lock:
+                        result['locked'] += 1
+                    continue
+                with lock:
+                    result['writes'] += 1
+                    write_times.append(time.monotonic() - started)
+            connection.close()
+
+        def reader(n):
+            connection = self.connect(path, pragmas)
+            while time.monotonic() < stop:
+                started = time.monotonic()
+                try:
+                    connection.execute(
+                        "SELECT id, body FROM message WHERE discussion_id = ? ORDER BY created DESC LIMIT 20",
+                        (n % 50 + 1,)
+                    ).fetchall()
+                except sqlite3.OperationalError as e:
+                    if not is_lock_error(e):
+                        raise
+                    with lock:
+                        result['locked'] += 1
+                    continue
+                with lock:
+                    result['reads'] += 1
+                    read_times.append(time.monotonic() - started)
+            connection.close()
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(options['writers'])]
+        threads += [threading.Thread(target=reader, args=(n,)) for n in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        def percentile(values, p):
+            if len(values) < 2:
+                return values[0] * 1000 if values else 0.0
+            return statistics.quantiles(values, n=100)[p - 1] * 1000
+
+        result['write_p50'] = percentile(write_times, 50)
+        result['write_p99'] = percentile(write_times, 99)
+        result['read_p99'] = percentile(read_times, 99)
+        return result
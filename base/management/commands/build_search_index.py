@@ -0,0 +1,58 @@
+"""
+Builds the fuzzy search index (trigram vocabulary and postings, see base/fuzzy.py), with the
+word offsets used by the result snippets (base/snippets.py).
+
+Usage:
+    python manage.py build_search_index [--batch-size 1000]
+
+Needed once for the data existing before the index was added; afterwards the index is kept
+up to date on save/delete. Running it again rebuilds the index from scratch (vocabulary words
+that are no longer used are dropped).
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from base import fuzzy, searchcache
+from base.models import Publication, Tag, Topic, SearchWord, SearchTrigram, SearchPosting
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search index of publications (theme, description, summary), tags, topics and usernames"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        sources = [
+            *((kind, Publication.objects.all(), field) for kind, field in fuzzy.PUBLICATION_FIELDS),
+            ('tag', Tag.objects.all(), 'name'),
+            ('topic', Topic.objects.all(), 'name'),
+            ('user', get_user_model().objects.all(), 'username'),
+        ]
+
+        with transaction.atomic():
+            # Tables referencing the words first, each in a single DELETE
+            SearchPosting.objects.all().delete()
+            SearchTrigram.objects.all().delete()
+            SearchWord.objects.all().delete()
+
+            for kind, queryset, field in sources:
+                count = 0
+                batch = []
+                for item in queryset.order_by('pk').values_list('pk', field).iterator(chunk_size=options['batch_size']):
+                    batch.append(item)
+                    if len(batch) == options['batch_size']:
+                        fuzzy.index(kind, batch)
+                        count += len(batch)
+                        batch = []
+                fuzzy.index(kind, batch)
+                count += len(batch)
+                self.stdout.write(f"{kind}: {count} indexed")
+
+        for label in ('base.publication', 'base.tag', 'base.topic', 'authentification.user'):
+            searchcache.bump(label)
+        self.stdout.write(self.style.SUCCESS(
+            f"{SearchWord.objects.count()} words, {SearchPosting.objects.count()} postings"
+        ))
@@ -0,0 +1,89 @@
+"""
+Builds the LSA vectors of the publications used by the "similar" searches (see base/semantic.py).
+
+Usage:
+    python manage.py build_semantic_index [--rebuild] [--dimensions 128] [--batch-size 1000]
+
+The first run (or --rebuild) fits TF-IDF and the truncated SVD on all the publications and
+stores a new model with the vectors of every publication. Later runs are incremental: only
+publications without a vector of the current model, or updated since theirs was computed, are
+projected with the stored model. Words unknown to the model are ignored until a rebuild, worth
+running when the collection changed a lot. Meant for a cron job; workers pick the new vectors
+up within SEMANTIC_REFRESH_INTERVAL seconds.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from base import semantic
+from base.models import Publication, PublicationVector, SemanticModel
+
+
+class Command(BaseCommand):
+    help = "Fit or update the LSA vectors of the publications"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Refit the model on all the publications")
+        parser.add_argument('--dimensions', type=int, default=getattr(settings, 'SEMANTIC_DIMENSIONS', 128))
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        model = SemanticModel.objects.order_by('-pk').first()
+
+        if model is None or options['rebuild']:
+            ids, counts = [], []
+            for pk, document in semantic.documents(Publication.objects.all(), options['batch_size']):
+                ids.append(pk)
+                counts.append(document)
+            model = semantic.Projection.fit(counts, options['dimensions'])
+            if model is None:
+                raise CommandError("Not enough publications (or words) to fit a model")
+            with transaction.atomic():
+                model.save()
+                projection = semantic.Projection(model)
+                for start in range(0, len(ids), options['batch_size']):
+                    self.write(projection, ids[start:start + options['batch_size']],
+                               counts[start:start + options['batch_size']])
+                # Vectors of the previous models go with them
+                SemanticModel.objects.exclude(pk=model.pk).delete()
+            self.stdout.write(f"Fitted {model.dimensions} dimensions on {len(projection.terms)} words")
+            count = len(ids)
+        else:
+            projection = semantic.Projection(model)
+            stale = Publication.objects.filter(
+                Q(semantic_vector__isnull=True) | ~Q(semantic_vector__model=model)
+                | Q(updated__gt=F('semantic_vector__updated'))
+            )
+            count = 0
+            batch = []
+            for pk, document in semantic.documents(stale, options['batch_size']):
+                batch.append((pk, document))
+                if len(batch) == options['batch_size']:
+                    self.write(projection, *zip(*batch))
+                    count += len(batch)
+                    batch = []
+            if batch:
+                self.write(projection, *zip(*batch))
+                count += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} vectors written in {time.monotonic() - started:.1f}s (model {model.pk})"
+        ))
+
+    @staticmethod
+    def write(projection, ids, counts):
+        vectors = projection.encode(list(counts))
+        now = timezone.now()
+        PublicationVector.objects.bulk_create(
+            [PublicationVector(publication_id=pk, model_id=projection.pk, vector=vector.tobytes(), updated=now)
+             for pk, vector in zip(ids, vectors)],
+            update_conflicts=True,
+            unique_fields=['publication'],
+            update_fields=['model', 'vector', 'updated'],
+        )
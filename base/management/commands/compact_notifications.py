@@ -0,0 +1,143 @@
+"""
+Purges old notifications and gives their space back to the file system.
+
+Usage:
+    python manage.py compact_notifications [--retention-days 90] [--deleted-retention-days 7]
+                                           [--batch-size 1000] [--archive notifications.jsonl]
+                                           [--enable-incremental-vacuum]
+
+Deletes, in batches of short transactions (writers are never blocked for long):
+- read notifications older than NOTIFICATION_RETENTION_DAYS,
+- soft-deleted notifications older than NOTIFICATION_DELETED_RETENTION_DAYS,
+- notifications whose target no longer exists (swept per content type).
+With --archive, deleted rows are appended to a JSON lines file first.
+
+On SQLite, the freed pages are then released with PRAGMA incremental_vacuum. That needs the
+database in auto_vacuum=INCREMENTAL mode: --enable-incremental-vacuum switches it once (it runs
+a full VACUUM, which rewrites the whole file: schedule it off-peak). Meant for a daily cron job.
+"""
+
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from base.db import retry_on_lock
+from base.models import Notification
+
+
+class Command(BaseCommand):
+    help = "Delete old read, soft-deleted and orphaned notifications, then reclaim the freed pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int,
+                            default=getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90))
+        parser.add_argument('--deleted-retention-days', type=int,
+                            default=getattr(settings, 'NOTIFICATION_DELETED_RETENTION_DAYS', 7))
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--archive', help="Append the deleted notifications to this JSON lines file")
+        parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                            help="Switch the SQLite database to auto_vacuum=INCREMENTAL (full VACUUM)")
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.archive = open(options['archive'], 'a', encoding='utf-8') if options['archive'] else None
+        now = timezone.now()
+        try:
+            read = self.purge(Notification.objects.filter(
+                is_read=True, is_deleted=False, created__lt=now - timedelta(days=options['retention_days'])))
+            self.stdout.write(f"{read} read notifications older than {options['retention_days']} days")
+            deleted = self.purge(Notification.objects.filter(
+                is_deleted=True, created__lt=now - timedelta(days=options['deleted_retention_days'])))
+            self.stdout.write(f"{deleted} deleted notifications older than {options['deleted_retention_days']} days")
+            orphaned = self.sweep_orphans()
+        finally:
+            if self.archive:
+                self.archive.close()
+
+        self.stdout.write(self.style.SUCCESS(f"{read + deleted + orphaned} notifications removed"))
+        if connection.vendor == 'sqlite':
+            self.vacuum(options['enable_incremental_vacuum'])
+
+    def purge(self, queryset):
+        """Delete the notifications of a queryset by batches of ids, in id order."""
+        total, last = 0, 0
+        while True:
+            ids = list(queryset.filter(id__gt=last).order_by('id').values_list('id', flat=True)[:self.batch_size])
+            if not ids:
+                return total
+            last = ids[-1]
+            count, rows = self.delete(ids)
+            # Archived once the batch committed: a retried batch must not be written twice
+            if self.archive:
+                for row in rows:
+                    self.archive.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+                self.archive.flush()
+            total += count
+
+    def sweep_orphans(self):
+        """Delete the notifications whose target was deleted, one content type at a time."""
+        total = 0
+        for content_type_id in Notification.objects.values_list('content_type', flat=True).distinct().order_by():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            swept, last = 0, -1
+            while True:
+                object_ids = list(
+                    Notification.objects.filter(content_type_id=content_type_id, object_id__gt=last)
+                    .order_by('object_id').values_list('object_id', flat=True).distinct()[:self.batch_size]
+                )
+                if not object_ids:
+                    break
+                last = object_ids[-1]
+                # The model of an uninstalled app has no rows left at all
+                existing = set(model._base_manager.filter(pk__in=object_ids).values_list('pk', flat=True)) if model else set()
+                missing = [object_id for object_id in object_ids if object_id not in existing]
+                if missing:
+                    swept += self.purge(Notification.objects.filter(content_type_id=content_type_id, object_id__in=missing))
+            if swept:
+                label = model._meta.label_lower if model else f"content type {content_type_id}"
+                self.stdout.write(f"{swept} notifications about deleted {label} objects")
+            total += swept
+        return total
+
+    @retry_on_lock
+    @transaction.atomic
+    def delete(self, ids):
+        """Delete notifications by id. Returns the number deleted and, to archive, the rows (dicts)."""
+        queryset = Notification.objects.filter(id__in=ids)
+        rows = list(queryset.values()) if self.archive else []
+        count, _ = queryset.delete()
+        return count, rows
+
+    def vacuum(self, enable):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA auto_vacuum")
+            mode = cursor.fetchone()[0]
+            if mode != 2 and enable:
+                cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                cursor.execute("VACUUM")  # the mode only changes with a full VACUUM
+                self.stdout.write(self.style.SUCCESS("Database switched to incremental vacuum"))
+                return
+            if mode != 2:
+                self.stdout.write(self.style.WARNING(
+                    "auto_vacuum is not INCREMENTAL, freed pages stay in the file "
+                    "(run once with --enable-incremental-vacuum)"
+                ))
+                return
+
+            cursor.execute("PRAGMA page_size")
+            page_size = cursor.fetchone()[0]
+            cursor.execute("PRAGMA freelist_count")
+            free = cursor.fetchone()[0]
+            cursor.execute("PRAGMA incremental_vacuum")
+            cursor.fetchall()  # the pages are released as the statement is stepped through
+            cursor.execute("PRAGMA freelist_count")
+            released = free - cursor.fetchone()[0]
+        self.stdout.write(self.style.SUCCESS(
+            f"{released} pages ({released * page_size / 1024 / 1024:.1f} MB) released to the file system"
+        ))
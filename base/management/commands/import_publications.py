@@ -0,0 +1,264 @@
+"""
+Bulk import of publications from a directory of PDFs and a manifest.
+
+Usage:
+    python manage.py import_publications <directory> <manifest> --owner <username>
+        [--batch-size 200] [--workers 4] [--dry-run]
+        [--checkpoint import.checkpoint] [--report import_errors.csv]
+
+The manifest is a CSV file, a JSON Lines file (one object per line) or a JSON array, with
+one entry per document:
+    file (required): PDF file name, relative to <directory>
+    theme: publication theme (defaults to the PDF title metadata)
+    topic (required): topic name
+    tags, authors, affiliations: comma-separated in CSV, comma-separated or lists in JSON
+    description, summary: free text
+
+CSV and JSON Lines manifests are streamed, JSON arrays are loaded at once.
+
+The checkpoint only moves past batches that were committed: with --checkpoint, the import stops
+at the first batch that fails (a locked database...) so that running it again resumes there.
+"""
+
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from base import fuzzy, searchcache, services, timeline, utils
+from base.models import Publication
+
+
+def init_worker():
+    """Make the ORM/settings usable in worker processes started with the spawn method."""
+    django.setup()
+
+
+def extract_metadata(job):
+    """
+    Validate a PDF and extract its metadata (runs in the process pool).
+
+    Args:
+        job (tuple): (path, max_pages, timeout)
+
+    Returns:
+        dict: {'pages': int, 'title': str|None} or {'error': str}
+    """
+    path, max_pages, timeout = job
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            utils.checkPdfHeader(f.read(utils.PDF_HEADER_WINDOW))
+            f.seek(max(0, size - utils.PDF_TAIL_WINDOW))
+            utils.checkPdfTrailer(f.read(), size)
+            reader, pages = utils.readPdf(f, max_pages=max_pages, timeout=timeout)
+            metadata = reader.metadata
+            title = str(metadata.title or '').strip() if metadata else ''
+    except OSError as e:
+        return {'error': f"cannot read file ({e.strerror})"}
+    except ValidationError as e:
+        return {'error': e.messages[0]}
+    except Exception as e:
+        # Broken metadata dictionaries raise anything: one bad PDF must not stop the pool
+        return {'error': f"unreadable PDF metadata ({e.__class__.__name__})"}
+    return {'pages': pages, 'title': title or None}
+
+
+def text(row, key):
+    """Manifest value as a stripped string ('' when missing): JSON values may be numbers, lists..."""
+    value = row.get(key)
+    return '' if value is None else str(value).strip()
+
+
+def read_manifest(path):
+    """Yield manifest rows one by one (CSV and JSON Lines are streamed)."""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline='', encoding='utf-8') as f:
+        if extension == '.csv':
+            yield from csv.DictReader(f)
+        elif extension == '.jsonl':
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        elif extension == '.json':
+            yield from json.load(f)
+        else:
+            raise CommandError(f"Unsupported manifest format '{extension}' (use .csv, .jsonl or .json)")
+
+
+class Command(BaseCommand):
+    help = "Bulk import publications from a directory of PDFs and a CSV/JSON manifest"
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help="Directory containing the PDF files")
+        parser.add_argument('manifest', help="CSV, JSON Lines or JSON manifest")
+        parser.add_argument('--owner', required=True, help="Username of the publications owner")
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Processes used to validate the PDFs and extract their metadata")
+        parser.add_argument('--dry-run', action='store_true', help="Validate everything, write nothing")
+        parser.add_argument('--checkpoint', help="File storing the last imported row, used to resume an import")
+        parser.add_argument('--report', default='import_errors.csv', help="CSV report of rejected rows")
+
+    def handle(self, *args, **options):
+        self.directory = options['directory']
+        self.dry_run = options['dry_run']
+        self.checkpoint = options['checkpoint']
+        _, self.max_pages, self.timeout = utils.pdfLimits()
+
+        try:
+            self.owner = get_user_model().objects.get(username=options['owner'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Unknown owner '{options['owner']}'")
+
+        start_row = self.read_checkpoint()
+        if start_row:
+            self.stdout.write(f"Resuming after row {start_row}")
+
+        rows = enumerate(read_manifest(options['manifest']), start=1)
+        rows = itertools.dropwhile(lambda item: item[0] <= start_row, rows)
+
+        imported = rejected = 0
+        started = time.monotonic()
+        with open(options['report'], 'w', newline='', encoding='utf-8') as report_file, \
+                ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as pool:
+            self.report = csv.writer(report_file)
+            self.report.writerow(['row', 'file', 'error'])
+
+            while True:
+                batch = list(itertools.islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                ok, ko, committed = self.import_batch(batch, pool)
+                imported += ok
+                rejected += ko
+                report_file.flush()
+                if not committed and self.checkpoint:
+                    # Later batches must not move the checkpoint past the failed rows
+                    raise CommandError(f"Batch ending at row {batch[-1][0]} failed (see {options['report']}), "
+                                       f"run the import again with the same --checkpoint to resume")
+                if not self.dry_run:
+                    self.write_checkpoint(batch[-1][0])
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"row {batch[-1][0]}: {imported} imported, {rejected} rejected "
+                                  f"({imported / elapsed * 60:.0f} docs/min)")
+
+        verb = "would be imported" if self.dry_run else "imported"
+        self.stdout.write(self.style.SUCCESS(f"{imported} publications {verb}, {rejected} rejected "
+                                             f"(see {options['report']})"))
+
+    def import_batch(self, batch, pool):
+        """
+        Validate, copy and insert one batch of manifest rows.
+
+        Returns:
+            tuple: (imported, rejected, whether the batch was committed or had nothing to write)
+        """
+        jobs = [(os.path.join(self.directory, text(row, 'file')), self.max_pages, self.timeout)
+                for _, row in batch]
+        metadata = pool.map(extract_metadata, jobs, chunksize=max(1, len(jobs) // 32))
+
+        # Row level validation
+        valid = []
+        for (line, row), (path, *_), meta in zip(batch, jobs, metadata):
+            theme = text(row, 'theme') or meta.get('title')
+            topic = text(row, 'topic')
+            if not text(row, 'file'):
+                self.reject(line, row, "missing file name")
+            elif 'error' in meta:
+                self.reject(line, row, meta['error'])
+            elif not theme:
+                self.reject(line, row, "missing theme (and no title in the PDF metadata)")
+            elif not topic:
+                self.reject(line, row, "missing topic")
+            else:
+                valid.append((line, row, path, theme, topic))
+
+        if not valid:
+            return 0, len(batch), True
+
+        # Authors are resolved for the whole batch at once, unknown usernames are reported
+        authors, unresolved = services.resolve_authors(
+            itertools.chain.from_iterable(services.split_names(row.get('authors')) for _, row, *_ in valid))
+        unresolved = set(unresolved)
+        for line, row, *_ in valid:
+            unknown = [username for username in services.split_names(row.get('authors')) if username in unresolved]
+            if unknown:
+                self.reject(line, row, f"warning, unknown authors skipped: {', '.join(unknown)}")
+
+        if self.dry_run:
+            return len(valid), len(batch) - len(valid), True
+
+        stored = []
+        try:
+            with transaction.atomic():
+                topics = services.resolve_topics([topic for *_, topic in valid])
+                tags = services.resolve_tags(
+                    itertools.chain.from_iterable(services.split_names(row.get('tags')) for _, row, *_ in valid))
+
+                publications = []
+                for line, row, path, theme, topic in valid:
+                    with open(path, 'rb') as f:
+                        name = default_storage.save(utils.pdfUploadPath(None, os.path.basename(path)), File(f))
+                    stored.append(name)
+                    publications.append(Publication(
+                        user=self.owner,
+                        theme=theme,
+                        topic_id=topics[topic],
+                        affiliations=', '.join(services.split_names(row.get('affiliations'))) or None,
+                        description=text(row, 'description') or None,
+                        summary=text(row, 'summary') or None,
+                        file=name,
+                    ))
+                Publication.objects.bulk_create(publications)
+                # bulk_create() sends no signal: index for search here
+                for kind, field in fuzzy.PUBLICATION_FIELDS:
+                    fuzzy.index(kind, [(publication.id, getattr(publication, field)) for publication in publications])
+                searchcache.bump('base.publication')
+
+                services.add_publication_relations(
+                    (
+                        publication.id,
+                        {self.owner.id, *(authors[u] for u in services.split_names(row.get('authors')) if u in authors)},
+                        [tags[t] for t in services.split_names(row.get('tags'))],
+                    )
+                    for publication, (_, row, *_) in zip(publications, valid)
+                )
+                timeline.fan_out(publications)
+        except Exception as e:
+            for name in stored:
+                default_storage.delete(name)
+            for line, row, *_ in valid:
+                self.reject(line, row, f"batch failed: {e}")
+            return 0, len(batch), False
+
+        return len(valid), len(batch) - len(valid), True
+
+    # helpers
+    def reject(self, line, row, error):
+        self.report.writerow([line, row.get('file', ''), error])
+
+    def read_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as f:
+            return int(f.read().strip() or 0)
+
+    def write_checkpoint(self, line):
+        if not self.checkpoint:
+            return
+        tmp = f"{self.checkpoint}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(str(line))
+        os.replace(tmp, self.checkpoint)
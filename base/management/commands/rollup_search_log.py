@@ -0,0 +1,102 @@
+"""
+Aggregates the search log (base/searchlog.py) by hour and by day, then drops old log rows.
+
+Usage:
+    python manage.py rollup_search_log [--retention-days 14]
+
+Meant for an hourly cron job. Hours are rolled up from the raw log, days from the hours; only
+complete periods are written, starting again from the last one written (the log of a flush
+that arrived late is counted), so running it twice is harmless. Rollups are kept, raw log rows
+older than the retention are deleted.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from base.db import retry_on_lock
+from base.models import SearchLog, SearchRollup
+
+
+class Command(BaseCommand):
+    help = "Roll the search log up into hourly and daily aggregates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int,
+                            default=getattr(settings, 'SEARCH_LOG_RETENTION_DAYS', 14))
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        this_hour = now.replace(minute=0, second=0, microsecond=0)
+        today = this_hour.replace(hour=0)
+        slow = getattr(settings, 'SEARCH_SLOW_MS', 1000)
+
+        # Hours, from the raw log
+        first_log = SearchLog.objects.order_by('created').values_list('created', flat=True).first()
+        since = self.resume('hour', first_log)
+        hours = (
+            SearchLog.objects.filter(created__gte=since, created__lt=this_hour) if since else SearchLog.objects.none()
+        ).values('tab', 'query', bucket=TruncHour('created')).annotate(
+            count=Count('id'),
+            zero=Count('id', filter=Q(zero_hits=True)),
+            partials=Count('id', filter=Q(partial=True)),
+            slows=Count('id', filter=Q(latency__gt=slow)),
+            total=Sum('latency'),
+            longest=Max('latency'),
+        ).order_by()
+        self.stdout.write(f"{self.save('hour', hours)} hourly rollups")
+
+        # Days, from the hours
+        first_hour = SearchRollup.objects.filter(period='hour').order_by('start').values_list('start', flat=True).first()
+        since = self.resume('day', first_hour)
+        days = (
+            SearchRollup.objects.filter(period='hour', start__gte=since, start__lt=today) if since
+            else SearchRollup.objects.none()
+        ).values('tab', 'query', bucket=TruncDay('start')).annotate(
+            count=Sum('searches'),
+            zero=Sum('zero_hits'),
+            partials=Sum('partial'),
+            slows=Sum('slow'),
+            total=Sum('total_latency'),
+            longest=Max('max_latency'),
+        ).order_by()
+        self.stdout.write(f"{self.save('day', days)} daily rollups")
+
+        deleted, _ = SearchLog.objects.filter(created__lt=now - timedelta(days=options['retention_days'])).delete()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} log rows older than {options['retention_days']} days deleted"))
+
+    @staticmethod
+    def resume(period, first):
+        """Start of the last period rolled up (written again), or of the first data when none was."""
+        last = SearchRollup.objects.filter(period=period).order_by('-start').values_list('start', flat=True).first()
+        start = last or first
+        if start is None:
+            return None
+        start = start.replace(minute=0, second=0, microsecond=0)
+        return start.replace(hour=0) if period == 'day' else start
+
+    @staticmethod
+    @retry_on_lock
+    @transaction.atomic
+    def save(period, rows):
+        rollups = [
+            SearchRollup(
+                period=period, start=row['bucket'], tab=row['tab'], query=row['query'],
+                searches=row['count'], zero_hits=row['zero'], partial=row['partials'],
+                slow=row['slows'], total_latency=row['total'], max_latency=row['longest'],
+            )
+            for row in rows
+        ]
+        SearchRollup.objects.bulk_create(
+            rollups,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['period', 'start', 'tab', 'query'],
+            update_fields=['searches', 'zero_hits', 'partial', 'slow', 'total_latency', 'max_latency'],
+        )
+        return len(rollups)
@@ -0,0 +1,52 @@
+"""
+Keeps local SQLite read replicas in sync with the primary database.
+
+Usage:
+    python manage.py sync_replica [--interval 5] [--once]
+
+Stand-in for a real replica when testing the read/write router locally: every replica alias
+of settings.DATABASE_REPLICAS using the sqlite3 backend is refreshed with SQLite's online
+backup API, which copies a consistent snapshot of the primary without blocking its writers.
+Run it next to the server (or from cron with --once).
+"""
+
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database to the local replicas, periodically"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds between two syncs")
+        parser.add_argument('--once', action='store_true', help="Sync once and exit")
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        replicas = [settings.DATABASES[alias] for alias in getattr(settings, 'DATABASE_REPLICAS', [])
+                    if settings.DATABASES[alias]['ENGINE'] == 'django.db.backends.sqlite3']
+        if primary['ENGINE'] != 'django.db.backends.sqlite3' or not replicas:
+            raise CommandError("sync_replica needs a SQLite primary and at least one SQLite replica "
+                               "(set NOXA_REPLICA_DB)")
+
+        while True:
+            started = time.monotonic()
+            for replica in replicas:
+                self.sync(str(primary['NAME']), str(replica['NAME']))
+            self.stdout.write(f"{len(replicas)} replica(s) synced in {(time.monotonic() - started) * 1000:.0f}ms")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, source_path, target_path):
+        source = sqlite3.connect(source_path, timeout=30)
+        target = sqlite3.connect(target_path, timeout=30)
+        try:
+            # Copied in steps of 1024 pages so the primary stays writable during the copy
+            source.backup(target, pages=1024)
+        finally:
+            target.close()
+            source.close()
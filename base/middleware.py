@@ -0,0 +1,31 @@
+# middleware.py
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from .ratelimit import get_limiter
+
+
+class RateLimitMiddleware:
+    """
+    Rejects requests over the per route limits of settings.RATELIMITS with a 429.
+    The check runs in process_view, once the route is resolved, and before the view does any work.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(settings, 'RATELIMIT_ENABLED', True):
+            return None
+
+        retry_after = get_limiter().check(request.resolver_match.view_name, request)
+        if retry_after is None:
+            return None
+
+        response = HttpResponse("Too many requests, please retry later.", status=429, content_type="text/plain")
+        response['Retry-After'] = str(retry_after)
+        return response
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:22
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    """Point publications and favorites of duplicated tags to the oldest one, then delete the copies."""
+    Tag = apps.get_model('base', 'Tag')
+    PublicationTags = apps.get_model('base', 'Publication').tags.through
+    FavoriteTags = apps.get_model('authentification', 'User').favorite_tags.through
+    db_alias = schema_editor.connection.alias
+
+    duplicates = Tag.objects.using(db_alias).values('name').annotate(keep=Min('id'), n=Count('id')).filter(n__gt=1)
+    for dup in duplicates:
+        others = list(Tag.objects.using(db_alias).filter(name=dup['name']).exclude(id=dup['keep']).values_list('id', flat=True))
+
+        PublicationTags.objects.using(db_alias).bulk_create(
+            [PublicationTags(publication_id=pub_id, tag_id=dup['keep'])
+             for pub_id in PublicationTags.objects.using(db_alias).filter(tag_id__in=others).values_list('publication_id', flat=True)],
+            ignore_conflicts=True,
+        )
+        FavoriteTags.objects.using(db_alias).bulk_create(
+            [FavoriteTags(user_id=user_id, tag_id=dup['keep'])
+             for user_id in FavoriteTags.objects.using(db_alias).filter(tag_id__in=others).values_list('user_id', flat=True)],
+            ignore_conflicts=True,
+        )
+        Tag.objects.using(db_alias).filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0010_remove_searchhistory_base_search_user_id_bf719e_idx_and_more'),
+        ('authentification', '0003_user_following'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='name',
+            field=models.CharField(max_length=50, unique=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0012_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publication',
+            name='download_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='publication',
+            name='trending_score',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='publication',
+            name='view_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
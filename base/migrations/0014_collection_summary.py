@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_summaries(apps, schema_editor):
+    """Compute the summaries of the existing collections."""
+    Collection = apps.get_model('base', 'Collection')
+    CollectionPublication = apps.get_model('base', 'CollectionPublication')
+    db_alias = schema_editor.connection.alias
+
+    for collection_id in Collection.objects.using(db_alias).values_list('id', flat=True):
+        entries = CollectionPublication.objects.using(db_alias).filter(collection_id=collection_id)
+        latest = entries.order_by('-added', '-id').values_list('added', 'publication_id').first()
+        Collection.objects.using(db_alias).filter(pk=collection_id).update(
+            pub_count=entries.count(),
+            last_added=latest[0] if latest else None,
+            cover_id=latest[1] if latest else None,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0013_publication_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='cover',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='base.publication'),
+        ),
+        migrations.AddField(
+            model_name='collection',
+            name='last_added',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='collection',
+            name='pub_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='collectionpublication',
+            index=models.Index(fields=['collection', '-added'], name='collection_latest_idx'),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
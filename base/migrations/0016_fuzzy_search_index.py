@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0015_searchgeneration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchWord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('word', models.CharField(max_length=100, unique=True)),
+                ('display', models.CharField(max_length=100)),
+                ('gram_count', models.PositiveSmallIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3)),
+                ('word', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='base.searchword')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('gram', 'word'), name='unique_search_trigram')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('publication', 'Publication theme'), ('tag', 'Tag name'), ('topic', 'Topic name'), ('user', 'Username')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('word', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='base.searchword')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'object_id'], name='base_search_kind_bd16a7_idx')],
+                'constraints': [models.UniqueConstraint(fields=('word', 'kind', 'object_id'), name='unique_search_posting')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0017_publication_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchposting',
+            name='positions',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='searchposting',
+            name='kind',
+            field=models.CharField(choices=[('publication', 'Publication theme'), ('description', 'Publication description'), ('summary', 'Publication summary'), ('tag', 'Tag name'), ('topic', 'Topic name'), ('user', 'Username')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0018_search_posting_positions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SemanticModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('dimensions', models.PositiveSmallIntegerField()),
+                ('terms', models.TextField()),
+                ('idf', models.BinaryField()),
+                ('components', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PublicationVector',
+            fields=[
+                ('publication', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='semantic_vector', serialize=False, to='base.publication')),
+                ('vector', models.BinaryField()),
+                ('updated', models.DateTimeField(db_index=True)),
+                ('model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vectors', to='base.semanticmodel')),
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0019_semantic_vectors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(db_index=True)),
+                ('tab', models.CharField(max_length=20)),
+                ('query', models.CharField(max_length=200)),
+                ('latency', models.FloatField()),
+                ('results', models.PositiveIntegerField()),
+                ('zero_hits', models.BooleanField(default=False)),
+                ('partial', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('start', models.DateTimeField()),
+                ('tab', models.CharField(max_length=20)),
+                ('query', models.CharField(max_length=200)),
+                ('searches', models.PositiveIntegerField()),
+                ('zero_hits', models.PositiveIntegerField()),
+                ('partial', models.PositiveIntegerField()),
+                ('slow', models.PositiveIntegerField()),
+                ('total_latency', models.FloatField()),
+                ('max_latency', models.FloatField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('period', 'start', 'tab', 'query'), name='unique_search_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:57
+
+from django.db import migrations, models
+
+
+def convert_replies(apps, schema_editor):
+    """
+    Reply notifications target their discussion instead of the message, so that the unread ones
+    merge with the new replies. Their message no longer starts with the actor name (added when
+    shown), and they list their actor.
+    """
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Message = apps.get_model('base', 'Message')
+    Notification = apps.get_model('base', 'Notification')
+    db_alias = schema_editor.connection.alias
+
+    replies = Notification.objects.using(db_alias).filter(type='discussion_reply')
+    if not replies.exists():
+        return
+    message_type = ContentType.objects.db_manager(db_alias).get_for_model(Message)
+    discussion_type = ContentType.objects.db_manager(db_alias).get_or_create(app_label='base', model='discussion')[0]
+    discussions = dict(
+        Message.objects.using(db_alias)
+        .filter(id__in=replies.filter(content_type=message_type).values('object_id'))
+        .values_list('id', 'discussion_id')
+    )
+
+    for pk, actor_id, message, content_type_id, object_id in replies.values_list(
+            'id', 'actor_id', 'message', 'content_type_id', 'object_id').iterator():
+        target = {}
+        if content_type_id == message_type.id and object_id in discussions:
+            target = {'content_type_id': discussion_type.id, 'object_id': discussions[object_id]}
+        Notification.objects.using(db_alias).filter(pk=pk).update(
+            message=message.split(' ', 1)[-1] if message.startswith('@') else message,
+            actor_ids=[actor_id] if actor_id else [],
+            **target,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0021_notification_target_index'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='actor_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='actor_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(convert_replies, migrations.RunPython.noop),
+    ]
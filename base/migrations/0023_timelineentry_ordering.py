@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:07
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0022_notification_actor_count'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='timelineentry',
+            options={'ordering': ['-publication_id']},
+        ),
+    ]
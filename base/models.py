@@ -1,9 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from . import utils
+from .db import retry_on_lock
+from .routers import bookkeeping
 
 from PyPDF2 import PdfReader
 
@@ -16,7 +18,7 @@ class Topic(models.Model):
         return self.name
     
 class Tag(models.Model):
-    name = models.CharField(max_length=50)
+    name = models.CharField(max_length=50, unique=True) # unique so tags can be bulk created with ignore_conflicts
 
     def __str__(self):
         return self.name
@@ -56,13 +58,24 @@ class Publication(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    # Audience, incremented in batches by counters.py (never with save(), to keep `updated` meaningful)
+    view_count = models.PositiveIntegerField(default=0)
+    download_count = models.PositiveIntegerField(default=0)
+    # Time-decayed popularity, scaled to the TrendingEpoch so it can be incremented without being recomputed
+    trending_score = models.FloatField(default=0, db_index=True)
+
     class Meta:
         ordering = ['-updated', '-created']
+        indexes = [
+            models.Index(fields=['created'], name='publication_created_idx'),  # year: queries
+        ]
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)  # sauvegarde d'abord l'objet
-        if self.user and self.user not in self.authors.all():
-            self.authors.add(self.user)
+        if self.user_id:
+            # add() on an auto-created through table is a single INSERT ... ON CONFLICT IGNORE,
+            # no need to load the authors to test membership
+            self.authors.add(self.user_id)
 
     def get_affiliations_list(self):
         """Return affiliations as a list."""
@@ -82,6 +95,37 @@ class Publication(models.Model):
         return self.theme
     
 
+class TimelineEntry(models.Model):
+    """
+    TimelineEntry class: inherits from django.db.models.Model \n
+    One publication in the personalized "For you" timeline of a user (fan-out on write, see timeline.py).\n
+    Properties:\n
+    user: timeline owner\n
+    publication: the publication pushed to the timeline\n
+    reason: why it is there (an author the user follows, or a favorite topic)\n
+    Entries are read newest first by publication id, which makes the timeline a keyset over
+    the (user, publication) unique index.
+    """
+
+    REASONS = [
+        ('following', 'From someone you follow'),
+        ('topic', 'In one of your favorite topics'),
+    ]
+
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='timeline')
+    publication = models.ForeignKey(Publication, on_delete=models.CASCADE, related_name='+')
+    reason = models.CharField(max_length=20, choices=REASONS)
+
+    class Meta:
+        ordering = ['-publication_id']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'publication'], name='unique_timeline_entry'),
+        ]
+
+    def __str__(self):
+        return f"{self.publication} in {self.user}'s timeline"
+
+
 class Collection(models.Model):
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
     name = models.CharField(max_length=200)
@@ -94,8 +138,43 @@ class Collection(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    # Summary for the sidebars, maintained on CollectionPublication insert/delete (see signals.py)
+    pub_count = models.PositiveIntegerField(default=0, editable=False)
+    last_added = models.DateTimeField(null=True, blank=True, editable=False)
+    cover = models.ForeignKey('Publication', null=True, blank=True, on_delete=models.SET_NULL,
+                              related_name='+', editable=False)
+
     def __str__(self):
         return self.name
+
+    @classmethod
+    def update_summaries(cls, deltas):
+        """
+        Apply publication count changes and point last_added/cover to the latest entry.
+        One UPDATE per collection, the latest entry being read from the (collection, added) index.
+
+        Args:
+            deltas (dict): {collection_id: number of publications added (negative when removed)}
+        """
+        for collection_id, delta in deltas.items():
+            latest = CollectionPublication.objects.filter(collection_id=collection_id).order_by('-added', '-id')
+            cls.objects.filter(pk=collection_id).update(
+                pub_count=models.F('pub_count') + delta,
+                last_added=models.Subquery(latest.values('added')[:1]),
+                cover_id=models.Subquery(latest.values('publication_id')[:1]),
+            )
+
+    @classmethod
+    def refresh_summaries(cls, collection_ids):
+        """Recompute the summaries from scratch (repairs drift, e.g. after raw SQL changes)."""
+        for collection_id in collection_ids:
+            entries = CollectionPublication.objects.filter(collection_id=collection_id)
+            latest = entries.order_by('-added', '-id').values_list('added', 'publication_id').first()
+            cls.objects.filter(pk=collection_id).update(
+                pub_count=entries.count(),
+                last_added=latest[0] if latest else None,
+                cover_id=latest[1] if latest else None,
+            )
     
 
 class CollectionPublication(models.Model):
@@ -106,6 +185,9 @@ class CollectionPublication(models.Model):
     class Meta:
         unique_together = ('collection', 'publication')  # prevent duplicates
         ordering = ['-added']
+        indexes = [
+            models.Index(fields=['collection', '-added'], name='collection_latest_idx'),
+        ]
 
     def __str__(self):
         return f"{self.publication} in {self.collection} (added {self.added})"
@@ -119,16 +201,18 @@ class Notification(models.Model):
     actor: who triggered the notification \n
     type: type of notification (follow, discussion in publication, ...). Default value set in NOTIFICATION_TYPES \n
     target: the object this notification is about, depends on the notification's type. 
-    For follow notification, the target is the follower, for discussion in publication notification, the target is the discussion itself\n
+    For follow notification, the target is the follower, for discussion in publication and discussion reply notifications, the target is the discussion itself\n
     title: notification title\n
-    message: the body of the notification\n
+    message: the body of the notification. For the COALESCED_TYPES, only what follows the actor names ('replied in ...')\n
+    actor_count, actor_ids: number and ids of the distinct actors folded into a notification of the COALESCED_TYPES (actor is the latest)\n
     is_read: read status\n
     is_deleted: deleted status, when deleted stays in database but doesn't show up in notification ever again\n
-    created: date of creation\n
+    created: date of creation, of the latest event for a coalesced notification\n
     read_at: read date\n
     action_url: for redirecting to the target object page
     Methods:\n
-    mark_as_read: marks the notification as read
+    mark_as_read: marks the notification as read\n
+    text: the message shown, "@actor and 12 others replied ..." for the COALESCED_TYPES
     """
 
     NOTIFICATION_TYPES = [
@@ -146,6 +230,10 @@ class Notification(models.Model):
         ('achievement', 'Achievement Unlocked'),
     ] # not exhaustive list, just built it up quickly like that
 
+    # New events of these types update the recipient's unread notification about the same target
+    # instead of adding a row (see NotificationManager.coalesce_notifications)
+    COALESCED_TYPES = {'discussion_reply'}
+
     # Who receives the notification
     recipient = models.ForeignKey(
         get_user_model(), 
@@ -173,6 +261,8 @@ class Notification(models.Model):
     # Notification content
     title = models.CharField(max_length=200)
     message = models.TextField()
+    actor_count = models.PositiveIntegerField(default=1)
+    actor_ids = models.JSONField(default=list, blank=True)
     
     # Status
     is_read = models.BooleanField(default=False)
@@ -190,6 +280,7 @@ class Notification(models.Model):
         indexes = [
             models.Index(fields=['recipient', '-created']),
             models.Index(fields=['recipient', 'is_read']),
+            models.Index(fields=['content_type', 'object_id']),  # targets, swept by compact_notifications
         ]
 
     def __str__(self):
@@ -201,6 +292,15 @@ class Notification(models.Model):
             self.read_at = timezone.now()
             self.save(update_fields=['is_read', 'read_at'])
     
+    @property
+    def text(self):
+        if self.type not in self.COALESCED_TYPES or not self.actor:
+            return self.message
+        others = self.actor_count - 1
+        if others <= 0:
+            return f"@{self.actor.username} {self.message}"
+        return f"@{self.actor.username} and {others} other{'s' if others > 1 else ''} {self.message}"
+
     @property
     def time_since(self):
         from django.utils.timesince import timesince
@@ -322,9 +422,13 @@ class SearchHistory(models.Model):
         return f"{self.user.username}: '{self.query}'"
     
     @classmethod
+    @bookkeeping()
+    @retry_on_lock
+    @transaction.atomic
     def add_search(cls, user, query, search_type='general', clicked_object=None):
         """
         Add or update search history entry.
+        Runs in one transaction, retried on lock contention.
         """
         if not user.is_authenticated or not query.strip():
             return None
@@ -424,9 +528,13 @@ class SearchSuggestion(models.Model):
         return f"'{self.query}' ({self.search_count} searches)"
     
     @classmethod
+    @bookkeeping()
+    @retry_on_lock
+    @transaction.atomic
     def increment_search(cls, query):
         """
         Increment search count for a query.
+        Runs in one transaction, retried on lock contention.
         """
         if not query.strip():
             return None
@@ -454,6 +562,71 @@ class SearchSuggestion(models.Model):
         ).order_by('-search_count')[:limit]
 
 
+class SearchWord(models.Model):
+    """
+    Word of the fuzzy search vocabulary (see fuzzy.py), accent and case folded.\n
+    display: the word as first seen, for "did you mean" suggestions\n
+    gram_count: number of distinct trigrams of the word
+    """
+    word = models.CharField(max_length=100, unique=True)
+    display = models.CharField(max_length=100)
+    gram_count = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return self.word
+
+
+class SearchTrigram(models.Model):
+    """Trigram index of the vocabulary: one row per (trigram, word)."""
+    gram = models.CharField(max_length=3)
+    word = models.ForeignKey(SearchWord, on_delete=models.CASCADE, related_name='trigrams')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['gram', 'word'], name='unique_search_trigram'),
+        ]
+
+
+class SearchPosting(models.Model):
+    """
+    Occurrence of a word in a searched object (publication theme, description or summary, tag,
+    topic or username), with the character offsets of its first occurrences ("12 85").
+    """
+    KINDS = [
+        ('publication', 'Publication theme'),
+        ('description', 'Publication description'),
+        ('summary', 'Publication summary'),
+        ('tag', 'Tag name'),
+        ('topic', 'Topic name'),
+        ('user', 'Username'),
+    ]
+    word = models.ForeignKey(SearchWord, on_delete=models.CASCADE, related_name='postings')
+    kind = models.CharField(max_length=20, choices=KINDS)
+    object_id = models.PositiveBigIntegerField()
+    positions = models.TextField(blank=True, default='')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['word', 'kind', 'object_id'], name='unique_search_posting'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'object_id']),
+        ]
+
+
+class SearchGeneration(models.Model):
+    """
+    Generation counter of a searched model, bumped when one of its objects is saved or deleted.
+    Cached search results (see searchcache.py) remember the generations they were computed with
+    and are stale as soon as one of them changed.
+    """
+    name = models.CharField(max_length=100, primary_key=True)  # model label, e.g. "base.publication"
+    value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
 
 
 
@@ -532,3 +705,85 @@ def get_search_context_from_request(request):
 
 
 
+
+
+class SemanticModel(models.Model):
+    """
+    Latent semantic analysis model of the publications (see semantic.py): vocabulary, inverse
+    document frequencies and the truncated SVD projection of TF-IDF vectors, as float32 arrays.
+    Rebuilding adds a new model; vectors of the previous ones are replaced.
+    """
+    created = models.DateTimeField(auto_now_add=True)
+    dimensions = models.PositiveSmallIntegerField()
+    terms = models.TextField()  # JSON list, the order of the rows of idf and components
+    idf = models.BinaryField()
+    components = models.BinaryField()  # terms x dimensions
+
+    def __str__(self):
+        return f"LSA model {self.pk} ({self.dimensions} dimensions)"
+
+
+class PublicationVector(models.Model):
+    """Unit LSA vector of a publication (float32), computed by the build_semantic_index command."""
+    publication = models.OneToOneField(Publication, on_delete=models.CASCADE, primary_key=True,
+                                       related_name='semantic_vector')
+    model = models.ForeignKey(SemanticModel, on_delete=models.CASCADE, related_name='vectors')
+    vector = models.BinaryField()
+    updated = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Vector of {self.publication_id}"
+
+
+class TrendingEpoch(models.Model):
+    """
+    Single row: time the stored Publication.trending_score values are relative to, moved
+    forward (and the scores scaled down) from time to time by counters.py.
+    """
+    started = models.DateTimeField()
+
+    def __str__(self):
+        return f"Trending scores relative to {self.started:%Y-%m-%d %H:%M}"
+
+
+class SearchLog(models.Model):
+    """
+    One search, appended in batches by searchlog.py and aggregated into SearchRollup by the
+    rollup_search_log command, which also drops the rows past SEARCH_LOG_RETENTION_DAYS.
+    """
+    created = models.DateTimeField(db_index=True)
+    tab = models.CharField(max_length=20)
+    query = models.CharField(max_length=200)  # normalized (see searchcache.normalize_query)
+    latency = models.FloatField()  # milliseconds
+    results = models.PositiveIntegerField()  # results shown, up to the page size
+    zero_hits = models.BooleanField(default=False)
+    partial = models.BooleanField(default=False)  # some categories missed the search deadline
+
+    def __str__(self):
+        return f"{self.tab}: '{self.query}' ({self.latency:.0f} ms)"
+
+
+class SearchRollup(models.Model):
+    """Searches of a (tab, query) during an hour or a day."""
+    PERIODS = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+    period = models.CharField(max_length=4, choices=PERIODS)
+    start = models.DateTimeField()
+    tab = models.CharField(max_length=20)
+    query = models.CharField(max_length=200)
+    searches = models.PositiveIntegerField()
+    zero_hits = models.PositiveIntegerField()
+    partial = models.PositiveIntegerField()
+    slow = models.PositiveIntegerField()  # slower than SEARCH_SLOW_MS
+    total_latency = models.FloatField()  # milliseconds
+    max_latency = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'start', 'tab', 'query'], name='unique_search_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.period} {self.start:%Y-%m-%d %H:00} {self.tab}: '{self.query}' x{self.searches}"
@@ -0,0 +1,345 @@
+# queryparser.py
+
+# Structured publication queries: field qualifiers, quoted phrases and boolean operators.
+#
+#     author:awa tag:nlp "neural networks" -draft
+#     (topic:physics OR topic:chemistry) AND year:2020..2024 NOT school:ucad
+#
+# Terms are ANDed unless OR is given, NOT (or a leading "-") excludes, parentheses group.
+# A qualified term compiles to the narrowest indexed lookup: names are resolved to ids first
+# (usernames and tag names are indexed), then publications are read from the author and tag
+# relation tables or from the topic and created indexes. Free words and phrases keep the
+# icontains OR chain over the publication fields.
+#
+# The terms of an AND run most selective first: qualified terms are estimated with a COUNT on
+# their index, the smallest is read, and the next ones (free text last) only check the ids
+# already found. A query whose precise terms match nothing never runs the multi-join text scan.
+
+import re
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from .facets import chunks
+from .models import Publication, Tag, Topic
+
+FIELDS = ['author', 'tag', 'topic', 'school', 'year']
+OPERATORS = ['AND', 'OR', 'NOT']
+
+# Fields searched by free words and phrases (the publications search of views.getSearchResult)
+TEXT_FIELDS = ['theme', 'topic__name', 'tags__name', 'authors__username', 'description']
+
+# "(", ")", or an optionally negated, optionally qualified word or "phrase"
+TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|(-)?(?:(\w+):)?(?:"([^"]*)"?|([^\s()"]+)))')
+STRUCTURED_RE = re.compile(
+    r'\b(?:%s):\S|"|(?:^|\s)(?:AND|OR|NOT)(?:\s|$)|(?:^|\s)-[^\s-]' % '|'.join(FIELDS)
+)
+YEAR_RE = re.compile(r'^(\d{4})(?:\.\.(\d{4}))?$')
+
+UNSELECTIVE = float('inf')
+
+
+def is_structured(query):
+    """Whether a query uses qualifiers, phrases or operators (plain queries keep the usual search)."""
+    return bool(STRUCTURED_RE.search(query or ''))
+
+
+def tokenize(query):
+    """
+    Tokens of a query: '(' and ')', operators, and ('term', field or None, value, negated).
+    Unbalanced quotes end at the end of the query, unknown qualifiers are part of the word.
+    """
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        match = TOKEN_RE.match(query, position)
+        if not match or match.end() == position:
+            break
+        position = match.end()
+        lparen, rparen, minus, field, phrase, word = match.groups()
+        if lparen:
+            tokens.append('(')
+        elif rparen:
+            tokens.append(')')
+        elif word in OPERATORS and not (minus or field):
+            tokens.append(word)
+        else:
+            value = phrase if phrase is not None else word
+            if field and field.lower() not in FIELDS:
+                value, field = f"{field}:{value}", None
+            if value.strip():
+                tokens.append(('term', field and field.lower(), value.strip(), bool(minus)))
+    return tokens
+
+
+# Query tree. evaluate(candidates) returns the matching publication ids, restricted to the
+# candidates when they are known (a set), and q() the same condition as a Q object.
+
+class Term:
+    def __init__(self, field, value):
+        self.field = field
+        self.value = value
+        self._compiled = None
+        self._estimate = None
+
+    def __repr__(self):
+        return f"{self.field or 'text'}:{self.value!r}"
+
+    def compile(self):
+        """(queryset, column holding the publication id), or None when nothing can match."""
+        if self._compiled is None:
+            self._compiled = self.lookup() or (None, None)
+        return self._compiled if self._compiled[0] is not None else None
+
+    def lookup(self):
+        if self.field is None:
+            text = Q()
+            for field in TEXT_FIELDS:
+                text |= Q(**{f"{field}__icontains": self.value})
+            return Publication.objects.filter(text).distinct(), 'id'
+
+        if self.field == 'year':
+            match = YEAR_RE.match(self.value)
+            if not match:
+                return None
+            first = int(match.group(1))
+            last = int(match.group(2) or first)
+            # A range of created, which is indexed (unlike created__year on SQLite)
+            return Publication.objects.filter(
+                created__gte=datetime(first, 1, 1, tzinfo=timezone.utc),
+                created__lt=datetime(last + 1, 1, 1, tzinfo=timezone.utc),
+            ), 'id'
+
+        if self.field in ('author', 'school'):
+            if self.field == 'author':
+                users = resolve(get_user_model(), 'username', self.value)
+            else:
+                users = list(get_user_model().objects.filter(school__iexact=self.value).values_list('pk', flat=True))
+            if not users:
+                return None
+            return Publication.authors.through.objects.filter(user_id__in=users), 'publication_id'
+
+        if self.field == 'tag':
+            tags = resolve(Tag, 'name', self.value)
+            return (Publication.tags.through.objects.filter(tag_id__in=tags), 'publication_id') if tags else None
+
+        topics = resolve(Topic, 'name', self.value)
+        return (Publication.objects.filter(topic_id__in=topics), 'id') if topics else None
+
+    def estimate(self):
+        """Number of matching publications (free text is never counted: it is the scan we avoid)."""
+        if self._estimate is None:
+            compiled = self.compile()
+            if compiled is None:
+                self._estimate = 0
+            elif self.field is None:
+                self._estimate = UNSELECTIVE
+            else:
+                self._estimate = compiled[0].count()
+        return self._estimate
+
+    def evaluate(self, candidates=None):
+        compiled = self.compile()
+        if compiled is None or candidates is not None and not candidates:
+            return set()
+        queryset, column = compiled
+        queryset = queryset.order_by()
+        if candidates is None or self.estimate() <= len(candidates):
+            # Reading this term whole is cheaper than checking the candidates one batch at a time
+            ids = set(queryset.values_list(column, flat=True))
+            return ids if candidates is None else ids & candidates
+        ids = set()
+        for batch in chunks(sorted(candidates)):
+            ids.update(queryset.filter(**{f"{column}__in": batch}).values_list(column, flat=True))
+        return ids
+
+    def q(self):
+        compiled = self.compile()
+        if compiled is None:
+            return Q(pk__in=[])
+        queryset, column = compiled
+        return Q(pk__in=queryset.values(column))
+
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+
+    def __repr__(self):
+        return f"NOT {self.child!r}"
+
+    def estimate(self):
+        return UNSELECTIVE
+
+    def evaluate(self, candidates=None):
+        if candidates is None:
+            candidates = set(Publication.objects.order_by().values_list('id', flat=True))
+        return candidates - self.child.evaluate(candidates)
+
+    def q(self):
+        return ~self.child.q()
+
+
+class And:
+    def __init__(self, children):
+        self.children = children
+
+    def __repr__(self):
+        return f"({' AND '.join(map(repr, self.children))})"
+
+    def estimate(self):
+        return min((child.estimate() for child in self.children if not isinstance(child, Not)),
+                   default=UNSELECTIVE)
+
+    def evaluate(self, candidates=None):
+        # Most selective first, every term narrowing the candidates of the next ones
+        positive = [child for child in self.children if not isinstance(child, Not)]
+        negative = [child.child for child in self.children if isinstance(child, Not)]
+        for child in sorted(positive, key=lambda child: child.estimate()):
+            candidates = child.evaluate(candidates)
+            if not candidates:
+                return set()
+        if candidates is None:
+            candidates = set(Publication.objects.order_by().values_list('id', flat=True))
+        for child in sorted(negative, key=lambda child: child.estimate()):
+            candidates = candidates - child.evaluate(candidates)
+            if not candidates:
+                break
+        return candidates
+
+    def q(self):
+        condition = Q()
+        for child in self.children:
+            condition &= child.q()
+        return condition
+
+
+class Or:
+    def __init__(self, children):
+        self.children = children
+
+    def __repr__(self):
+        return f"({' OR '.join(map(repr, self.children))})"
+
+    def estimate(self):
+        return sum(child.estimate() for child in self.children)
+
+    def evaluate(self, candidates=None):
+        return set().union(*(child.evaluate(candidates) for child in self.children))
+
+    def q(self):
+        condition = Q(pk__in=[])
+        for child in self.children:
+            condition |= child.q()
+        return condition
+
+
+def resolve(model, field, value):
+    """Ids of the objects named value: exact match on the (indexed) field, else ignoring case."""
+    ids = list(model.objects.filter(**{field: value}).values_list('pk', flat=True))
+    return ids or list(model.objects.filter(**{f"{field}__iexact": value}).values_list('pk', flat=True))
+
+
+class Parser:
+    """
+    Recursive descent over the tokens, lenient: unbalanced parentheses and dangling
+    operators are ignored rather than reported.
+
+        query := or+
+        or    := and ("OR" and)*
+        and   := unary (["AND"] unary)*
+        unary := "NOT" unary | "(" or ")" | term
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self):
+        nodes = []
+        while self.peek() is not None:
+            node = self.parse_or()
+            if node is not None:
+                nodes.append(node)
+            if self.peek() in (')', 'OR', 'AND'):
+                self.next()  # stray
+        return combine(And, nodes)
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() == 'OR':
+            self.next()
+            nodes.append(self.parse_and())
+        return combine(Or, [node for node in nodes if node is not None])
+
+    def parse_and(self):
+        nodes = []
+        while self.peek() not in (None, ')', 'OR'):
+            if self.peek() == 'AND':
+                self.next()
+                continue
+            node = self.parse_unary()
+            if node is not None:
+                nodes.append(node)
+        return combine(And, nodes)
+
+    def parse_unary(self):
+        token = self.next()
+        if token == 'NOT':
+            if self.peek() in (None, ')', 'OR', 'AND'):
+                return None
+            child = self.parse_unary()
+            return Not(child) if child is not None else None
+        if token == '(':
+            node = self.parse_or()
+            if self.peek() == ')':
+                self.next()
+            return node
+        _, field, value, negated = token
+        term = Term(field, value)
+        return Not(term) if negated else term
+
+
+def combine(node_class, nodes):
+    if not nodes:
+        return None
+    return nodes[0] if len(nodes) == 1 else node_class(nodes)
+
+
+def parse(query):
+    """Query tree of a query, or None when it holds no term."""
+    return Parser(tokenize(query or '')).parse()
+
+
+def queryset(query):
+    """Publications matching a structured query, as one SQL query (for listings and exports)."""
+    tree = parse(query)
+    if tree is None:
+        return Publication.objects.none()
+    return Publication.objects.filter(tree.q())
+
+
+def search(query, limit=30):
+    """
+    Ids of the publications matching a structured query, terms run most selective first,
+    in the usual order of publications (last updated first).
+    """
+    tree = parse(query)
+    if tree is None:
+        return []
+    ids = tree.evaluate()
+    rows = []
+    for batch in chunks(sorted(ids)):
+        rows += Publication.objects.filter(id__in=batch).values_list('updated', 'created', 'id')
+    rows.sort(reverse=True)
+    return [pk for _, _, pk in rows[:limit]]
@@ -0,0 +1,171 @@
+# ratelimit.py
+
+# Token bucket rate limiting for the expensive routes (search, autocomplete, pdf).
+# Limits are configured per route name in settings.RATELIMITS, e.g. {'base:search': '30/m'}:
+# a bucket holds at most 30 tokens and refills at 30 tokens per minute, one request costs one token.
+# Buckets are keyed by route and by client (user id when logged in, IP address otherwise).
+
+import math
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    Parse a rate string ("30/m", "5/s", "1000/h") into (capacity, refill per second).
+    """
+    count, period = rate.split('/')
+    count = int(count)
+    return count, count / PERIODS[period.strip().lower()[0]]
+
+
+def client_key(request):
+    """Identify the client: user id when authenticated, IP address otherwise."""
+    if request.user.is_authenticated:
+        return f"user:{request.user.id}"
+    ip = request.META.get('REMOTE_ADDR', '')
+    if getattr(settings, 'RATELIMIT_TRUST_X_FORWARDED_FOR', False):
+        ip = request.META.get('HTTP_X_FORWARDED_FOR', ip).split(',')[0].strip()
+    return f"ip:{ip}"
+
+
+def refill(tokens, updated, now, capacity, per_second):
+    """Tokens available at `now` for a bucket last seen at `updated`."""
+    return min(capacity, tokens + (now - updated) * per_second)
+
+
+class MemoryBackend:
+    """
+    Buckets kept in this process (one set of buckets per worker).
+    The least recently used buckets are dropped past max_entries, a dropped bucket simply starts full again.
+    """
+
+    def __init__(self, max_entries=100_000):
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+
+    def take(self, key, capacity, per_second):
+        """
+        Take one token from the bucket.
+
+        Returns:
+            float: 0 if the request is allowed, otherwise the seconds to wait for the next token
+        """
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (capacity, now))
+            tokens = refill(tokens, updated, now, capacity, per_second)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / per_second
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+        return wait
+
+
+class SQLiteBackend:
+    """
+    Buckets shared by all the workers of a host through a small SQLite file (separate from the main database).
+    Each take() is one short IMMEDIATE transaction.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF") # losing a few tokens on a crash is fine
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self.local.connection = connection
+        return connection
+
+    def take(self, key, capacity, per_second):
+        now = time.time() # wall clock, shared between processes
+        connection = self.connection
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT tokens, updated FROM bucket WHERE key = ?", (key,)).fetchone()
+            tokens = refill(*row, now, capacity, per_second) if row else capacity
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / per_second
+            connection.execute(
+                "INSERT INTO bucket (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now),
+            )
+            connection.execute("COMMIT")
+        except sqlite3.OperationalError:
+            # The limiter must never take the site down: let the request through
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            return 0.0
+        return wait
+
+
+class RateLimiter:
+    """
+    Applies settings.RATELIMITS and keeps the allowed/rejected counters of this process.
+    """
+
+    def __init__(self):
+        self.limits = {name: parse_rate(rate) for name, rate in getattr(settings, 'RATELIMITS', {}).items()}
+        if getattr(settings, 'RATELIMIT_BACKEND', 'memory') == 'sqlite':
+            self.backend = SQLiteBackend(settings.RATELIMIT_SQLITE_PATH)
+        else:
+            self.backend = MemoryBackend()
+        self.allowed = Counter()
+        self.rejected = Counter()
+
+    def check(self, route, request):
+        """
+        Returns:
+            int|None: None when the request may go on, otherwise the Retry-After value in seconds
+        """
+        limit = self.limits.get(route)
+        if limit is None:
+            return None
+
+        wait = self.backend.take(f"{route}:{client_key(request)}", *limit)
+        if wait:
+            self.rejected[route] += 1
+            return max(1, math.ceil(wait))
+        self.allowed[route] += 1
+        return None
+
+    def stats(self):
+        """Counters for monitoring (this worker only)."""
+        return {
+            route: {'rate': getattr(settings, 'RATELIMITS')[route], 'allowed': self.allowed[route],
+                    'rejected': self.rejected[route]}
+            for route in self.limits
+        }
+
+
+_limiter = None
+
+def get_limiter():
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter()
+    return _limiter
@@ -0,0 +1,48 @@
+# relations.py
+
+# Follower and following lists: keyset pages and follow state of the viewer.
+#
+# Lists are read in username order, continuing after the last username of the previous page
+# rather than with an OFFSET, and can be narrowed to the usernames holding a search string.
+# Whether the viewer follows the users of a page is read with one query returning the followed
+# ids, instead of one EXISTS per row (the is_following template filter).
+
+
+def page(users, after=None, limit=50, query=None):
+    """
+    One page of a list of users (user.followers or user.following), by username.
+
+    Args:
+        users (QuerySet): the users of the list
+        after (str, optional): keyset cursor returned with the previous page (last username)
+        limit (int): page size
+        query (str, optional): only the usernames containing it (case insensitive)
+
+    Returns:
+        tuple: (list of User, cursor for the next page or None)
+    """
+    if query:
+        users = users.filter(username__icontains=query)
+    if after:
+        users = users.filter(username__gt=after)
+
+    # One more row tells whether there is a next page
+    rows = list(users.order_by('username')[:limit + 1])
+    items = rows[:limit]
+    next_cursor = items[-1].username if len(rows) > limit else None
+    return items, next_cursor
+
+
+def followed_ids(viewer, users):
+    """Ids of the users the viewer follows among users, in one query."""
+    if not viewer.is_authenticated or not users:
+        return set()
+    return set(viewer.following.filter(id__in=[user.id for user in users]).values_list('id', flat=True))
+
+
+def mark_followed(viewer, users):
+    """Set the followed attribute of users: whether the viewer follows them."""
+    followed = followed_ids(viewer, users)
+    for user in users:
+        user.followed = user.id in followed
+    return users
@@ -0,0 +1,97 @@
+# routers.py
+
+# Read/write split between the primary database ('default') and the read replicas
+# listed in settings.DATABASE_REPLICAS.
+#
+# Replicas lag behind the primary, so a user who just wrote something (posted a message,
+# followed someone, ...) would not see it if the next page read from a replica. The
+# ReplicaStickinessMiddleware pins the session to the primary for REPLICA_STICKY_SECONDS
+# after a request that wrote to the database; the requests doing the writes read from
+# the primary as well. Bookkeeping writes (counters, search log, suggestions) made while
+# serving a page are not something the user reads back: they run in bookkeeping() and do not
+# pin the session.
+
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+PRIMARY = 'default'
+PIN_SESSION_KEY = '_db_pinned_until'
+
+# Per request state, set by ReplicaStickinessMiddleware
+_pinned = ContextVar('db_pinned', default=False)
+_wrote = ContextVar('db_wrote', default=False)
+_bookkeeping = ContextVar('db_bookkeeping', default=False)
+
+
+def pin_to_primary():
+    """Send the reads of the current request to the primary."""
+    _pinned.set(True)
+
+
+@contextmanager
+def bookkeeping():
+    """Writes made inside (as a with block or a decorator) do not pin the session to the primary."""
+    token = _bookkeeping.set(True)
+    try:
+        yield
+    finally:
+        _bookkeeping.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Reads go to a random replica (unless the request is pinned), writes and migrations to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        # Sessions hold the pin itself, they are always read from the primary
+        if not replicas or _pinned.get() or _wrote.get() or model._meta.app_label == 'sessions':
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # Session writes happen on every request with a session, they don't need read-your-writes
+        if model._meta.app_label != 'sessions' and not _bookkeeping.get():
+            _wrote.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas are copies of the primary: objects from any alias can be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Pins a session to the primary for REPLICA_STICKY_SECONDS after it wrote to the database.
+    Must come after SessionMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'DATABASE_REPLICAS', []):
+            return self.get_response(request)
+
+        pinned_until = request.session.get(PIN_SESSION_KEY, 0)
+        pinned = _pinned.set(pinned_until > time.time() or request.method not in ('GET', 'HEAD', 'OPTIONS'))
+        wrote = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if _wrote.get():
+                request.session[PIN_SESSION_KEY] = time.time() + getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+            elif pinned_until and pinned_until <= time.time():
+                del request.session[PIN_SESSION_KEY]
+        finally:
+            _pinned.reset(pinned)
+            _wrote.reset(wrote)
+        return response
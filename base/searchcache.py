@@ -0,0 +1,208 @@
+# searchcache.py
+
+# Cache of search results, as lists of ids keyed by (category, normalized query, limit).
+#
+# Switching tabs or coming back to a result page repeats the same multi-join icontains
+# queries. Results are cached per worker in a bounded LRU, together with the generations of
+# the models they depend on (SearchGeneration rows, bumped on save/delete of a searched model,
+# once the transaction is committed). Reading all the generations is one query on a tiny table:
+# a cached entry whose generations changed is recomputed. Objects are rehydrated with one
+# in_bulk() plus the prefetches the templates need.
+
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, QuerySet, prefetch_related_objects
+
+from .db import retry_on_lock
+
+
+# Models whose changes can change the results of each search category
+DEPENDENCIES = {
+    'publications': ['base.publication', 'base.topic', 'base.tag', 'authentification.user'],
+    'authors': ['authentification.user', 'base.publication'],
+    'collections': ['base.collection', 'base.publication', 'base.topic', 'base.tag', 'authentification.user'],
+    'discussions': ['base.discussion', 'base.publication', 'base.topic', 'base.tag', 'authentification.user'],
+    'profiles': ['authentification.user'],
+    'tags': ['base.tag'],
+}
+
+# Relations used by the search templates, fetched when rehydrating
+PREFETCH = {
+    'publications': ['topic', 'authors'],
+    'collections': ['user'],
+    'discussions': ['creator', 'publication__authors', 'participants'],
+}
+
+# Long texts the search templates do not show (they show snippets of them, see snippets.py)
+DEFER = {
+    'publications': ['description', 'summary'],
+}
+
+WHITESPACE = re.compile(r'\s+')
+ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+def normalize_query(query):
+    """
+    Collapse whitespace and lower ASCII letters. The search runs on the normalized query too,
+    so equivalent queries share a cache entry (icontains ignores ASCII case on every backend).
+    Structured queries keep their case: operators are uppercase (see queryparser.py).
+    """
+    from .queryparser import is_structured
+
+    query = WHITESPACE.sub(' ', query or '').strip()
+    return query if is_structured(query) else query.translate(ASCII_LOWER)
+
+
+class ResultCache:
+    """
+    Least recently used cache of id lists (or of objects with a size() method, like facet
+    indexes), bounded by SEARCH_CACHE_MAX_ENTRIES (this worker only).
+    """
+
+    def __init__(self, max_entries=None):
+        self.entries = OrderedDict()  # key -> (generations, value, size in bytes)
+        self.lock = threading.Lock()
+        self.max_entries = max_entries or getattr(settings, 'SEARCH_CACHE_MAX_ENTRIES', 2000)
+        self.size = 0
+        self.hits = self.misses = self.stale = self.evictions = 0
+
+    def get(self, key, generations):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != generations:
+                self.stale += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, generations, value):
+        if hasattr(value, 'size'):
+            size = value.size()
+        else:
+            value = tuple(value)
+            # Approximate memory: the tuple and its ints
+            size = sys.getsizeof(value) + sum(sys.getsizeof(i) for i in value)
+        size += sum(sys.getsizeof(k) for k in key)
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous:
+                self.size -= previous[2]
+            self.entries[key] = (generations, value, size)
+            self.size += size
+            while len(self.entries) > self.max_entries:
+                _, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """Counters for monitoring (this worker only)."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+_cache = None
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = ResultCache()
+    return _cache
+
+
+def generations():
+    """Current generation of every searched model, {label: value}, in one query."""
+    from .models import SearchGeneration
+
+    return dict(SearchGeneration.objects.values_list('name', 'value'))
+
+
+@retry_on_lock
+def bump_now(label):
+    from .models import SearchGeneration
+
+    if not SearchGeneration.objects.filter(name=label).update(value=F('value') + 1):
+        SearchGeneration.objects.bulk_create([SearchGeneration(name=label, value=1)], ignore_conflicts=True)
+
+
+def bump(label):
+    """
+    Invalidate the cached results depending on a model, once the current transaction is committed
+    (bumping earlier would let a concurrent search cache the old results under the new generation).
+    """
+    transaction.on_commit(lambda: bump_now(label))
+
+
+def cached(key, dependencies, compute, current_generations=None):
+    """
+    Value cached under key, recomputed when one of the dependencies (model labels) changed.
+    """
+    current_generations = generations() if current_generations is None else current_generations
+    versions = tuple(current_generations.get(label, 0) for label in dependencies)
+
+    cache = get_cache()
+    value = cache.get(key, versions)
+    if value is None:
+        value = compute()
+        if not hasattr(value, 'size'):
+            value = tuple(value)
+        cache.set(key, versions, value)
+    return value
+
+
+def rehydrate(category, model, ids):
+    """Objects of a list of ids, in the same order, with PREFETCH[category] fetched and DEFER[category] not."""
+    objects = model.objects.defer(*DEFER.get(category, ())).in_bulk(ids)
+    results = [objects[pk] for pk in ids if pk in objects]
+    if PREFETCH.get(category):
+        prefetch_related_objects(results, *PREFETCH[category])
+    return results
+
+
+def fetch(category, model, query, limit, compute, current_generations=None):
+    """
+    Objects of a search category, from the cache when its dependencies did not change.
+
+    Args:
+        category (str): search category (key of DEPENDENCIES)
+        model (Model): searched model
+        query (str): normalized query
+        limit (int): maximum number of results
+        compute (callable): returns the results (queryset or list of ids) when they are not cached
+        current_generations (dict, optional): result of generations(), to share it between categories
+
+    Returns:
+        list: model instances, in the order of the search, with PREFETCH[category] fetched
+    """
+    def ids():
+        results = compute()
+        if isinstance(results, QuerySet):
+            results = results.values_list('pk', flat=True)[:limit]
+        return list(results)[:limit]
+
+    return rehydrate(category, model, cached((category, query, limit), DEPENDENCIES[category], ids, current_generations))
@@ -0,0 +1,108 @@
+# searchlog.py
+
+# Log of the searches: tab, normalized query, latency, number of results.
+#
+# Like the counters (see counters.py), entries are buffered in memory per worker and appended
+# with one bulk INSERT every SEARCH_LOG_FLUSH_INTERVAL seconds or SEARCH_LOG_FLUSH_SIZE searches,
+# so logging adds no write to the request. The rollup_search_log command aggregates the log
+# by hour and by day (SearchRollup); the search report reads the rollups.
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .db import retry_on_lock
+from .routers import bookkeeping
+
+logger = logging.getLogger(__name__)
+
+
+class SearchLogBuffer:
+    """In-memory buffer of SearchLog rows not written yet."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.written = self.dropped = 0
+
+    def record(self, tab, query, latency, results, partial=False):
+        """
+        Log one search, flushing the buffer if it is due.
+
+        Args:
+            tab (str): search tab ('all', 'publications', ...) or 'home'
+            query (str): normalized query
+            latency (float): seconds
+            results (int): number of results shown
+            partial (bool): whether some categories missed the search deadline
+        """
+        from .models import SearchLog
+
+        entry = SearchLog(
+            created=timezone.now(), tab=tab, query=query[:200], latency=latency * 1000,
+            results=results, zero_hits=not results, partial=partial,
+        )
+        with self.lock:
+            self.pending.append(entry)
+            due = (
+                len(self.pending) >= getattr(settings, 'SEARCH_LOG_FLUSH_SIZE', 500)
+                or time.monotonic() - self.last_flush >= getattr(settings, 'SEARCH_LOG_FLUSH_INTERVAL', 10)
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Append the pending entries with one INSERT."""
+        with self.lock:
+            pending, self.pending = self.pending, []
+            self.last_flush = time.monotonic()
+        if not pending:
+            return
+
+        try:
+            self.write(pending)
+        except Exception:
+            logger.exception("Could not write the search log")
+            with self.lock:
+                # Kept for the next flush, unless the buffer keeps growing
+                room = 10 * getattr(settings, 'SEARCH_LOG_FLUSH_SIZE', 500) - len(self.pending)
+                self.dropped += max(0, len(pending) - room)
+                self.pending[:0] = pending[-room:] if room > 0 else []
+            return
+
+        with self.lock:
+            self.written += len(pending)
+
+    @bookkeeping()
+    @retry_on_lock
+    def write(self, pending):
+        from .models import SearchLog
+
+        SearchLog.objects.bulk_create(pending)
+
+    def stats(self):
+        """Counters for monitoring (this worker only)."""
+        with self.lock:
+            return {'pending': len(self.pending), 'written': self.written, 'dropped': self.dropped}
+
+
+buffer = SearchLogBuffer()
+atexit.register(buffer.flush)
+
+
+def count(results):
+    """Number of results of getSearchResult() (a list, or {category: list} for the 'all' tab)."""
+    if isinstance(results, dict):
+        return sum(len(value) for key, value in results.items() if key != 'timed_out')
+    return len(results)
+
+
+def record(tab, query, started, results):
+    """Log a search that started at time.monotonic() value started."""
+    partial = bool(isinstance(results, dict) and results.get('timed_out'))
+    buffer.record(tab, query, time.monotonic() - started, count(results), partial)
@@ -0,0 +1,375 @@
+# semantic.py
+
+# "Semantically similar" publications: latent semantic analysis and an approximate
+# nearest neighbour index, on the CPU, without external services.
+#
+# The build_semantic_index command turns the theme, description, summary, topic and tags of
+# every publication into a TF-IDF vector, reduces them with a randomized truncated SVD (Halko et
+# al.) and stores unit vectors of SEMANTIC_DIMENSIONS floats. Publications that share few words
+# but appear in similar contexts ("microfinance", "crédit rural") end up close. Later runs only
+# fold in the new and updated publications with the stored projection; --rebuild refits it.
+#
+# Each worker loads the vectors in an inverted file index (IVF): about sqrt(n) centroids fitted
+# by spherical k-means, every vector listed under its closest centroid. A query compares itself
+# to the centroids, scans the lists of the SEMANTIC_PROBES closest ones and ranks them by exact
+# cosine similarity, all in a few matrix products. New and updated vectors are appended to
+# their list as they are written; centroids are refitted when the index doubled.
+
+import json
+import math
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+
+from . import fuzzy
+from .models import Publication, PublicationVector, SemanticModel
+
+STORED = np.float32
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def tokens(text):
+    """Folded words of a text (the words of the fuzzy index), repeated as they occur."""
+    return [word for word in fuzzy.WORD_RE.findall(fuzzy.fold(text))
+            if fuzzy.MIN_WORD_LENGTH <= len(word) <= 100]
+
+
+def documents(publications, chunk_size=1000):
+    """
+    Yield (publication id, token counts) of a queryset of publications, with their topic and tags.
+    """
+    batch = []
+    rows = publications.order_by('pk').values_list('id', 'theme', 'description', 'summary', 'topic__name')
+    for row in rows.iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) == chunk_size:
+            yield from _documents(batch)
+            batch = []
+    yield from _documents(batch)
+
+
+def _documents(rows):
+    if not rows:
+        return
+    tags = {}
+    for publication_id, name in Publication.tags.through.objects.filter(
+            publication_id__in=[row[0] for row in rows]).values_list('publication_id', 'tag__name'):
+        tags.setdefault(publication_id, []).append(name)
+    for pk, *texts in rows:
+        yield pk, Counter(tokens(' '.join(filter(None, [*texts, *tags.get(pk, ())]))))
+
+
+# Sparse TF-IDF rows, as coordinate arrays sorted by row (numpy has no sparse matrices)
+
+class SparseRows:
+    def __init__(self, rows, cols, values, shape):
+        self.rows, self.cols, self.values, self.shape = rows, cols, values, shape
+
+    @classmethod
+    def tfidf(cls, counts, columns, idf):
+        """
+        Unit TF-IDF rows ((1 + log tf) * idf) of token counts.
+
+        Args:
+            counts (list): Counter of tokens per document
+            columns (dict): {term: column}
+            idf (ndarray): inverse document frequency of each column
+        """
+        rows, cols, values = [], [], []
+        for row, document in enumerate(counts):
+            terms = [(columns[term], 1 + math.log(count)) for term, count in document.items() if term in columns]
+            if not terms:
+                continue
+            columns_of_row = np.array([column for column, _ in terms])
+            weights = np.array([weight for _, weight in terms]) * idf[columns_of_row]
+            rows.append(np.full(len(terms), row))
+            cols.append(columns_of_row)
+            values.append(weights / np.linalg.norm(weights))
+        if not rows:
+            return cls(np.zeros(0, int), np.zeros(0, int), np.zeros(0), (len(counts), len(idf)))
+        return cls(np.concatenate(rows), np.concatenate(cols), np.concatenate(values), (len(counts), len(idf)))
+
+    @staticmethod
+    def _product(rows, cols, values, dense, size, chunk=200000):
+        """Sum of values * dense[cols] grouped by rows (sorted), in chunks to bound memory."""
+        out = np.zeros((size, dense.shape[1]))
+        for start in range(0, len(rows), chunk):
+            r, c, v = rows[start:start + chunk], cols[start:start + chunk], values[start:start + chunk]
+            boundaries = np.flatnonzero(np.r_[True, r[1:] != r[:-1]])
+            out[r[boundaries]] += np.add.reduceat(v[:, None] * dense[c], boundaries, axis=0)
+        return out
+
+    def dot(self, dense):
+        """self @ dense"""
+        return self._product(self.rows, self.cols, self.values, dense, self.shape[0])
+
+    def tdot(self, dense):
+        """self.T @ dense"""
+        order = np.argsort(self.cols, kind='stable')
+        return self._product(self.cols[order], self.rows[order], self.values[order], dense, self.shape[1])
+
+
+def truncated_svd(matrix, dimensions, iterations=4, oversampling=10, seed=0):
+    """
+    Right singular vectors of the largest singular values (terms x dimensions), by randomized
+    range finding with power iterations.
+    """
+    rng = np.random.default_rng(seed)
+    size = dimensions + oversampling
+    basis, _ = np.linalg.qr(matrix.dot(rng.standard_normal((matrix.shape[1], size))))
+    for _ in range(iterations):
+        transposed, _ = np.linalg.qr(matrix.tdot(basis))
+        basis, _ = np.linalg.qr(matrix.dot(transposed))
+    small = matrix.tdot(basis).T  # basis.T @ matrix, size x terms
+    _, _, vt = np.linalg.svd(small, full_matrices=False)
+    return vt[:dimensions].T
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class Projection:
+    """A SemanticModel loaded in memory: encodes token counts to unit vectors."""
+
+    def __init__(self, model):
+        self.pk = model.pk
+        self.terms = json.loads(model.terms)
+        self.columns = {term: column for column, term in enumerate(self.terms)}
+        self.idf = np.frombuffer(bytes(model.idf), dtype=STORED).astype(float)
+        self.components = np.frombuffer(bytes(model.components), dtype=STORED).reshape(len(self.terms), -1)
+
+    @classmethod
+    def fit(cls, counts, dimensions):
+        """
+        Fit a model on the token counts of the publications.
+
+        Returns:
+            SemanticModel: unsaved
+        """
+        frequencies = Counter(term for document in counts for term in document)
+        # Words of a single publication carry no relation, words of most of them no meaning
+        most = max(2, len(counts) // 2)
+        kept = [term for term, frequency in frequencies.most_common() if 2 <= frequency <= most]
+        terms = sorted(kept[:setting('SEMANTIC_MAX_TERMS', 50000)])
+        dimensions = min(dimensions, len(terms) - 1, len(counts) - 1)
+        if dimensions < 2:
+            return None
+        idf = np.array([math.log((1 + len(counts)) / (1 + frequencies[term])) + 1 for term in terms])
+        matrix = SparseRows.tfidf(counts, {term: column for column, term in enumerate(terms)}, idf)
+        components = truncated_svd(matrix, dimensions)
+        return SemanticModel(
+            dimensions=dimensions,
+            terms=json.dumps(terms),
+            idf=idf.astype(STORED).tobytes(),
+            components=components.astype(STORED).tobytes(),
+        )
+
+    def encode(self, counts):
+        """Unit vectors (float32 rows) of a list of token counts, zero for documents without known terms."""
+        matrix = SparseRows.tfidf(counts, self.columns, self.idf)
+        return normalize(matrix.dot(self.components)).astype(STORED)
+
+
+class InvertedLists:
+    """
+    Approximate nearest neighbours by cosine similarity over the rows of a growing matrix
+    (inverted file): rows are grouped around centroids fitted by spherical k-means, a query
+    scans the lists of its closest centroids.
+    """
+
+    def __init__(self, probes=8, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.probes = probes
+        self.centroids = None
+        self.lists = []
+        self.built_size = 0
+
+    def build(self, vectors, rows, iterations=10):
+        rows = np.asarray(rows, dtype=int)
+        self.built_size = len(rows)
+        if not len(rows):
+            self.centroids, self.lists = None, []
+            return
+        count = max(1, int(math.sqrt(len(rows))))
+        sample = vectors[self.rng.choice(rows, min(len(rows), 50 * count), replace=False)]
+        centroids = sample[self.rng.choice(len(sample), count, replace=False)]
+        for _ in range(iterations):
+            assigned = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assigned, sample)
+            # Empty lists keep their centroid
+            filled = np.bincount(assigned, minlength=count) > 0
+            centroids[filled] = normalize(sums[filled])
+        self.centroids = centroids
+        self.lists = [[] for _ in range(count)]
+        for start in range(0, len(rows), 10000):
+            chunk = rows[start:start + 10000]
+            for row, list_index in zip(chunk.tolist(), np.argmax(vectors[chunk] @ centroids.T, axis=1).tolist()):
+                self.lists[list_index].append(row)
+
+    def add(self, vectors, row):
+        self.lists[int(np.argmax(self.centroids @ vectors[row]))].append(row)
+
+    def candidates(self, vector, count):
+        """Rows of the lists closest to vector: the SEMANTIC_PROBES closest, and more until count rows."""
+        if self.centroids is None:
+            return np.zeros(0, dtype=int)
+        found, total = [], 0
+        for list_index in np.argsort(-(self.centroids @ vector)).tolist():
+            if len(found) >= self.probes and total >= count:
+                break
+            found.append(self.lists[list_index])
+            total += len(self.lists[list_index])
+        return np.fromiter((row for rows in found for row in rows), dtype=int, count=total)
+
+
+class SemanticIndex:
+    """
+    Vectors of the current model with their inverted lists (this worker only), refreshed from
+    the database every SEMANTIC_REFRESH_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.projection = None
+        self.lists = None
+        self.vectors = np.zeros((0, 0), dtype=STORED)
+        self.alive = np.zeros(0, dtype=bool)  # rows holding the current vector of a publication
+        self.ids = []        # row -> publication id
+        self.rows = {}       # publication id -> current row
+        self.size = 0
+        self.last_updated = None
+        self.checked = 0.0
+        self.queries = self.refreshes = 0
+
+    def refresh(self, force=False):
+        with self.lock:
+            if not force and time.monotonic() - self.checked < setting('SEMANTIC_REFRESH_INTERVAL', 60):
+                return
+            self.checked = time.monotonic()
+            latest = SemanticModel.objects.order_by('-pk').first()
+            if latest is None:
+                self.projection = self.lists = None
+                return
+            if self.projection is None or self.projection.pk != latest.pk:
+                self.projection = Projection(latest)
+                self.vectors = np.zeros((1024, latest.dimensions), dtype=STORED)
+                self.alive = np.zeros(1024, dtype=bool)
+                self.ids, self.rows, self.size, self.last_updated = [], {}, 0, None
+                self.lists = InvertedLists(setting('SEMANTIC_PROBES', 8))
+            self._load()
+            self.refreshes += 1
+
+    def _load(self):
+        vectors = PublicationVector.objects.filter(model_id=self.projection.pk).order_by('updated')
+        if self.last_updated is not None:
+            vectors = vectors.filter(updated__gt=self.last_updated)
+        added = []
+        for pk, vector, updated in vectors.values_list('publication_id', 'vector', 'updated').iterator(chunk_size=2000):
+            if self.size == len(self.vectors):
+                self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+                self.alive = np.concatenate([self.alive, np.zeros_like(self.alive)])
+            # An updated publication gets a new row, its previous one is dropped from the results
+            if pk in self.rows:
+                self.alive[self.rows[pk]] = False
+            self.vectors[self.size] = np.frombuffer(bytes(vector), dtype=STORED)
+            self.alive[self.size] = self.vectors[self.size].any()
+            self.ids.append(pk)
+            self.rows[pk] = self.size
+            if self.alive[self.size]:
+                added.append(self.size)
+            self.size += 1
+            self.last_updated = updated
+
+        # Deleted publications (their vectors go with them)
+        if len(self.rows) != PublicationVector.objects.filter(model_id=self.projection.pk).count():
+            existing = set(PublicationVector.objects.filter(model_id=self.projection.pk).values_list(
+                'publication_id', flat=True))
+            for pk in [pk for pk in self.rows if pk not in existing]:
+                self.alive[self.rows.pop(pk)] = False
+
+        # The centroids are fitted again when the index doubled since they were
+        alive = int(self.alive[:self.size].sum())
+        if self.lists.centroids is None or alive > 2 * self.lists.built_size:
+            self.lists.build(self.vectors, np.flatnonzero(self.alive[:self.size]))
+        else:
+            for row in added:
+                self.lists.add(self.vectors, row)
+
+    def nearest(self, vector, limit, exclude=()):
+        """(publication id, cosine similarity) of the closest vectors, closest first."""
+        with self.lock:
+            self.queries += 1
+            if self.lists is None or not vector.any():
+                return []
+            rows = self.lists.candidates(vector, max(limit * 20, setting('SEMANTIC_SEARCH_K', 2000)))
+            rows = rows[self.alive[rows]]
+            scores = self.vectors[rows] @ vector
+            results = []
+            for i in np.argsort(-scores).tolist():
+                if self.ids[rows[i]] not in exclude:
+                    results.append((self.ids[rows[i]], float(scores[i])))
+                    if len(results) == limit:
+                        break
+            return results
+
+    def similar_to(self, publication_id, limit=10):
+        self.refresh()
+        with self.lock:
+            row = self.rows.get(publication_id)
+            vector = self.vectors[row].copy() if row is not None else None
+        if vector is None:
+            return []
+        return self.nearest(vector, limit, exclude={publication_id})
+
+    def search(self, query, limit=10, exclude=()):
+        self.refresh()
+        if self.projection is None:
+            return []
+        vector = self.projection.encode([Counter(tokens(query))])[0]
+        return self.nearest(vector, limit, exclude=set(exclude))
+
+    def stats(self):
+        """Counters for monitoring (this worker only)."""
+        with self.lock:
+            return {
+                'model': self.projection.pk if self.projection else None,
+                'vectors': len(self.rows),
+                'rows': self.size,
+                'lists': len(self.lists.lists) if self.lists else 0,
+                'queries': self.queries,
+                'refreshes': self.refreshes,
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SemanticIndex()
+    return _index
+
+
+def similar_publications(publication, limit=10):
+    """Publications closest to a publication, closest first ([] before the first index build)."""
+    ids = [pk for pk, _ in get_index().similar_to(publication.pk, limit)]
+    found = Publication.objects.select_related('topic').in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
+
+
+def search(query, limit=10, exclude=()):
+    """Publications closest to a free text query, closest first."""
+    ids = [pk for pk, _ in get_index().search(query, limit, exclude)]
+    found = Publication.objects.select_related('topic').in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
@@ -0,0 +1,218 @@
+# services.py
+
+# Write services shared by the views and the management commands.
+# Each service runs a fixed number of queries, whatever the number of authors or tags,
+# and everything it writes is done inside a single transaction.
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from .db import retry_on_lock
+from .models import Topic, Tag, Publication, Message
+from . import fuzzy, searchcache, timeline, utils
+
+
+def split_names(value):
+    """
+    Split a comma-separated string ("a, b,,c") into a list of unique, stripped names,
+    keeping the input order.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        names = value.split(',')
+    elif isinstance(value, (int, float)):
+        names = [str(value)]  # a lone number in a JSON manifest
+    else:
+        names = [str(name) for name in value if name is not None]
+    return list(dict.fromkeys(name.strip() for name in names if name.strip()))
+
+
+def resolve_authors(usernames):
+    """
+    Resolve usernames to user ids with a single IN lookup.
+
+    Returns:
+        tuple: ({username: user_id}, [unresolved usernames])
+    """
+    usernames = split_names(usernames)
+    if not usernames:
+        return {}, []
+
+    found = dict(
+        get_user_model().objects
+        .filter(username__in=usernames)
+        .values_list('username', 'id')
+    )
+    unresolved = [username for username in usernames if username not in found]
+    return found, unresolved
+
+
+def resolve_tags(names):
+    """
+    Get or create tags by name in two queries: a bulk INSERT that ignores existing names
+    (Tag.name is unique) then an IN lookup.
+
+    Returns:
+        dict: {tag name: tag id}
+    """
+    names = split_names(names)
+    if not names:
+        return {}
+
+    Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    tags = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+
+    # bulk_create() sends no signal: index the tags for search here
+    fuzzy.index('tag', [(tag_id, name) for name, tag_id in tags.items()])
+    searchcache.bump('base.tag')
+    return tags
+
+
+def resolve_topics(names):
+    """
+    Get or create topics by name in at most two queries (an IN lookup, then one bulk
+    insert of the missing names).
+
+    Returns:
+        dict: {topic name: topic id}
+    """
+    names = split_names(names)
+    if not names:
+        return {}
+
+    topics = {}
+    for name, topic_id in Topic.objects.filter(name__in=names).order_by('id').values_list('name', 'id'):
+        topics.setdefault(name, topic_id)
+
+    missing = [Topic(name=name) for name in names if name not in topics]
+    for topic in Topic.objects.bulk_create(missing):
+        topics[topic.name] = topic.id
+
+    if missing:
+        # bulk_create() sends no signal: index the new topics for search here
+        fuzzy.index('topic', [(topic.id, topic.name) for topic in missing])
+        searchcache.bump('base.topic')
+    return topics
+
+
+def add_publication_relations(rows):
+    """
+    Bulk insert authors and tags for several publications at once.
+
+    Args:
+        rows (iterable): (publication_id, author_ids, tag_ids) tuples
+    """
+    PublicationAuthors = Publication.authors.through
+    PublicationTags = Publication.tags.through
+
+    authors, tags = [], []
+    for publication_id, author_ids, tag_ids in rows:
+        authors += [PublicationAuthors(publication_id=publication_id, user_id=user_id) for user_id in author_ids]
+        tags += [PublicationTags(publication_id=publication_id, tag_id=tag_id) for tag_id in tag_ids]
+
+    PublicationAuthors.objects.bulk_create(authors, ignore_conflicts=True)
+    PublicationTags.objects.bulk_create(tags, ignore_conflicts=True)
+
+
+def create_publication(user, theme, topic_name, file, affiliations=None, description=None,
+                       summary=None, author_usernames=None, tag_names=None):
+    """
+    Create a publication with its topic, co-authors and tags in one transaction.
+
+    Replaces the per-author get() and per-tag get_or_create()/add() loop of the
+    publication form: co-authors are resolved with one IN lookup, tags with one bulk
+    insert and one IN lookup, and the m2m rows are inserted in bulk. If anything fails,
+    nothing is left half-built (the stored PDF is removed as well).
+
+    Args:
+        user (User): publication owner, always added as an author
+        theme (str): publication theme/title
+        topic_name (str): topic name (created if it doesn't exist)
+        file (File): the PDF
+        affiliations, description, summary (str, optional): publication fields
+        author_usernames (str|list, optional): co-author usernames (comma-separated string or list)
+        tag_names (str|list, optional): tag names (comma-separated string or list)
+
+    Returns:
+        tuple: (Publication, list of co-author usernames that don't exist)
+    """
+    publication = None
+    try:
+        with transaction.atomic():
+            topic, _ = Topic.objects.get_or_create(name=topic_name)
+
+            publication = Publication(
+                theme=theme,
+                topic=topic,
+                affiliations=affiliations,
+                description=description,
+                summary=summary,
+                file=file,
+                user=user,
+            )
+            publication.save() # also adds the owner to the authors
+
+            authors, unresolved = resolve_authors(author_usernames)
+            tags = resolve_tags(tag_names)
+            author_ids = [user_id for user_id in authors.values() if user_id != user.id]
+            add_publication_relations([(publication.id, author_ids, tags.values())])
+            timeline.fan_out([publication])
+    except Exception:
+        # The PDF is written to storage before the INSERT, don't leave it orphaned
+        if publication is not None and publication.file and publication.file._committed:
+            publication.file.delete(save=False)
+        raise
+
+    return publication, unresolved
+
+
+@retry_on_lock
+@transaction.atomic
+def post_message(discussion, user, body, reply_to_id=None):
+    """
+    Post a message in a discussion: creates the message, adds the author to the participants
+    and notifies the other participants, the replied-to author and the discussion creator.
+
+    Args:
+        discussion (Discussion): the discussion room
+        user (User): message author
+        body (str): message body
+        reply_to_id (str, optional): id of the message replied to (ignored if not in this discussion)
+
+    Returns:
+        Message: the new message
+    """
+    participants = list(discussion.participants.all())
+
+    # Check if this is a reply
+    reply_to_message = None
+    if reply_to_id:
+        reply_to_message = Message.objects.filter(id=reply_to_id, discussion=discussion).select_related('user').first()
+
+    message = Message.objects.create(
+        user=user,
+        discussion=discussion,
+        body=body,
+        reply_to=reply_to_message
+    )
+
+    # Add user to participants if not already
+    if user not in participants:
+        discussion.participants.add(user)
+
+    # If it's a reply, notify the original message author
+    notification_recipients = set()
+    if reply_to_message and reply_to_message.user != user:
+        notification_recipients.add(reply_to_message.user)
+
+    # Notify other participants (excluding the message sender)
+    notification_recipients.update(participant for participant in participants if participant != user)
+
+    # Also notify the discussion creator if they're not a participant yet
+    if discussion.creator != user and discussion.creator not in participants:
+        notification_recipients.add(discussion.creator)
+
+    utils.NotificationManager.discussion_reply(user, notification_recipients, discussion)
+
+    return message
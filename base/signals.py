@@ -0,0 +1,92 @@
+# signals.py
+
+# Keeps the denormalized collection summaries (Collection.pub_count, last_added, cover) in sync
+# with CollectionPublication. Entries are created either directly or through the many-to-many
+# manager (collection.publications.add(...), publication.collections.add(...)), which
+# bulk inserts without calling save(): both paths are covered.
+#
+# Also bumps the search generations (see searchcache.py) when a searched model changes, and
+# keeps the fuzzy search index (see fuzzy.py) up to date, in the same transaction as the change.
+
+from django.contrib.auth import get_user_model
+
+from . import fuzzy, searchcache
+from .models import Topic, Tag, Publication, Collection, CollectionPublication, Discussion
+
+
+def entry_saved(sender, instance, created, **kwargs):
+    if created:
+        Collection.update_summaries({instance.collection_id: 1})
+        searchcache.bump('base.collection')
+
+
+def entry_deleted(sender, instance, **kwargs):
+    Collection.update_summaries({instance.collection_id: -1})
+    searchcache.bump('base.collection')
+
+
+def publications_added(sender, instance, action, reverse, pk_set, **kwargs):
+    # Removals go through QuerySet.delete(), which sends post_delete for each entry;
+    # additions are bulk inserted and only reported here (pk_set holds the entries actually inserted)
+    if action != 'post_add':
+        return
+    if reverse:
+        Collection.update_summaries({collection_id: 1 for collection_id in pk_set})
+    else:
+        Collection.update_summaries({instance.pk: len(pk_set)})
+
+
+def searched_model_changed(sender, instance=None, update_fields=None, **kwargs):
+    # Logging in only updates last_login, which is not searched
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    searchcache.bump(sender._meta.label_lower)
+
+
+def searched_relation_changed(sender, instance, action, reverse, model, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        # The searched side is the model holding the many-to-many field
+        searchcache.bump((model if reverse else type(instance))._meta.label_lower)
+
+
+# Fuzzy search index: model -> (posting kind, indexed field)
+INDEXED = {
+    Publication: fuzzy.PUBLICATION_FIELDS,
+    Tag: [('tag', 'name')],
+    Topic: [('topic', 'name')],
+}
+
+
+def indexed_model_saved(sender, instance, update_fields=None, **kwargs):
+    for kind, field in INDEXED.get(sender) or [('user', 'username')]:
+        if update_fields and field not in update_fields:
+            continue
+        fuzzy.index(kind, [(instance.pk, getattr(instance, field))])
+
+
+def indexed_model_deleted(sender, instance, **kwargs):
+    for kind, _ in INDEXED.get(sender) or [('user', 'username')]:
+        fuzzy.unindex(kind, [instance.pk])
+
+
+def connect():
+    from django.db.models.signals import post_save, post_delete, m2m_changed
+
+    post_save.connect(entry_saved, sender=CollectionPublication, dispatch_uid='base.collection_entry_saved')
+    post_delete.connect(entry_deleted, sender=CollectionPublication, dispatch_uid='base.collection_entry_deleted')
+    m2m_changed.connect(publications_added, sender=Collection.publications.through,
+                        dispatch_uid='base.collection_publications_added')
+
+    for model in (*INDEXED, get_user_model()):
+        label = model._meta.label_lower
+        post_save.connect(indexed_model_saved, sender=model, dispatch_uid=f'base.fuzzy_saved.{label}')
+        post_delete.connect(indexed_model_deleted, sender=model, dispatch_uid=f'base.fuzzy_deleted.{label}')
+
+    for model in (Topic, Tag, Publication, Collection, Discussion, get_user_model()):
+        label = model._meta.label_lower
+        post_save.connect(searched_model_changed, sender=model, dispatch_uid=f'base.search_saved.{label}')
+        post_delete.connect(searched_model_changed, sender=model, dispatch_uid=f'base.search_deleted.{label}')
+    for through in (Publication.tags.through, Publication.authors.through,
+                    Collection.publications.through, Discussion.participants.through):
+        m2m_changed.connect(searched_relation_changed, sender=through,
+                            dispatch_uid=f'base.search_relation.{through._meta.label_lower}')
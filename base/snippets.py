@@ -0,0 +1,167 @@
+# snippets.py
+
+# Highlighted snippets of search results, placed with the word offsets of the search index.
+#
+# The postings of the description and summary of a publication (see fuzzy.py) keep the offsets
+# of the words. For a page of results, one query reads the postings of the query words, the
+# densest window of each publication is chosen from the offsets alone, and one more query reads
+# only those windows (SUBSTR of the chosen field): descriptions and summaries are never loaded
+# whole. Matches are marked at the stored offsets.
+
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Case, IntegerField, TextField, Value, When
+from django.db.models.functions import Length, Substr
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from . import fuzzy, queryparser
+from .models import Publication, SearchPosting, SearchWord
+
+# Posting kinds a snippet is taken from, by preference (the kind is also the field name)
+FIELDS = ['description', 'summary']
+
+WORD_RUN = re.compile(r'\w+')
+
+
+def snippet_length():
+    return getattr(settings, 'SEARCH_SNIPPET_LENGTH', 200)
+
+
+def query_words(query):
+    """Vocabulary ids of the words of a query, with the closest known words for the unknown ones."""
+    if queryparser.is_structured(query):
+        # Only free words and phrases are looked for in the texts
+        query = ' '.join(token[2] for token in queryparser.tokenize(query)
+                         if isinstance(token, tuple) and token[1] is None and not token[3])
+    folded = fuzzy.words(query)
+    if not folded:
+        return {}
+    known = dict(SearchWord.objects.filter(word__in=folded).values_list('word', 'id'))
+    ids = {word_id: word for word, word_id in known.items()}
+    for word in folded:
+        if word not in known:
+            for word_id, _, _, _ in fuzzy.similar_words(word, limit=3):
+                ids.setdefault(word_id, word)
+    return ids
+
+
+def best_window(hits, length):
+    """
+    Start of the window of a text holding the most distinct query words.
+
+    Args:
+        hits (list): (offset, word id) pairs, sorted
+        length (int): window length
+
+    Returns:
+        tuple: (number of distinct words, start offset)
+    """
+    offsets = [offset for offset, _ in hits]
+    best = (0, 0)
+    for i, (start, _) in enumerate(hits):
+        # Leave room for the last word of the window
+        end = bisect_left(offsets, start + length - 20)
+        distinct = len({word_id for _, word_id in hits[i:max(end, i + 1)]})
+        if distinct > best[0]:
+            best = (distinct, start)
+    return best
+
+
+def render(text, start, total, marks):
+    """
+    HTML of a window: text read from start in a field of total characters, with the words
+    starting at the offsets in marks highlighted.
+    """
+    cut = 0
+    if start > 0:
+        # Drop the partial first word
+        space = text.find(' ')
+        cut = space + 1 if 0 <= space < 40 else 0
+    end = len(text)
+    if start + len(text) < total:
+        space = text.rfind(' ')
+        end = space if space > cut else end
+
+    pieces, position = [], cut
+    for offset in sorted(marks):
+        relative = offset - start
+        if relative < position or relative >= end:
+            continue
+        run = WORD_RUN.match(text, relative)
+        if not run:
+            continue
+        pieces.append(escape(text[position:relative]))
+        pieces.append(f"<mark>{escape(run.group())}</mark>")
+        position = run.end()
+    pieces.append(escape(text[position:end]))
+
+    html = ''.join(pieces).strip()
+    if start > 0:
+        html = f"&hellip;{html}"
+    if start + len(text) < total:
+        html = f"{html}&hellip;"
+    return mark_safe(html)
+
+
+def attach(publications, query):
+    """
+    Set the snippet attribute of publications (safe HTML, '' without description or summary).
+
+    Publications whose texts do not hold the query words get the beginning of their description.
+    Two queries for the page, plus the typo tolerant lookup of the unknown query words.
+    """
+    publications = list(publications)
+    if not publications:
+        return publications
+    length = snippet_length()
+    ids = [publication.pk for publication in publications]
+
+    words = query_words(query)
+    hits = defaultdict(list)  # (publication id, field) -> [(offset, word id)]
+    if words:
+        for object_id, kind, word_id, positions in SearchPosting.objects.filter(
+                kind__in=FIELDS, object_id__in=ids, word_id__in=words).values_list(
+                'object_id', 'kind', 'word_id', 'positions'):
+            hits[(object_id, kind)] += [(int(offset), word_id) for offset in positions.split()]
+
+    windows = {}  # publication id -> (field, start, marks)
+    for pk in ids:
+        candidates = []
+        for preference, field in enumerate(FIELDS):
+            field_hits = sorted(hits.get((pk, field), ()))
+            if field_hits:
+                distinct, start = best_window(field_hits, length)
+                candidates.append((-distinct, preference, field, start, field_hits))
+        if candidates:
+            _, _, field, start, field_hits = min(candidates)
+            # Some context before the first match
+            start = max(0, start - length // 4)
+            windows[pk] = (field, start, [offset for offset, _ in field_hits if start <= offset < start + length])
+        else:
+            windows[pk] = ('description', 0, [])
+
+    def case(expression, output_field):
+        return Case(
+            *[When(pk=pk, then=expression(field, start)) for pk, (field, start, _) in windows.items()],
+            default=Value(None),
+            output_field=output_field,
+        )
+
+    rows = Publication.objects.filter(pk__in=ids).order_by().annotate(
+        window=case(lambda field, start: Substr(field, start + 1, length), TextField()),
+        total=case(lambda field, start: Length(field), IntegerField()),
+    ).values_list('pk', 'window', 'total')
+    texts = {pk: (window, total) for pk, window, total in rows}
+
+    for publication in publications:
+        window, total = texts.get(publication.pk, (None, None))
+        if not window:
+            publication.snippet = ''
+            continue
+        _, start, marks = windows[publication.pk]
+        publication.snippet = render(window, start, total, marks)
+    return publications
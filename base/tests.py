@@ -1,3 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from .models import Notification
+
+
+class NotificationPollTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'pw')
+        actor = User.objects.create_user('actor', 'actor@example.com', 'pw')
+        self.notifications = [
+            Notification.objects.create(
+                recipient=self.user, actor=actor, type='follow', title="New Follower",
+                message=f"message {i}", content_type=ContentType.objects.get_for_model(actor),
+                object_id=actor.id,
+            )
+            for i in range(3)
+        ]
+        self.client.force_login(self.user)
+        self.url = reverse('base:notifications-poll')
+
+    def poll(self, etag=None):
+        return self.client.get(self.url, HTTP_IF_NONE_MATCH=etag) if etag else self.client.get(self.url)
+
+    def test_unchanged_inbox_is_not_modified(self):
+        etag = self.poll()['ETag']
+        response = self.poll(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_reading_an_older_notification_changes_the_etag(self):
+        response = self.poll()
+        self.assertEqual(response.json()['unread'], 3)
+
+        oldest = min(self.notifications, key=lambda notification: notification.id)
+        self.client.post(reverse('base:notifications-read'), {'ids': [oldest.id]})
+
+        response = self.poll(response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['unread'], 2)
+
+    def test_deleting_an_older_notification_changes_the_etag(self):
+        etag = self.poll()['ETag']
+        Notification.objects.filter(pk=self.notifications[0].pk).update(is_deleted=True)
+
+        response = self.poll(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['unread'], 2)
@@ -0,0 +1,193 @@
+# timeline.py
+
+# Personalized "For you" timelines, computed on write instead of on read.
+#
+# When a publication is created, its id is pushed into the timeline of every follower of its
+# authors and of every user who favorited its topic. Following someone or favoriting a topic
+# backfills the timeline with their latest publications. Timelines are bounded to
+# TIMELINE_MAX_LENGTH entries and read newest first with one keyset query.
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import OuterRef, Subquery
+
+from .models import Publication, TimelineEntry
+
+
+def max_length():
+    return getattr(settings, 'TIMELINE_MAX_LENGTH', 500)
+
+
+def push(entries):
+    """
+    Insert (user_id, publication_id, reason) tuples, ignoring the ones already in the timelines,
+    then trim the timelines that received entries.
+    """
+    entries = list(entries)
+    if not entries:
+        return
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, publication_id=publication_id, reason=reason)
+         for user_id, publication_id, reason in entries],
+        ignore_conflicts=True,
+    )
+    trim({user_id for user_id, *_ in entries})
+
+
+def trim(user_ids):
+    """
+    Keep only the newest TIMELINE_MAX_LENGTH entries of the given timelines, in one DELETE:
+    an entry goes if its publication id is lower or equal to the one at position TIMELINE_MAX_LENGTH
+    of its own timeline.
+    """
+    limit = max_length()
+    cutoff = Subquery(
+        TimelineEntry.objects
+        .filter(user_id=OuterRef('user_id'))
+        .order_by('-publication_id')
+        .values('publication_id')[limit:limit + 1]
+    )
+    TimelineEntry.objects.filter(user_id__in=user_ids, publication_id__lte=cutoff).delete()
+
+
+def fan_out(publications):
+    """
+    Push new publications to the timelines of their authors' followers and of the users
+    who favorited their topic. Three lookups and one insert, whatever the number of publications.
+
+    Args:
+        publications (list): saved Publication objects, with their authors already set
+    """
+    User = get_user_model()
+    publications = list(publications)
+    if not publications:
+        return
+
+    # Followers of the authors
+    authors = {}
+    for publication_id, user_id in Publication.authors.through.objects.filter(
+            publication_id__in=[p.id for p in publications]).values_list('publication_id', 'user_id'):
+        authors.setdefault(user_id, []).append(publication_id)
+
+    entries = {}
+    for follower_id, followed_id in User.following.through.objects.filter(
+            to_user_id__in=authors).values_list('from_user_id', 'to_user_id'):
+        for publication_id in authors[followed_id]:
+            if follower_id != followed_id:
+                entries[(follower_id, publication_id)] = 'following'
+
+    # Users who favorited the topics
+    topics = {}
+    for publication in publications:
+        if publication.topic_id:
+            topics.setdefault(publication.topic_id, []).append(publication.id)
+
+    for user_id, topic_id in User.favorite_topics.through.objects.filter(
+            topic_id__in=topics).values_list('user_id', 'topic_id'):
+        for publication_id in topics[topic_id]:
+            entries.setdefault((user_id, publication_id), 'topic')
+
+    push((user_id, publication_id, reason) for (user_id, publication_id), reason in entries.items())
+
+
+def backfill_following(user, followed):
+    """Add the latest publications of a newly followed user to the timeline."""
+    ids = Publication.objects.filter(authors=followed).order_by('-id').values_list('id', flat=True)[:max_length()]
+    push((user.id, publication_id, 'following') for publication_id in ids)
+
+
+def backfill_topic(user, topic):
+    """Add the latest publications of a newly favorited topic to the timeline."""
+    ids = Publication.objects.filter(topic=topic).order_by('-id').values_list('id', flat=True)[:max_length()]
+    push((user.id, publication_id, 'topic') for publication_id in ids)
+
+
+def backfill(follows=(), favorites=()):
+    """
+    Bulk backfill for relations created without the follow/favorite views (imports): two
+    lookups and one insert, whatever the number of relations.
+
+    Args:
+        follows (iterable): (follower id, followed user id) pairs
+        favorites (iterable): (user id, topic id) pairs
+    """
+    follows, favorites = list(follows), list(favorites)
+    limit = max_length()
+
+    by_author = {}
+    if follows:
+        for publication_id, author_id in Publication.authors.through.objects.filter(
+                user_id__in={followed_id for _, followed_id in follows}).order_by('-publication_id').values_list(
+                'publication_id', 'user_id'):
+            latest = by_author.setdefault(author_id, [])
+            if len(latest) < limit:
+                latest.append(publication_id)
+
+    by_topic = {}
+    if favorites:
+        for publication_id, topic_id in Publication.objects.filter(
+                topic_id__in={topic_id for _, topic_id in favorites}).order_by('-id').values_list('id', 'topic_id'):
+            latest = by_topic.setdefault(topic_id, [])
+            if len(latest) < limit:
+                latest.append(publication_id)
+
+    entries = {}
+    for user_id, followed_id in follows:
+        for publication_id in by_author.get(followed_id, ()):
+            entries[(user_id, publication_id)] = 'following'
+    for user_id, topic_id in favorites:
+        for publication_id in by_topic.get(topic_id, ()):
+            entries.setdefault((user_id, publication_id), 'topic')
+
+    push((user_id, publication_id, reason) for (user_id, publication_id), reason in entries.items())
+
+
+def remove_following(user, unfollowed):
+    """
+    Remove what only came from an unfollowed user: publications with another followed author
+    or in a favorite topic stay.
+    """
+    # Whatever the reason recorded: an entry kept by a topic may have come from this user
+    TimelineEntry.objects.filter(
+        user=user, publication__authors=unfollowed
+    ).exclude(
+        publication__authors__in=user.following.exclude(pk=unfollowed.pk)
+    ).exclude(
+        publication__topic__in=user.favorite_topics.all()
+    ).delete()
+
+
+def remove_topic(user, topic):
+    """
+    Remove what only came from a topic removed from the favorites: publications of followed
+    authors stay.
+    """
+    TimelineEntry.objects.filter(
+        user=user, publication__topic=topic
+    ).exclude(
+        publication__authors__in=user.following.all()
+    ).delete()
+
+
+def page(user, before=None, limit=20):
+    """
+    One page of the user's timeline, newest first.
+
+    Args:
+        user (User): timeline owner
+        before (int|str, optional): keyset cursor, the last publication id of the previous page
+        limit (int): page size
+
+    Returns:
+        tuple: (list of Publication, cursor for the next page or None)
+    """
+    entries = TimelineEntry.objects.filter(user=user)
+    if before and str(before).isdigit():
+        entries = entries.filter(publication_id__lt=int(before))
+
+    publications = [
+        entry.publication for entry in
+        entries.select_related('publication__topic').order_by('-publication_id')[:limit]
+    ]
+    next_cursor = publications[-1].id if len(publications) == limit else None
+    return publications, next_cursor
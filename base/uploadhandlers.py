@@ -0,0 +1,93 @@
+# uploadhandlers.py
+
+# Upload handler validating PDF files while they are still streaming in,
+# instead of accepting anything ending in .pdf and failing later on every render.
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+
+from . import utils
+
+
+class PdfUploadHandler(TemporaryFileUploadHandler):
+    """
+    PdfUploadHandler class: inherits from django.core.files.uploadhandler.TemporaryFileUploadHandler \n
+    Replaces the default handlers in FILE_UPLOAD_HANDLERS (it must be the one storing the data,
+    otherwise a rejected PDF would still come out of the next handler). Other files (profile photos, ...)
+    are stored exactly like TemporaryFileUploadHandler does.\n
+    For PDF uploads:\n
+    - the magic bytes are checked on the first chunk\n
+    - the upload is aborted as soon as it goes over PDF_UPLOAD_MAX_SIZE\n
+    - the xref/trailer is checked from the last bytes received\n
+    - the page tree is walked under PDF_UPLOAD_PARSE_TIMEOUT and PDF_UPLOAD_MAX_PAGES\n
+    Rejected files are left out of request.FILES and the reason is stored in
+    request.upload_errors[field_name] so the view can show a clear error.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_size, self.max_pages, self.timeout = utils.pdfLimits()
+        self.is_pdf = False
+        if request is not None and not hasattr(request, 'upload_errors'):
+            request.upload_errors = {}
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.is_pdf = file_name.lower().endswith(".pdf") or content_type == "application/pdf"
+        self.size = 0
+        self.head = b""
+        self.tail = b""
+
+        if self.is_pdf and content_length and content_length > self.max_size:
+            self.reject(self.too_large_message())
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.is_pdf:
+            self.size += len(raw_data)
+            if self.size > self.max_size:
+                self.reject(self.too_large_message())
+
+            # Magic bytes, checked as soon as the header window is filled
+            if len(self.head) < utils.PDF_HEADER_WINDOW:
+                self.head += raw_data[:utils.PDF_HEADER_WINDOW - len(self.head)]
+                if len(self.head) >= utils.PDF_HEADER_WINDOW:
+                    self.check(utils.checkPdfHeader, self.head)
+
+            self.tail = (self.tail + raw_data)[-utils.PDF_TAIL_WINDOW:]
+
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if not self.is_pdf:
+            return super().file_complete(file_size)
+
+        try:
+            utils.checkPdfHeader(self.head)
+            utils.checkPdfTrailer(self.tail, self.size)
+            self.file.flush()
+            utils.inspectPdf(self.file, max_pages=self.max_pages, timeout=self.timeout)
+        except ValidationError as e:
+            self.record(e.messages[0])
+            self.file.close()
+            return None # no handler returns the file: it is left out of request.FILES
+
+        return super().file_complete(file_size)
+
+    # helpers
+    def too_large_message(self):
+        return f"This PDF is too large (max {self.max_size // (1024 * 1024)} MB)."
+
+    def check(self, func, *args):
+        try:
+            func(*args)
+        except ValidationError as e:
+            self.reject(e.messages[0])
+
+    def record(self, message):
+        if self.request is not None:
+            self.request.upload_errors[self.field_name] = message
+
+    def reject(self, message):
+        """Record the error and skip the rest of this file (the parser drains it without storing it)."""
+        self.record(message)
+        raise SkipFile(message)
@@ -19,6 +19,8 @@ urlpatterns = [
     path('delete-from-collection/<str:collection_id>/<str:publication_id>/', views.deleteFromCollection, name="delete-from-collection"),
     path('publication/<str:pk>/', views.publication, name="publication"),
     path('profile/<str:pk_u>/collection/<str:pk_c>/', views.collection, name="collection"),
+    path('export-collection/<str:pk>/', views.exportCollection, name="export-collection"),
+    path('export/<str:source>/<str:fmt>/', views.exportBibliography, name="export-bibliography"),
     path('filter-topics/', views.filterTopics, name="filter-topics"),
     path('filter-authors/', views.filterAuthors, name="filter-authors"),
     path('filter-tags/', views.filterTags, name="filter-tags"),
@@ -28,7 +30,12 @@ urlpatterns = [
     path('remove-topic-from-fav/<str:pk>/', views.removeTopicFromFav, name="remove-topic-from-fav"),
     path('notification/<int:notification_id>/read/', views.mark_notification_read, name='mark-notification-read'),
     path('notifications/', views.notificationsPage, name='notifications'),
+    path('api/notifications/', views.notificationsApi, name='notifications-api'),
+    path('api/notifications/read/', views.markNotificationsRead, name='notifications-read'),
+    path('api/notifications/poll/', views.notificationsPoll, name='notifications-poll'),
     path('create-discussion/<str:pk>/', views.createDiscussion, name="create-discussion"),
     path('discussion/<str:pk>/', views.discussion, name="discussion"),
     path('tag/<str:pk>/', views.viewTag, name="tag"),
+    path('metrics/', views.metrics, name="metrics"),
+    path('search-report/', views.searchReport, name="search-report"),
 ]
\ No newline at end of file
@@ -1,8 +1,19 @@
 # utils.py
 
+import re
+import time
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
 from django.urls import reverse
+from django.utils import timezone
+
+from PyPDF2 import PdfReader
+from PyPDF2.errors import PyPdfError
+
+from .db import retry_on_lock
 
 
 def pdfUploadPath(instance, filename):
@@ -11,10 +22,119 @@ def pdfUploadPath(instance, filename):
 def validatePdf(file):
     if not file.name.lower().endswith(".pdf"):
         raise ValidationError("Only PDF files are allowed...")
-    
+
+
+# PDF structure checks (shared by the upload handler and the import commands)
+
+PDF_MAGIC = b"%PDF-"
+PDF_HEADER_WINDOW = 1024 # the spec tolerates junk before the header, within the first 1024 bytes
+PDF_TAIL_WINDOW = 1024 # startxref and %%EOF must sit in the last kilobyte
+STARTXREF_RE = re.compile(rb"startxref\s+(\d+)\s+%%EOF")
+
+
+def pdfLimits():
+    """Return the (max_size, max_pages, parse_timeout) limits configured in settings."""
+    return (
+        getattr(settings, 'PDF_UPLOAD_MAX_SIZE', 50 * 1024 * 1024),
+        getattr(settings, 'PDF_UPLOAD_MAX_PAGES', 2000),
+        getattr(settings, 'PDF_UPLOAD_PARSE_TIMEOUT', 5.0),
+    )
+
+
+def checkPdfHeader(head):
+    """
+    Check the magic bytes of a PDF from its first bytes.
+    Raises ValidationError if the %PDF- header is missing.
+    """
+    if PDF_MAGIC not in head[:PDF_HEADER_WINDOW]:
+        raise ValidationError("This file is not a PDF (missing %PDF- header).")
+
+
+def checkPdfTrailer(tail, size):
+    """
+    Check the end of a PDF: a startxref pointing inside the file, followed by %%EOF.
+    Cheap enough to run before handing the file to the parser.
+    """
+    matches = STARTXREF_RE.findall(tail[-PDF_TAIL_WINDOW:])
+    if not matches:
+        raise ValidationError("This PDF is truncated or malformed (no startxref / %%EOF trailer).")
+    if int(matches[-1]) >= size:
+        raise ValidationError("This PDF is malformed (cross-reference offset outside the file).")
+
+
+def inspectPdf(stream, max_pages=None, timeout=None):
+    """
+    Parse the xref/trailer of a PDF and walk its page tree under a time budget.
+
+    Args:
+        stream: binary file object positioned anywhere (it is rewound)
+        max_pages (int, optional): reject documents with more pages than this
+        timeout (float, optional): seconds allowed for the page tree walk
+
+    Returns:
+        int: the number of pages
+
+    Raises:
+        ValidationError: encrypted, unparsable, oversized or too slow to parse
+    """
+    return readPdf(stream, max_pages, timeout)[1]
+
+
+def readPdf(stream, max_pages=None, timeout=None):
+    """
+    Same checks as inspectPdf(), also returning the parsed document for further reads (metadata).
+
+    Returns:
+        tuple: (PdfReader, number of pages)
+    """
+    if max_pages is None or timeout is None:
+        _, default_pages, default_timeout = pdfLimits()
+        max_pages = max_pages or default_pages
+        timeout = timeout or default_timeout
+    deadline = time.monotonic() + timeout
+
+    stream.seek(0)
+    try:
+        reader = PdfReader(stream, strict=False)
+        if reader.is_encrypted:
+            raise ValidationError("Encrypted PDFs are not accepted, please upload an unprotected file.")
+
+        # Walk the page tree ourselves so that cycles, huge /Kids arrays
+        # or slow object resolution are bounded.
+        pages = 0
+        seen = set()
+        stack = [reader.trailer["/Root"]["/Pages"]]
+        while stack:
+            if time.monotonic() > deadline:
+                raise ValidationError("This PDF is too complex to process.")
+            ref = stack.pop()
+            key = getattr(ref, "idnum", None)
+            if key is not None:
+                if key in seen:
+                    raise ValidationError("This PDF is malformed (page tree cycle).")
+                seen.add(key)
+            node = ref.get_object()
+            if node.get("/Type") == "/Pages" or "/Kids" in node:
+                stack.extend(node.get("/Kids", []))
+            else:
+                pages += 1
+                if pages > max_pages:
+                    raise ValidationError(f"This PDF has more than {max_pages} pages.")
+    except ValidationError:
+        raise
+    except (PyPdfError, KeyError, TypeError, ValueError, AttributeError, RecursionError) as e:
+        raise ValidationError(f"This PDF could not be read ({e.__class__.__name__}).")
+    finally:
+        stream.seek(0)
+
+    if pages == 0:
+        raise ValidationError("This PDF has no pages.")
+    return reader, pages
+
 # Notification manager (all helper functions for the task)
 class NotificationManager:
     @staticmethod
+    @retry_on_lock
     def create_notification(recipient, actor, notification_type, target_object, title, message, action_url=None):
         """
         Create a notification
@@ -33,6 +153,50 @@ class NotificationManager:
             action_url=action_url
         )
         return notification
+
+    @staticmethod
+    @retry_on_lock
+    @transaction.atomic
+    def coalesce_notifications(recipients, actor, notification_type, target_object, title, message, action_url=None):
+        """
+        Notify several users of one event. A recipient who has an unread notification of the same
+        type about the same target gets it updated in place: the actor becomes the latest one, the
+        actor count grows when the actor is new to it and it moves back to the top of the inbox.
+        The others get a new notification. One SELECT, one UPDATE and one INSERT, whatever the
+        number of recipients.
+
+        message is what follows the actor names, see Notification.text
+        """
+        from .models import Notification
+        content_type = ContentType.objects.get_for_model(target_object)
+        recipients = {recipient.pk: recipient for recipient in recipients}
+        if not recipients:
+            return 0
+
+        unread = Notification.objects.filter(
+            recipient_id__in=recipients, type=notification_type, content_type=content_type,
+            object_id=target_object.pk, is_read=False, is_deleted=False,
+        ).only('id', 'recipient_id', 'actor_ids').order_by('id')
+        existing = {notification.recipient_id: notification for notification in unread}
+        now = timezone.now()
+        for notification in existing.values():
+            if actor.pk not in notification.actor_ids:
+                notification.actor_ids.append(actor.pk)
+            notification.actor_count = len(notification.actor_ids)
+            notification.actor, notification.title, notification.message = actor, title, message
+            notification.action_url, notification.created = action_url, now
+        Notification.objects.bulk_update(
+            existing.values(), ['actor_ids', 'actor_count', 'actor', 'title', 'message', 'action_url', 'created']
+        )
+        Notification.objects.bulk_create([
+            Notification(
+                recipient=recipient, actor=actor, type=notification_type, content_type=content_type,
+                object_id=target_object.pk, title=title, message=message, action_url=action_url,
+                actor_ids=[actor.pk],
+            )
+            for pk, recipient in recipients.items() if pk not in existing
+        ])
+        return len(recipients)
     
     @staticmethod
     def new_follower(follower, followed):
@@ -74,16 +238,16 @@ class NotificationManager:
         )
     
     @staticmethod
-    def discussion_reply(replier, original_poster, discussion, reply):
-        """Create discussion reply notification"""
-        return NotificationManager.create_notification(
-            recipient=original_poster,
+    def discussion_reply(replier, recipients, discussion):
+        """Create or update (coalesced per discussion) discussion reply notifications"""
+        return NotificationManager.coalesce_notifications(
+            recipients=recipients,
             actor=replier,
             notification_type='discussion_reply',
-            target_object=reply,
+            target_object=discussion,
             title="New Reply in Discussion",
-            message=f'@{replier.username} replied in discussion "{discussion.title}"',
-            action_url=reverse('base:discussion', kwargs={'pk': discussion.id}) # doesn't exist yet
+            message=f'replied in discussion "{discussion.title}"',
+            action_url=reverse('base:discussion', kwargs={'pk': discussion.id})
         )
     
     @staticmethod
@@ -2,23 +2,43 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.cache import never_cache
-from django.http import HttpResponse, Http404, JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_protect
 from django.contrib import messages
-from django.db.models import Q
+from django.db.models import Q, Max, Sum
 from django.utils.safestring import mark_safe
-from django.db.models import Count
+from django.utils.text import slugify
+from django.utils import timezone
+from django.utils.cache import parse_etags
 from django.contrib.auth.hashers import make_password
 from django.http import HttpResponseRedirect
 from django.urls import reverse
 
 import os
+import time
+from datetime import timedelta
 import markdown
 
-from .models import Topic, Tag, Publication, Message, Collection, CollectionPublication, Notification, Discussion, track_search_click
+from .models import Topic, Tag, Publication, Message, Collection, CollectionPublication, Notification, Discussion, SearchRollup, track_search_click
 from . import utils
+from . import services
+from . import timeline
+from . import counters
+from . import exports
+from . import searchcache
+from . import fuzzy
+from . import facets
+from . import queryparser
+from . import snippets
+from . import semantic
+from . import searchlog
+from . import inbox
+from . import relations
+from .federated import get_executor
+from .ratelimit import get_limiter
 
 
 def home(request):
@@ -34,30 +54,38 @@ def home(request):
         
     GET Parameters:
         - q (str, optional): Search query to filter publications by theme, topic name, or tags
+        - sort (str, optional): 'trending' to order publications by trending score
         
     Returns:
         HttpResponse: Renders the home page template with context data
         
     Context Data:
         - topics (QuerySet): All available topics for display/navigation
-        - pubs (QuerySet): Publications filtered by search query across:
+        - pubs (QuerySet|list): Publications filtered by search query across:
             * Publication theme (case-insensitive partial match)
             * Topic name (case-insensitive partial match) 
             * Tag names (case-insensitive partial match)
+          or, when nothing matches exactly, the typo tolerant matches, best first (list)
+        - did_you_mean (str|None): corrected query when some of its words are unknown
         - collections (QuerySet|None): User's collections with publication counts (authenticated users only)
         - favorite_topics (QuerySet|None): User's favorited topics (authenticated users only)
+        - for_you (list|None): Page of the user's timeline: publications from followed users and
+          favorite topics, newest first (authenticated users only)
+        - for_you_next (int|None): Keyset cursor of the next timeline page (?before=<id>)
         
     Search Functionality:
         - Searches across multiple fields using Django Q objects
         - Uses case-insensitive partial matching (icontains)
         - Returns distinct results to avoid duplicates from multiple matches
         - Empty/None queries return all publications
+        - Falls back to the trigram index (fuzzy.py) when the query matches nothing as typed
+        - Structured queries (author:x tag:y "phrase" AND/OR/NOT) go through queryparser.py
+        - Searches are logged under the 'home' tab (see searchlog.py)
         
     User Personalization:
         - Authenticated users: Shows personal collections and favorite topics
         - Anonymous users: collections and favorite_topics set to None
-        - Collections are optimized with annotation for publication counts
-        - Uses prefetch_related for efficient database queries
+        - Collections carry a denormalized publication count, the sidebar is a single query
         
     Template:
         Renders 'base/home.html' with all context data for display
@@ -67,28 +95,49 @@ def home(request):
 
     topics = Topic.objects.all() # all topics displayed on home page
 
-    pubs = Publication.objects.filter(
-        Q(theme__icontains = q) |
-        Q(topic__name__icontains = q) |
-        Q(tags__name__icontains = q) |
-        Q(authors__username__icontains = q) |
-        Q(description__icontains = q)
-    ).distinct()
+    started = time.monotonic()
+    if queryparser.is_structured(q):
+        # author:, tag:, topic:, school:, year:, "phrases" and AND/OR/NOT (see queryparser.py)
+        pubs = queryparser.queryset(q)
+    else:
+        pubs = Publication.objects.filter(
+            Q(theme__icontains = q) |
+            Q(topic__name__icontains = q) |
+            Q(tags__name__icontains = q) |
+            Q(authors__username__icontains = q) |
+            Q(description__icontains = q)
+        ).distinct()
+
+    sort = request.GET.get('sort')
+    if sort == 'trending':
+        pubs = pubs.order_by('-trending_score', '-created')
+
+    did_you_mean = None
+    if q.strip() and not queryparser.is_structured(q):
+        did_you_mean = fuzzy.did_you_mean(q)
+        if not pubs.exists():
+            # Nothing contains the query as typed ("machin lerning"): typo tolerant matches, best first
+            ids = fuzzy.search_publications(q, limit=50)
+            found = Publication.objects.in_bulk(ids)
+            pubs = [found[pk] for pk in ids if pk in found]
+    if q.strip():
+        # len() evaluates the queryset the template iterates next: no extra query
+        searchlog.record('home', searchcache.normalize_query(q), started, pubs)
 
     if request.user.is_authenticated:
-        collections = (
-            request.user.collection_set
-            .annotate(pub_count=Count("publications"))
-            .prefetch_related("publications")
-        )
-        # collections = request.user.collection_set.all()
+        collections = request.user.collection_set.select_related('cover')  # stored summaries, no aggregate needed
 
         favorite_topics = request.user.favorite_topics.all()
+
+        # Precomputed on write (see timeline.py), read with one keyset query
+        for_you, for_you_next = timeline.page(request.user, before=request.GET.get('before'))
     else:
         collections = None
         favorite_topics = None
+        for_you, for_you_next = None, None
 
-    context = {'topics': topics, 'pubs': pubs, "collections": collections, "favorite_topics": favorite_topics}
+    context = {'topics': topics, 'pubs': pubs, "collections": collections, "favorite_topics": favorite_topics,
+               'for_you': for_you, 'for_you_next': for_you_next, 'sort': sort, 'did_you_mean': did_you_mean}
 
     return render(request, "base/home.html", context)
 
@@ -103,12 +152,7 @@ def search(request, tab=None):
     topics = Topic.objects.all() # all topics displayed on home page
 
     if request.user.is_authenticated:
-        collections = (
-            request.user.collection_set
-            .annotate(pub_count=Count("publications"))
-            .prefetch_related("publications")
-        )
-        # collections = request.user.collection_set.all()
+        collections = request.user.collection_set.select_related('cover')  # stored summaries, no aggregate needed
 
         favorite_topics = request.user.favorite_topics.all()
     else:
@@ -137,18 +181,48 @@ def search(request, tab=None):
 
     template_name = template_map.get(tab, 'base/search/search.html')
 
-    search_results = getSearchResult(q, tab)
+    facet_list = None
+    related = []
+    started = time.monotonic()
+    if tab == 'publications':
+        search_results, facet_list = getFacetedPublications(q, request.GET)
+        if q.strip():
+            searchlog.record(tab, searchcache.normalize_query(q), started, search_results)
+        snippets.attach(search_results, q)
+        if q.strip():
+            # Conceptually close publications the words of the query missed
+            related = semantic.search(q, limit=5, exclude=[pub.pk for pub in search_results])
+    else:
+        search_results = getSearchResult(q, tab)
+        if q.strip():
+            searchlog.record(tab, searchcache.normalize_query(q), started, search_results)
+        if tab == 'all' and search_results.get('publications'):
+            snippets.attach(search_results['publications'], q)
+    did_you_mean = fuzzy.did_you_mean(q) if q.strip() and not queryparser.is_structured(q) else None
 
     context = {'q': q, 'active_tab': tab, 'topics': topics, "collections": collections, 
-               "favorite_topics": favorite_topics, 'search_results': search_results}
+               "favorite_topics": favorite_topics, 'search_results': search_results, 'did_you_mean': did_you_mean,
+               'facets': facet_list, 'related': related}
 
     return render(request, template_name, context)
 
 
 # Search logic
-def getSearchResult(query, tab):
+def getSearchResult(query, tab, limit=30):
+    """
+    Search results of a tab ('all' returns the first results of every category).
+    
+    Results of the tabs are lists of objects, served from the search cache when the searched
+    models did not change (see searchcache.py). With limit=None, the whole queryset of a tab
+    is returned, uncached (exports).
+    
+    The categories of the 'all' tab are searched concurrently under SEARCH_DEADLINE (see
+    federated.py); the ones that missed it are listed under the 'timed_out' key.
+    Publications fall back to typo tolerant matches when nothing matches exactly (see fuzzy.py).
+    """
     User = get_user_model()
 
+    query = searchcache.normalize_query(query)
     if not query:
         return {}
 
@@ -156,7 +230,7 @@ def getSearchResult(query, tab):
     search_config = {
         'publications': {
             'model': Publication,
-            'fields': ['theme', 'topic__name', 'tags__name', 'authors__username', 'description']
+            'fields': queryparser.TEXT_FIELDS
         },
         'authors': {
             'model': User,
@@ -199,19 +273,98 @@ def getSearchResult(query, tab):
         
         return queryset
 
+    def cached(category, limit, generations):
+        config = search_config[category]
+        if category == 'publications':
+            compute = lambda: searchPublicationIds(query, limit)
+        else:
+            compute = lambda: build_query(config)
+        return searchcache.fetch(category, config['model'], query, limit, compute, generations)
+
     if tab == "all":
-        # Return limited results for all categories
-        return {
-            category: build_query(config)[:3] 
-            for category, config in search_config.items()
-        }
+        # Return limited results for all categories, searched concurrently
+        generations = searchcache.generations()
+        results, timed_out = get_executor().run({
+            category: (lambda category=category: cached(category, 3, generations))
+            for category in search_config
+        })
+        results['timed_out'] = timed_out
+        return results
     elif tab in search_config:
-        # Return full results for specific category
-        return build_query(search_config[tab])[:30]
+        # Return full results for specific category (all of them for exports, limit=None)
+        if not limit:
+            if tab == 'publications' and queryparser.is_structured(query):
+                return queryparser.queryset(query)
+            return build_query(search_config[tab])
+        return cached(tab, limit, searchcache.generations())
     else:
         return {}
 
 
+def searchPublicationIds(query, limit, typo_tolerant=True):
+    """
+    Ids of the publications matching a query. When nothing matches exactly, the closest typo
+    tolerant matches are returned instead, best first (see fuzzy.py), unless typo_tolerant
+    is False. Structured queries (author:, tag:, "phrases", AND/OR/NOT) only return exact
+    matches, their terms run most selective first (see queryparser.py).
+    """
+    query = searchcache.normalize_query(query)
+    if not query:
+        return []
+    if queryparser.is_structured(query):
+        return queryparser.search(query, limit)
+    ids = list(getSearchResult(query, 'publications', limit=None).values_list('pk', flat=True)[:limit])
+    if not ids and typo_tolerant:
+        # Nothing contains the query as typed ("machin lerning"), like home()
+        ids = fuzzy.search_publications(query, limit)
+    return ids
+
+
+def getFacetedPublications(query, params, limit=30):
+    """
+    Publications search narrowed by facets (topic, tag, author, school, year).
+    
+    The text match runs once per query and its FacetIndex is cached (see facets.py):
+    drilling down and counting are set operations on it.
+    Facets only count exact matches; when there is none, the typo tolerant matches are
+    returned without facets.
+    
+    Args:
+        query (str): search query
+        params (QueryDict): request GET parameters, holding the selected facet values
+        limit (int): number of publications returned
+        
+    Returns:
+        tuple: (list of Publication, list of facets with their values and counts)
+    """
+    query = searchcache.normalize_query(query)
+    if not query:
+        return [], []
+
+    index = searchcache.cached(
+        ('facets', query),
+        searchcache.DEPENDENCIES['publications'],
+        # Exact matches only: typo tolerant ones would be counted in the facets
+        lambda: facets.FacetIndex(searchPublicationIds(query, facets.max_results(), typo_tolerant=False)),
+    )
+    if not index.ids:
+        # Nothing matches exactly: the typo tolerant matches, without facets
+        return getSearchResult(query, 'publications', limit), []
+
+    selected = facets.selection(params)
+    publications = searchcache.rehydrate('publications', Publication, index.filter(selected)[:limit])
+
+    facet_list = index.counts(selected)
+    for facet in facet_list:
+        for value in facet['values']:
+            # Link toggling the value, keeping the rest of the query string
+            toggled = params.copy()
+            values = set(toggled.getlist(facet['name'])) ^ {value['value']}
+            toggled.setlist(facet['name'], sorted(values))
+            value['url'] = f"?{toggled.urlencode()}"
+    return publications, facet_list
+
+
 
 
 
@@ -245,7 +398,8 @@ def publication(request, pk: str):
         - Processes summary for rich text display with formatting
         
     Related Content Algorithm:
-        - Finds publications sharing the same topic OR having overlapping tags
+        - The 10 publications whose LSA vectors are the closest (semantic.py)
+        - Before the first build_semantic_index, publications sharing the same topic OR having overlapping tags
         - Excludes the current publication from results
         - Uses distinct() to prevent duplicates from multiple tag matches
         - Provides content discovery and engagement opportunities
@@ -268,7 +422,8 @@ def publication(request, pk: str):
 
     pub.summary_html = mark_safe(markdown.markdown(pub.summary))
 
-    similar_pubs = Publication.objects.filter(
+    # Closest LSA vectors (see semantic.py), or the same topic and tags before the first index build
+    similar_pubs = semantic.similar_publications(pub, limit=10) or Publication.objects.filter(
         Q(topic=pub.topic) | Q(tags__in=pub.tags.all())
     ).exclude(id=pub.id).distinct()
 
@@ -282,6 +437,9 @@ def publication(request, pk: str):
     # Track search click if coming from search
     track_search_click(request, pub)
 
+    # Buffered, written in batches (see counters.py)
+    counters.record_view(pub)
+
     context = {'pub': pub, 'similar_pubs': similar_pubs, "collections": collections, 
                "discussions": discussions}
 
@@ -363,20 +521,21 @@ def createPublication(request):
         
     Publication Creation Process:
         1. Extracts and validates form data from POST request
-        2. Creates or retrieves topic using get_or_create()
-        3. Creates publication object with current user as primary author
-        4. Processes comma-separated author usernames and adds valid users
-        5. Creates/retrieves tags and associates them with publication
-        6. Handles file upload attachment if provided
+        2. Delegates to services.create_publication(), which in one transaction:
+           creates or retrieves the topic, creates the publication with current user as
+           primary author, resolves co-authors with one IN lookup, bulk creates missing tags
+           and bulk inserts the author/tag relations
+        3. Handles file upload attachment if provided (PDFs are validated while streaming
+           in by base.uploadhandlers.PdfUploadHandler, rejected files re-render the form)
         
     Author Management:
         - Primary author: Set to request.user (publication creator)
         - Additional authors: Parsed from comma-separated string
-        - Invalid usernames are silently skipped (graceful error handling)
+        - Invalid usernames are skipped and reported back to the user in a warning message
         - Many-to-many relationship allows multiple authors per publication
         
     Tag System:
-        - Auto-creates tags that don't exist using get_or_create()
+        - Auto-creates tags that don't exist with a single bulk insert (Tag.name is unique)
         - Supports flexible tagging with comma-separated input
         - Enables content discovery and categorization
         
@@ -398,37 +557,28 @@ def createPublication(request):
         authors_str = request.POST.get('authors', '')
         tags_str = request.POST.get('tags', '')
         file = request.FILES.get('file')
+
+        # Rejected PDFs are dropped by the upload handler, which records why
+        upload_error = getattr(request, 'upload_errors', {}).get('file')
+        if upload_error:
+            messages.error(request, upload_error)
+            return render(request, 'base/publication_form.html')
         
-        # Handle topic
-        topic, _ = Topic.objects.get_or_create(name=topic_name)
-        
-        # Create publication
-        publication = Publication.objects.create(
+        # Topic, publication, co-authors and tags in a single transaction
+        publication, unresolved_authors = services.create_publication(
+            user=request.user,  # assuming current user is main author
             theme=theme,
-            topic=topic,
-            affiliations = affiliations,
+            topic_name=topic_name,
+            file=file,
+            affiliations=affiliations,
             description=description,
             summary=summary,
-            file=file,
-            user=request.user  # assuming current user is main author
+            author_usernames=authors_str,
+            tag_names=tags_str,
         )
-        
-        # Handle additional authors
-        if authors_str:
-            author_usernames = [username.strip() for username in authors_str.split(',') if username.strip()]
-            for username in author_usernames:
-                try:
-                    author = get_user_model().objects.get(username=username)
-                    publication.authors.add(author)
-                except get_user_model().DoesNotExist:
-                    pass  # Skip if author doesn't exist
-        
-        # Handle tags
-        if tags_str:
-            tag_names = [tag_name.strip() for tag_name in tags_str.split(',') if tag_name.strip()]
-            for tag_name in tag_names:
-                tag, _ = Tag.objects.get_or_create(name=tag_name)
-                publication.tags.add(tag)
+
+        if unresolved_authors:
+            messages.warning(request, f"Unknown authors not added: {', '.join(unresolved_authors)}")
         
         return redirect('base:publication', pk=publication.pk)
     
@@ -520,6 +670,8 @@ def viewPdf(request, pk: str):
     if not os.path.exists(pdf_path):
         raise Http404("PDF file not found")
     
+    counters.record_download(pub)
+
     # Serve the PDF directly
     with open(pdf_path, 'rb') as pdf_file:
         response = HttpResponse(pdf_file.read(), content_type='application/pdf')
@@ -557,9 +709,7 @@ def userProfile(request, pk: str):
         - Shows all publications regardless of co-authorship
         
     Collection Optimization:
-        - Annotates collections with publication counts for display
-        - Uses prefetch_related() for efficient loading of related publications
-        - Reduces database queries through optimized ORM usage
+        - Publication counts are stored on the collections (see signals.py), nothing is prefetched
         
     Privacy Controls:
         - Notifications: Only visible when viewing own profile (request.user == user)
@@ -587,16 +737,12 @@ def userProfile(request, pk: str):
         authors__username = user.username
     )
 
-    collections = (
-        user.collection_set
-        .annotate(pub_count=Count("publications"))
-        .prefetch_related("publications")
-    )
+    collections = user.collection_set.select_related('cover')
 
     # Notifications (only visible for the request.user)
     notifications = []
     if request.user == user:
-        notifications = request.user.notifications.filter(is_deleted=False, is_read=False)[:4]
+        notifications = request.user.notifications.filter(is_deleted=False, is_read=False).select_related('actor')[:4]
 
     # Follower and following lists (restricted to 10 each, will refer to a more page on which they will all be)
     following_user = request.user.following.filter(id=user.id).exists()
@@ -794,6 +940,7 @@ def followUser(request, pk: str):
         messages.info(request, f"You are already following {user_to_follow.username}")
     else:
         request.user.following.add(user_to_follow)
+        timeline.backfill_following(request.user, user_to_follow)
         messages.success(request, f"You are now following {user_to_follow.username}")
         
         # Create notification
@@ -820,6 +967,7 @@ def unfollowUser(request, pk: str):
     
     if request.user.following.filter(id=user_to_unfollow.id).exists():
         request.user.following.remove(user_to_unfollow)
+        timeline.remove_following(request.user, user_to_unfollow)
         messages.success(request, f"You have unfollowed {user_to_unfollow.username}")
     else:
         messages.info(request, f"You are not following {user_to_unfollow.username}")
@@ -828,29 +976,59 @@ def unfollowUser(request, pk: str):
 
 
 def followers(request, pk: str):
+    """
+    Followers of a user, 50 per page by username, searchable by username.
+    
+    Args:
+        request: HTTP request object; GET parameters:
+            - q: only the usernames containing it
+            - after: keyset cursor of the next page
+        pk (str): User ID
+        
+    Returns:
+        HttpResponse: Rendered followers template; whether the viewer follows each
+        follower of the page is read in one query
+    """
     User = get_user_model()
     user = get_object_or_404(User, id=pk)
 
-    followers = user.followers.all()
-    # followings = user.following.all()
+    query = request.GET.get('q', '').strip()
+    followers, next_cursor = relations.page(user.followers.all(), after=request.GET.get('after'), query=query)
+    relations.mark_followed(request.user, followers)
 
     followers_count = user.get_followers_count()
 
-    context = {'user': user, 'followers': followers, 'followers_count': followers_count}
+    context = {'user': user, 'followers': followers, 'followers_count': followers_count,
+               'query': query, 'next_cursor': next_cursor}
 
     return render(request, "base/followers.html", context)
 
 
 def followings(request, pk: str):
+    """
+    Users a user follows, 50 per page by username, searchable by username.
+    
+    Args:
+        request: HTTP request object; GET parameters:
+            - q: only the usernames containing it
+            - after: keyset cursor of the next page
+        pk (str): User ID
+        
+    Returns:
+        HttpResponse: Rendered followings template; whether the viewer follows each
+        user of the page is read in one query
+    """
     User = get_user_model()
     user = get_object_or_404(User, id=pk)
 
-    followings = user.following.all()
-    # followings = user.following.all()
+    query = request.GET.get('q', '').strip()
+    followings, next_cursor = relations.page(user.following.all(), after=request.GET.get('after'), query=query)
+    relations.mark_followed(request.user, followings)
 
     followings_count = user.get_following_count()
 
-    context = {'user': user, 'followings': followings, 'followings_count': followings_count}
+    context = {'user': user, 'followings': followings, 'followings_count': followings_count,
+               'query': query, 'next_cursor': next_cursor}
 
     return render(request, "base/followings.html", context)
 
@@ -955,14 +1133,10 @@ def collection(request, pk_u: str, pk_c: str):
         HttpResponse: Rendered collection template with context data
     """
 
-    collection = Collection.objects.get(id=pk_c)
+    collection = Collection.objects.select_related('user', 'cover').get(id=pk_c)
     User = get_user_model()
     user = get_object_or_404(User, id=pk_u)
-    collections = (
-        user.collection_set
-        .annotate(pub_count=Count("publications"))
-        .prefetch_related("publications")
-    )
+    collections = user.collection_set.select_related('cover')
     publications = CollectionPublication.objects.filter(collection=collection).select_related('publication')
 
     # Track search click if coming from search
@@ -972,6 +1146,103 @@ def collection(request, pk_u: str, pk_c: str):
     return render(request, "base/collection.html", context)
 
 
+def exportCollection(request, pk: str):
+    """
+    Download a collection as a ZIP archive of its PDFs, with a manifest.json of their metadata.
+    
+    The archive is streamed (STORED entries, files read in chunks) and is the same byte for byte
+    as long as the collection does not change, so interrupted downloads can be resumed with a
+    Range request (If-Range with the ETag is honored).
+    
+    Args:
+        request: HTTP request object
+        pk (str): Collection ID to export
+        
+    Returns:
+        StreamingHttpResponse: 200 with the whole archive, 206 with the requested range
+        HttpResponse: 416 if the range cannot be satisfied, 413 if the archive would be too large
+    """
+
+    collection = get_object_or_404(Collection.objects.select_related('user'), id=pk)
+    try:
+        archive = exports.collection_archive(collection)
+    except ValueError as e:
+        return HttpResponse(str(e), status=413)
+
+    etag = archive.etag()
+    byte_range = exports.parse_range(request.headers.get('Range'), archive.size)
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag:
+        byte_range = None  # the archive changed since the first part was downloaded
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{archive.size}'
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(archive.stream(start, end), status=206, content_type='application/zip')
+        response['Content-Range'] = f'bytes {start}-{end}/{archive.size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        response = StreamingHttpResponse(archive.stream(), content_type='application/zip')
+        response['Content-Length'] = archive.size
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Content-Disposition'] = f'attachment; filename="{slugify(collection.name) or "collection"}.zip"'
+    return response
+
+
+def exportBibliography(request, source: str, fmt: str):
+    """
+    Export the publications of a collection, a tag or a search as BibTeX, CSV or JSON Lines.
+    
+    The response is streamed: publications are read in chunks of EXPORT_CHUNK_SIZE with their
+    authors, tags and topic prefetched per chunk, and at most EXPORT_MAX_ROWS are exported.
+    
+    Args:
+        request: HTTP request object
+        source (str): 'collection', 'tag' or 'search'
+        fmt (str): 'bibtex', 'csv' or 'jsonl'
+        
+    GET Parameters:
+        - id (str): collection or tag ID (collection and tag sources)
+        - q (str): search query (search source, exports the publications tab)
+        
+    Returns:
+        StreamingHttpResponse: the export, as an attachment
+        
+    Raises:
+        Http404: unknown source or format, missing collection or tag
+    """
+
+    if fmt not in exports.BIBLIOGRAPHY_FORMATS:
+        raise Http404("Unknown export format")
+
+    if source == 'collection':
+        collection = get_object_or_404(Collection, id=request.GET.get('id'))
+        publications = Publication.objects.filter(collections=collection).order_by('collectionpublication__added')
+        name = collection.name
+    elif source == 'tag':
+        tag = get_object_or_404(Tag, id=request.GET.get('id'))
+        publications = tag.publications.order_by('-created')
+        name = tag.name
+    elif source == 'search':
+        q = request.GET.get('q', '').strip()
+        publications = getSearchResult(q, 'publications', limit=None) if q else Publication.objects.none()
+        name = f"search-{q}"
+    else:
+        raise Http404("Unknown export source")
+
+    content_type, extension = exports.BIBLIOGRAPHY_FORMATS[fmt]
+    base_url = f"{request.scheme}://{request.get_host()}"
+    response = StreamingHttpResponse(exports.bibliography_rows(publications, fmt, base_url), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{slugify(name) or "noxa"}.{extension}"'
+    return response
+
+
 @login_required
 def deleteFromCollection(request, collection_id, publication_id):
     """
@@ -1026,10 +1297,12 @@ def addTopicToFav(request, pk: str):
     if request.user.favorite_topics.filter(id=topic.id).exists():
         # remove topic from favorites
         request.user.favorite_topics.remove(topic)
+        timeline.remove_topic(request.user, topic)
         messages.success(request, f'"{topic.name}" removed from your favorites')
     else:
         # Add topic to favorites
         request.user.favorite_topics.add(topic)
+        timeline.backfill_topic(request.user, topic)
         messages.success(request, f'"{topic.name}" added to your favorites')
     
     return redirect(request.META.get('HTTP_REFERER', 'base:home'))
@@ -1050,6 +1323,7 @@ def removeTopicFromFav(request, pk: str):
     topic = get_object_or_404(Topic, id=pk)
     
     request.user.favorite_topics.remove(topic)
+    timeline.remove_topic(request.user, topic)
     messages.success(request, f'"{topic.name}" removed from your favorites')
     
     return redirect(request.META.get('HTTP_REFERER', 'base:home'))
@@ -1095,19 +1369,99 @@ def notificationsPage(request):
         request: HTTP request object
         
     Returns:
-        HttpResponse: Rendered notifications template with last 50 notifications
+        HttpResponse: Rendered notifications template with a page of 50 notifications,
+        ?after= being the cursor of the next page (see inbox.py)
     """
 
-    notifications = request.user.notifications.filter(
-        is_deleted=False
-    ).order_by('-created')[:50]  # Show last 50 notifications
+    notifications, next_cursor = inbox.page(request.user, after=request.GET.get('after'), limit=50)
     
     context = {
-        'notifications': notifications
+        'notifications': notifications,
+        'next_cursor': next_cursor,
     }
     return render(request, 'base/notifications.html', context)
 
 
+@login_required
+def notificationsApi(request):
+    """
+    JSON page of the user's notifications, newest first (keyset pagination, see inbox.py).
+    
+    Args:
+        request: HTTP request object; GET parameters:
+            - after: cursor returned as "next" by the previous page
+            - type: only this notification type
+            - state: 'read' or 'unread'
+            - limit: page size (1 to 100, 20 by default)
+            
+    Returns:
+        JsonResponse: {"results": [notification], "next": cursor or null}
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+    except ValueError:
+        limit = 20
+    notifications, next_cursor = inbox.page(
+        request.user,
+        after=request.GET.get('after'),
+        limit=limit,
+        type=request.GET.get('type'),
+        state=request.GET.get('state'),
+    )
+    return JsonResponse({'results': [inbox.serialize(n) for n in notifications], 'next': next_cursor})
+
+
+@login_required
+@require_POST
+def markNotificationsRead(request):
+    """
+    Mark notifications of the user as read in one UPDATE.
+    
+    Args:
+        request: HTTP request object; POST "ids" (repeated) to mark these notifications,
+        or "all" to mark every unread notification
+        
+    Returns:
+        JsonResponse: {"updated": number of notifications marked}
+    """
+    if request.POST.get('all'):
+        ids = None
+    else:
+        ids = [int(pk) for pk in request.POST.getlist('ids') if pk.isdigit()]
+        if not ids:
+            return JsonResponse({'error': 'No notification ids given'}, status=400)
+    return JsonResponse({'updated': inbox.mark_read(request.user, ids)})
+
+
+@login_required
+def notificationsPoll(request):
+    """
+    Unread notification count and newest unread ids, for clients polling for new notifications.
+    
+    The ETag changes with the newest notification and the unread count (see inbox.head): a
+    client sending it back in If-None-Match gets a 304 while nothing changed, at the cost of
+    one query.
+    
+    Args:
+        request: HTTP request object
+        
+    Returns:
+        JsonResponse: {"unread": count, "ids": [newest unread ids]}
+        HttpResponse: 304 when the If-None-Match ETag is still current
+    """
+
+    etag = inbox.head(request.user)
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in if_none_match or f'W/{etag}' in if_none_match:
+        response = HttpResponse(status=304)
+    else:
+        unread = inbox.unread_count(request.user)
+        response = JsonResponse({'unread': unread, 'ids': inbox.unread_ids(request.user) if unread else []})
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @login_required
 def createDiscussion(request, pk: str):
     """
@@ -1191,52 +1545,8 @@ def discussion(request, pk: str):
         reply_to_id = request.POST.get("reply_to")
         
         if body and body.strip():  # Only create message if body is not empty
-            # Check if this is a reply
-            reply_to_message = None
-            if reply_to_id:
-                try:
-                    reply_to_message = Message.objects.get(
-                        id=reply_to_id, 
-                        discussion=discussion
-                    )
-                except Message.DoesNotExist:
-                    reply_to_message = None
-            
-            message = Message.objects.create(
-                user=request.user,
-                discussion=discussion,
-                body=body.strip(),
-                reply_to=reply_to_message
-            )
-            
-            # Add user to participants if not already
-            if request.user not in participants:
-                discussion.participants.add(request.user)
-            
-            # Create notifications
-            notification_recipients = set()
-            
-            # If it's a reply, notify the original message author
-            if reply_to_message and reply_to_message.user != request.user:
-                notification_recipients.add(reply_to_message.user)
-            
-            # Notify other participants (excluding the message sender)
-            for participant in participants:
-                if participant != request.user:
-                    notification_recipients.add(participant)
-            
-            # Also notify the discussion creator if they're not a participant yet
-            if discussion.creator != request.user and discussion.creator not in participants:
-                notification_recipients.add(discussion.creator)
-            
-            # Send notifications
-            for recipient in notification_recipients:
-                utils.NotificationManager.discussion_reply(
-                    request.user, 
-                    recipient, 
-                    discussion, 
-                    message
-                )
+            # Message, participant and notifications written in one transaction (retried on lock contention)
+            services.post_message(discussion, request.user, body.strip(), reply_to_id)
             
             return redirect("base:discussion", pk=discussion.id)
 
@@ -1257,20 +1567,79 @@ def viewTag(request, pk: str):
 
     publications = tag.publications.all()
 
+    sort = request.GET.get('sort')
+    if sort == 'trending':
+        publications = publications.order_by('-trending_score', '-created')
+
     context = {
         'tag': tag,
         'publications': publications,
+        'sort': sort,
     }
     return render(request, "base/tag.html", context)
 
 
+@staff_member_required
+def metrics(request):
+    """
+    Monitoring counters of the worker serving the request (staff only).
+    
+    Args:
+        request: HTTP request object
+        
+    Returns:
+        JsonResponse: {"ratelimit": {route: {"rate", "allowed", "rejected"}},
+                       "counters": {"pending_publications", "pending_events", "flushed_events"},
+                       "search_cache": {"entries", "bytes", "hits", "misses", "hit_rate", ...},
+                       "federated_search": {"searches", "partial", "timeouts": {category: count}},
+                       "semantic_index": {"model", "vectors", "rows", "lists", "queries", "refreshes"},
+                       "search_log": {"pending", "written", "dropped"}}
+    """
 
+    return JsonResponse({'ratelimit': get_limiter().stats(), 'counters': counters.buffer.stats(),
+                         'search_cache': searchcache.get_cache().stats(),
+                         'federated_search': get_executor().stats(),
+                         'semantic_index': semantic.get_index().stats(),
+                         'search_log': searchlog.buffer.stats()})
 
 
+@staff_member_required
+def searchReport(request):
+    """
+    Slowest and zero-hit search queries of the last days, from the rollups of the search log
+    (see searchlog.py and the rollup_search_log command), to know where indexes and synonyms
+    are missing (staff only).
+    
+    Args:
+        request: HTTP request object; ?days= (1 to 90, 7 by default)
+        
+    Returns:
+        HttpResponse: Renders 'base/search_report.html' with 'slowest', 'zero_hits' and 'daily'
+    """
+    try:
+        days = min(max(int(request.GET.get('days', 7)), 1), 90)
+    except ValueError:
+        days = 7
+    since = timezone.now() - timedelta(days=days)
+
+    queries = SearchRollup.objects.filter(period='hour', start__gte=since).values('tab', 'query').annotate(
+        count=Sum('searches'),
+        zero=Sum('zero_hits'),
+        slows=Sum('slow'),
+        average=Sum('total_latency') / Sum('searches'),
+        longest=Max('max_latency'),
+    ).order_by()
+    daily = SearchRollup.objects.filter(period='day', start__gte=since).values('start').annotate(
+        count=Sum('searches'),
+        zero=Sum('zero_hits'),
+        slows=Sum('slow'),
+        average=Sum('total_latency') / Sum('searches'),
+    ).order_by('-start')
 
-
-
-
-
-
-
+    context = {
+        'days': days,
+        'slowest': queries.order_by('-average')[:50],
+        'zero_hits': queries.filter(zero__gt=0).order_by('-zero', '-count')[:50],
+        'daily': daily,
+    }
+    return render(request, 'base/search_report.html', context)
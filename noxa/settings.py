@@ -46,11 +46,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'base.routers.ReplicaStickinessMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'base.middleware.RateLimitMiddleware',
 ]
 
 ROOT_URLCONF = 'noxa.urls'
@@ -85,8 +87,41 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': 20,  # seconds the python driver waits for a lock
+            # Take the write lock when the transaction starts: a deferred transaction that
+            # reads then writes can't be saved by busy_timeout and fails with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'CONN_MAX_AGE': 600,  # persistent connections, the PRAGMAs are paid once per connection
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Read replicas (see base/routers.py): reads go to the replicas, writes to 'default'.
+# For local testing, NOXA_REPLICA_DB points to a SQLite copy kept in sync by `manage.py sync_replica`.
+if os.environ.get('NOXA_REPLICA_DB'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['NOXA_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
     }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['base.routers.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = 5  # reads of a session stay on the primary this long after it wrote
+
+# Applied to every new SQLite connection (see base/db.py)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # readers don't block behind writers anymore
+    'synchronous': 'NORMAL',  # safe with WAL, fsync at checkpoints only
+    'busy_timeout': 5000,  # ms a writer waits for the lock before failing
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # negative: KiB, i.e. 64 MB of page cache
+    'temp_store': 'MEMORY',
 }
+# Write paths decorated with base.db.retry_on_lock retry this many times with jittered backoff
+SQLITE_LOCK_RETRIES = 4
+SQLITE_LOCK_RETRY_DELAY = 0.05  # seconds, doubled at each retry
 
 
 # Password validation
@@ -141,7 +176,83 @@ LOGOUT_REDIRECT_URL = '/login/'  # Redirect to login after logout
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# File uploads
+# PDFs are validated while streaming in (see base/uploadhandlers.py), other files are stored as usual
+FILE_UPLOAD_HANDLERS = [
+    'base.uploadhandlers.PdfUploadHandler',
+]
+PDF_UPLOAD_MAX_SIZE = 50 * 1024 * 1024  # bytes
+PDF_UPLOAD_MAX_PAGES = 2000
+PDF_UPLOAD_PARSE_TIMEOUT = 5.0  # seconds allowed to walk the page tree
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Rate limiting (see base/ratelimit.py)
+# Token buckets per route name and per client (user or IP): "30/m" allows bursts of 30 requests,
+# refilled at 30 per minute. 'memory' keeps the buckets per worker, 'sqlite' shares them between
+# the workers of a host through RATELIMIT_SQLITE_PATH.
+RATELIMIT_ENABLED = True
+RATELIMIT_BACKEND = 'memory'
+RATELIMIT_SQLITE_PATH = BASE_DIR / 'ratelimit.sqlite3'
+RATELIMIT_TRUST_X_FORWARDED_FOR = False  # only behind a trusted reverse proxy
+RATELIMITS = {
+    'base:search': '30/m',
+    'base:search_tab': '30/m',
+    'base:filter-topics': '120/m',
+    'base:filter-authors': '120/m',
+    'base:filter-tags': '120/m',
+    'base:pdf': '20/m',
+    'base:export-collection': '10/m',
+    'base:export-bibliography': '10/m',
+}
+
+# Personalized home timelines (see base/timeline.py): entries kept per user
+TIMELINE_MAX_LENGTH = 500
+
+# Publication view/download counters, buffered per worker (base/counters.py)
+COUNTER_FLUSH_INTERVAL = 10  # seconds
+COUNTER_FLUSH_SIZE = 500  # distinct publications
+TRENDING_HALF_LIFE = 7 * 24 * 3600  # seconds
+
+# Bibliography exports (base/exports.py): rows fetched per query, and per export at most
+EXPORT_CHUNK_SIZE = 500
+EXPORT_MAX_ROWS = 50000
+
+# Search result cache (base/searchcache.py): id lists kept per worker
+SEARCH_CACHE_MAX_ENTRIES = 2000
+
+# "all" search tab (base/federated.py): categories searched concurrently, results given after at most
+# SEARCH_DEADLINE seconds (partial when a category is slower)
+SEARCH_FEDERATION_WORKERS = 12
+SEARCH_DEADLINE = 2.0
+
+# Typo tolerant search (base/fuzzy.py): minimum trigram similarity of two words, and close
+# words considered per query word
+SEARCH_FUZZY_THRESHOLD = 0.4
+SEARCH_FUZZY_MAX_WORDS = 20
+
+# Facets of the publications search (base/facets.py): computed on the first results of a query
+SEARCH_FACET_MAX_RESULTS = 10000
+
+# Length of the highlighted snippets of search results (base/snippets.py), in characters
+SEARCH_SNIPPET_LENGTH = 200
+
+# Semantic search (base/semantic.py): LSA dimensions and vocabulary, inverted lists scanned per query
+SEMANTIC_DIMENSIONS = 128
+SEMANTIC_MAX_TERMS = 50000
+SEMANTIC_PROBES = 8
+SEMANTIC_SEARCH_K = 2000
+SEMANTIC_REFRESH_INTERVAL = 60
+
+# Search log (base/searchlog.py): batched writes, slow threshold and retention of the raw rows
+SEARCH_LOG_FLUSH_INTERVAL = 10
+SEARCH_LOG_FLUSH_SIZE = 500
+SEARCH_SLOW_MS = 1000
+SEARCH_LOG_RETENTION_DAYS = 14
+
+# Notifications purged by the compact_notifications command (days after their creation)
+NOTIFICATION_RETENTION_DAYS = 90  # read ones
+NOTIFICATION_DELETED_RETENTION_DAYS = 7  # soft-deleted ones